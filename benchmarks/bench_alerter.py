@@ -0,0 +1,136 @@
+"""Compare alert evaluation strategies at 1k, 10k and 50k alerts
+
+Run from the repository root: python -m benchmarks.bench_alerter
+"""
+import random
+import time
+from collections import OrderedDict
+from decimal import Decimal
+from statistics import fmean
+from typing import Callable
+
+import modules.exchange  # noqa: F401 Imported first like in main.py
+from constants import MAX_CANDLE_LEN
+from modules.store.alerter import Alerter
+from modules.store.main import Store
+from modules.store.volume_series import VolumeSeries
+from typings.alert import IAlert
+from typings.enums import Exchange, Timeframe
+from utils.candlestick import interval_in_ms
+from utils.fixed_point import to_fixed
+
+ALERT_COUNTS = [1_000, 10_000, 50_000]
+ALERTS_PER_SERIES = 50
+TIMEFRAME = Timeframe.Min1
+ROUNDS = 5
+
+
+def build_store(alert_count: int, rng: random.Random) -> tuple[Store, dict]:
+    """A store of full series plus the same volumes as the legacy OrderedDicts"""
+    store = Store()
+    legacy_data: dict = {}
+    interval = interval_in_ms(TIMEFRAME)
+    candle_count = MAX_CANDLE_LEN[TIMEFRAME] + 1
+
+    for s in range(alert_count // ALERTS_PER_SERIES):
+        symbol = f"sym{s}usdt"
+        volumes = VolumeSeries(TIMEFRAME)
+        legacy_volumes: OrderedDict = OrderedDict()
+        for i in range(candle_count):
+            volume = f"{rng.uniform(100, 1000):.8f}"
+            volumes.update(i * interval, to_fixed(volume, volumes.digits))
+            legacy_volumes[i * interval] = Decimal(volume)
+        store.data.setdefault(Exchange.Binance, {})[symbol] = {TIMEFRAME: volumes}
+        legacy_data.setdefault(Exchange.Binance, {})[symbol] = {
+            TIMEFRAME: legacy_volumes
+        }
+
+        for _ in range(ALERTS_PER_SERIES):
+            candle_len = rng.randint(1, MAX_CANDLE_LEN[TIMEFRAME])
+            delta = rng.randint(1, 100)
+            key = f"binance_{symbol}_{TIMEFRAME.value}_{candle_len}_{delta}"
+            alert: IAlert = {
+                "key": key,
+                "exchange": Exchange.Binance,
+                "symbol": symbol,
+                "timeframe": TIMEFRAME,
+                "candle_len": candle_len,
+                "delta": delta,
+            }
+            store.alerts[key] = alert
+            series_key = (Exchange.Binance, symbol, TIMEFRAME)
+            store.series_alerts.setdefault(series_key, {})[key] = alert
+    return store, legacy_data
+
+
+def legacy_on_tick(store: Store, legacy_data: dict, last_alerts: dict) -> None:
+    """Alerter.on_tick before volumes moved to VolumeSeries"""
+    for a in store.alerts.values():
+        candle_len = a["candle_len"]
+        delta_percent = Decimal(a["delta"]) / Decimal(100)
+
+        volumes: OrderedDict = legacy_data[a["exchange"]][a["symbol"]][a["timeframe"]]
+        volume_values = list(volumes.values())
+        if not len(volume_values):
+            return
+        current_volume = volume_values[-1]
+        avg_volume = Decimal(fmean(volume_values[-candle_len - 1 : -1]))
+        alert_volume = avg_volume + (avg_volume * delta_percent)
+
+        if current_volume >= alert_volume:
+            key = a["key"]
+            current_time = list(volumes)[-1]
+            if current_time > last_alerts.get(key, 0):
+                last_alerts[key] = current_time
+
+
+def scalar_on_tick(alerter: Alerter) -> None:
+    """Alerter.on_tick evaluating every alert on its own"""
+    data = alerter.store.data
+    for a in alerter.store.alerts.values():
+        alerter.evaluate(a, data[a["exchange"]][a["symbol"]][a["timeframe"]])
+
+
+def batch_on_tick(alerter: Alerter) -> None:
+    """Alerter.on_tick evaluating every series in one batch"""
+    data = alerter.store.data
+    for series_key in alerter.store.series_alerts:
+        exchange, symbol, timeframe = series_key
+        volumes = data[exchange][symbol][timeframe]
+        for a, window_sum, count, threshold in alerter.batch_evaluator.evaluate(
+            series_key, volumes
+        ):
+            alerter.trigger(a, volumes, window_sum, count, threshold)
+
+
+def best_of(func: Callable[[], None]) -> float:
+    timings = []
+    for _ in range(ROUNDS):
+        start = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def main() -> None:
+    rng = random.Random(42)
+    print(f"{'Alerts':>8} {'Legacy (ms)':>12} {'Scalar (ms)':>12} {'Batch (ms)':>12}")
+    for alert_count in ALERT_COUNTS:
+        store, legacy_data = build_store(alert_count, rng)
+        alerter = Alerter(store)
+        # Mark every alert as already sent so no Telegram message is queued
+        for key in store.alerts:
+            alerter.last_alerts[key] = 2**62
+        legacy_last_alerts = dict(alerter.last_alerts)
+
+        legacy = best_of(lambda: legacy_on_tick(store, legacy_data, legacy_last_alerts))
+        scalar = best_of(lambda: scalar_on_tick(alerter))
+        batch = best_of(lambda: batch_on_tick(alerter))
+        print(
+            f"{alert_count:>8} {legacy * 1e3:>12.2f} {scalar * 1e3:>12.2f} "
+            f"{batch * 1e3:>12.2f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
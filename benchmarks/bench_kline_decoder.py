@@ -0,0 +1,126 @@
+"""Compare kline frame decoding against the full json.loads python-binance does
+
+Run from the repository root: python -m benchmarks.bench_kline_decoder [FILE]
+FILE holds raw combined-stream frames recorded from Binance, one per line.
+Without it the frames are generated in the same wire format
+"""
+import json
+import random
+import sys
+import time
+from typing import Callable, Optional
+
+from modules.exchange.kline_decoder import (
+    KlineDecoder,
+    KlineFrame,
+    orjson,
+    to_kline_frame,
+)
+
+FRAME_COUNT = 100_000
+SYMBOL_COUNT = 400
+INTERVALS = ["1m", "5m", "15m", "1h", "4h", "1d"]
+ROUNDS = 5
+
+
+def gen_frame(rng: random.Random, event_time: int) -> str:
+    symbol = f"SYM{rng.randrange(SYMBOL_COUNT)}USDT"
+    interval = rng.choice(INTERVALS)
+    open_time = event_time - event_time % 60_000
+    price = rng.uniform(0.001, 50_000)
+    volume = rng.uniform(0, 1_000_000)
+    first_trade = rng.randrange(1_000_000_000)
+    message = {
+        "stream": f"{symbol.lower()}@kline_{interval}",
+        "data": {
+            "e": "kline",
+            "E": event_time,
+            "s": symbol,
+            "k": {
+                "t": open_time,
+                "T": open_time + 59_999,
+                "s": symbol,
+                "i": interval,
+                "f": first_trade,
+                "L": first_trade + rng.randrange(10_000),
+                "o": f"{price:.8f}",
+                "c": f"{price * 1.001:.8f}",
+                "h": f"{price * 1.002:.8f}",
+                "l": f"{price * 0.999:.8f}",
+                "v": f"{volume / price:.8f}",
+                "n": rng.randrange(10_000),
+                "x": rng.random() < 0.02,
+                "q": f"{volume:.8f}",
+                "V": f"{volume / price / 2:.8f}",
+                "Q": f"{volume / 2:.8f}",
+                "B": "0",
+            },
+        },
+    }
+    # Binance sends compact JSON
+    return json.dumps(message, separators=(",", ":"))
+
+
+def load_frames(path: Optional[str]) -> list[str]:
+    if path is not None:
+        with open(path) as file:
+            return [line.strip() for line in file if line.strip()]
+    rng = random.Random(18)
+    start = 1_672_531_200_000
+    return [gen_frame(rng, start + i * 5) for i in range(FRAME_COUNT)]
+
+
+def json_dict(frame: str) -> Optional[dict]:
+    """What python-binance queues for every frame"""
+    return json.loads(frame)
+
+
+def json_extract(frame: str) -> Optional[KlineFrame]:
+    """What the decoder falls back to without orjson"""
+    return to_kline_frame(json.loads(frame))
+
+
+def measure(decode: Callable[[str], object], frames: list[str]) -> float:
+    best = float("inf")
+    for _ in range(ROUNDS):
+        start = time.perf_counter()
+        for frame in frames:
+            decode(frame)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main() -> None:
+    path = sys.argv[1] if len(sys.argv) > 1 else None
+    frames = load_frames(path)
+    print(f"{len(frames)} frames from {path or 'the generator'}")
+
+    expected = [json_extract(frame) for frame in frames]
+    decoders: list[tuple[str, Callable[[str], object]]] = [
+        ("json dict", json_dict),
+        ("json", json_extract),
+    ]
+    if orjson is not None:
+        decoders.append(("orjson", KlineDecoder("orjson").decode))
+    else:
+        print("orjson is not installed, skipping it")
+    scan = KlineDecoder("scan")
+    decoders.append(("scan", scan.decode))
+
+    for name, decode in decoders[1:]:
+        assert [decode(frame) for frame in frames] == expected, name
+
+    baseline = None
+    for name, decode in decoders:
+        elapsed = measure(decode, frames)
+        baseline = baseline or elapsed
+        print(
+            f"{name:>10}: {elapsed * 1e9 / len(frames):>7.0f} ns/frame, "
+            f"{len(frames) / elapsed:>10.0f} frames/s, "
+            f"{baseline / elapsed:>5.2f}x"
+        )
+    print(f"scan read {scan.scanned}, fell back on {scan.decoded}")
+
+
+if __name__ == "__main__":
+    main()
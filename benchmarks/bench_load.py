@@ -0,0 +1,324 @@
+"""Measure how the store, the alerter and the garbage cleaner scale with load
+
+Run from the repository root: python -m benchmarks.bench_load
+Every run is saved under benchmarks/results, pass --compare with an earlier
+result file to print the change against it
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import resource
+import subprocess
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime, timezone
+from typing import Any, Callable, Coroutine, Optional
+
+import modules.exchange  # noqa: F401 Imported first like in main.py
+from benchmarks.synthetic import build_store, gen_ticks
+from modules.store.alerter import Alerter, alerts_fired
+from modules.store.garbage_cleaner import GarbageCleaner
+from modules.store.kline_cache import KlineCache
+from modules.store.main import Store
+from modules.store.store_updater import StoreUpdater
+from modules.telegram.telegram_bot import telegram_bot
+from typings.enums import Timeframe
+from utils.alert import get_timeframe_from_alert_key
+from utils.candlestick import get_latest_incomplete_candlestick_start_time
+from utils.event_emitter import CandlestickRecord, CandlestickTopic, market_data
+
+# (series, alerts)
+SCENARIOS = {
+    "small": (100, 1_000),
+    "medium": (1_000, 10_000),
+    "large": (10_000, 50_000),
+    "xlarge": (50_000, 100_000),
+}
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "results")
+
+
+def run_now(coroutine: Coroutine) -> None:
+    """Run a coroutine that never suspends without going through the loop"""
+    try:
+        coroutine.send(None)
+    except StopIteration:
+        return
+    coroutine.close()
+    raise RuntimeError("The coroutine suspended")
+
+
+def percentile(timings: list[float], percent: float) -> float:
+    ordered = sorted(timings)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * percent / 100))]
+
+
+class Component:
+    """Per-tick timings of one component, and its allocation peak in a traced
+    tick
+    """
+
+    name: str
+    timings: list[float]
+    items: int
+    peak: int
+
+    def __init__(self, name: str) -> None:
+        self.name = name
+        self.timings = []
+        self.items = 0
+        self.peak = 0
+        self.tracing = False
+        self.elapsed = 0.0
+
+    def measure(self, func: Callable[[], Any]) -> Any:
+        """Call func, adding its run time to the current tick"""
+        if self.tracing:
+            tracemalloc.reset_peak()
+            before = tracemalloc.get_traced_memory()[0]
+            result = func()
+            self.peak = max(self.peak, tracemalloc.get_traced_memory()[1] - before)
+            return result
+        start = time.perf_counter()
+        result = func()
+        self.elapsed += time.perf_counter() - start
+        return result
+
+    def consumer(
+        self, consume: Callable[[list[CandlestickRecord]], None]
+    ) -> Callable[[list[CandlestickRecord]], None]:
+        def timed(records: list[CandlestickRecord]) -> None:
+            # Drains left scheduled on the loop run with no records
+            if len(records):
+                self.measure(lambda: consume(records))
+
+        return timed
+
+    def end_tick(self, items: int) -> None:
+        if not self.tracing:
+            self.timings.append(self.elapsed)
+            self.items += items
+        self.elapsed = 0.0
+
+    def report(self) -> dict:
+        total = sum(self.timings)
+        return {
+            "ticks": len(self.timings),
+            "throughput": round(self.items / total) if total else 0,
+            "p50_ms": round(percentile(self.timings, 50) * 1e3, 3),
+            "p95_ms": round(percentile(self.timings, 95) * 1e3, 3),
+            "p99_ms": round(percentile(self.timings, 99) * 1e3, 3),
+            "max_ms": round(max(self.timings) * 1e3, 3),
+            "peak_kib": round(self.peak / 1024, 1),
+        }
+
+
+class LoadBenchmark:
+    """One scenario, with the components wired to the market data bus as in
+    main.py
+    """
+
+    def __init__(self, series_count: int, alert_count: int, seed: int) -> None:
+        self.series_count = series_count
+        self.alert_count = alert_count
+        self.seed = seed
+        self.directory = tempfile.TemporaryDirectory()
+        self.store = Store()
+        self.store_updater = StoreUpdater(
+            self.store, KlineCache(f"{self.directory.name}/klines.sqlite3")
+        )
+        self.alerter = Alerter(self.store)
+        self.garbage_cleaner = GarbageCleaner(self.store, self.alerter)
+
+        self.components = {
+            name: Component(name)
+            for name in ["store", "alerter", "alerter_sweep", "cleaner"]
+        }
+        self.topic = CandlestickTopic()
+        market_data.candlesticks = self.topic
+        self.topic.subscribe(
+            self.components["store"].consumer(self.store_updater.on_candlesticks)
+        )
+        self.topic.subscribe(
+            self.components["alerter"].consumer(self.alerter.on_candlesticks)
+        )
+
+        start = time.perf_counter()
+        self.streamed = build_store(
+            self.store_updater, series_count, alert_count, seed
+        )
+        self.build_seconds = time.perf_counter() - start
+        self.fired = 0
+
+    def store_mib(self) -> float:
+        size = 0
+        for symbols in self.store.data.values():
+            for timeframes in symbols.values():
+                for volumes in timeframes.values():
+                    size += 3 * volumes.open_times.itemsize * volumes.capacity
+        return size / 2**20
+
+    def publish(self, updates: list) -> None:
+        for update in updates:
+            if self.topic.size == self.topic.capacity:
+                self.topic.drain()
+            self.topic.publish(*update)
+
+    def drain(self) -> None:
+        # Roll-ups published while draining go out with the next batch
+        while self.topic.size:
+            self.topic.drain()
+
+    def run_ticks(
+        self, ticks: int, first_tick: int = 0, tracing: bool = False
+    ) -> None:
+        for component in self.components.values():
+            component.tracing = tracing
+        store = self.components["store"]
+        for updates in gen_ticks(self.streamed, ticks, self.seed, first_tick):
+            fired = alerts_fired.value
+            store.measure(lambda: self.publish(updates))
+            self.drain()
+            store.end_tick(len(updates))
+            self.components["alerter"].end_tick(self.alert_count)
+            self.fired += int(alerts_fired.value - fired)
+            # Alerts go nowhere, Telegram is not started
+            telegram_bot.sender.backlog.clear()
+
+        sweep = self.components["alerter_sweep"]
+        for _ in range(ticks):
+            sweep.measure(lambda: run_now(self.alerter.on_tick()))
+            sweep.end_tick(self.alert_count)
+            telegram_bot.sender.backlog.clear()
+
+        cleaner = self.components["cleaner"]
+        for tick in range(ticks):
+            self.fill_last_alerts(tick)
+            cleaner.measure(self.garbage_cleaner.clean_alerter)
+            cleaner.end_tick(self.alert_count)
+
+    def fill_last_alerts(self, tick: int) -> None:
+        """Every alert sent, every other one in a candle that closed since"""
+        open_times = {
+            timeframe: get_latest_incomplete_candlestick_start_time(timeframe)
+            for timeframe in Timeframe
+        }
+        self.alerter.last_alerts = {
+            key: 0
+            if (i + tick) % 2
+            else open_times[get_timeframe_from_alert_key(key)]
+            for i, key in enumerate(self.store.alerts)
+        }
+
+    def run(self, ticks: int) -> dict:
+        self.run_ticks(ticks)
+        tracemalloc.start()
+        try:
+            # One more tick to find the allocation peak of each component
+            self.run_ticks(1, first_tick=ticks, tracing=True)
+        finally:
+            tracemalloc.stop()
+        self.directory.cleanup()
+        return {
+            "series": self.series_count,
+            "alerts": self.alert_count,
+            "streamed": len(self.streamed),
+            "build_seconds": round(self.build_seconds, 3),
+            "store_mib": round(self.store_mib(), 1),
+            "alerts_fired": self.fired,
+            "components": {
+                name: component.report() for name, component in self.components.items()
+            },
+        }
+
+
+def git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def print_scenario(name: str, result: dict, previous: Optional[dict]) -> None:
+    print(
+        f"{name}: {result['series']} series ({result['streamed']} streamed), "
+        f"{result['alerts']} alerts, {result['store_mib']} MiB of volumes, "
+        f"{result['alerts_fired']} alerts fired"
+    )
+    print(
+        f"  {'Component':<14} {'items/s':>12} {'p50 ms':>9} {'p95 ms':>9} "
+        f"{'p99 ms':>9} {'max ms':>9} {'peak KiB':>10}"
+    )
+    for component, stats in result["components"].items():
+        line = (
+            f"  {component:<14} {stats['throughput']:>12} {stats['p50_ms']:>9} "
+            f"{stats['p95_ms']:>9} {stats['p99_ms']:>9} {stats['max_ms']:>9} "
+            f"{stats['peak_kib']:>10}"
+        )
+        before = (previous or {}).get("components", {}).get(component)
+        if before is not None and before["p50_ms"]:
+            line += f"  p50 x{stats['p50_ms'] / before['p50_ms']:.2f}"
+        print(line)
+
+
+async def run(args: argparse.Namespace) -> dict:
+    previous: dict = {}
+    if args.compare is not None:
+        with open(args.compare) as file:
+            previous = json.load(file)["scenarios"]
+
+    results: dict[str, Any] = {
+        "date": f"{datetime.now(tz=timezone.utc):%Y-%m-%d %H:%M:%S}",
+        "commit": git_commit(),
+        "python": platform.python_version(),
+        "ticks": args.ticks,
+        "seed": args.seed,
+        "scenarios": {},
+    }
+    for name in args.scenario:
+        series_count, alert_count = SCENARIOS[name]
+        benchmark = LoadBenchmark(series_count, alert_count, args.seed)
+        result = benchmark.run(args.ticks)
+        results["scenarios"][name] = result
+        print_scenario(name, result, previous.get(name))
+    # Kilobytes on Linux
+    results["max_rss_mib"] = round(
+        resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1
+    )
+    print(f"Max RSS: {results['max_rss_mib']} MiB")
+    return results
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        "--scenario",
+        nargs="+",
+        choices=list(SCENARIOS),
+        default=list(SCENARIOS),
+    )
+    parser.add_argument("--ticks", type=int, default=30)
+    parser.add_argument("--seed", type=int, default=21)
+    parser.add_argument("--compare", help="earlier result file to compare with")
+    parser.add_argument("--no-save", action="store_true")
+    args = parser.parse_args()
+
+    results = asyncio.run(run(args))
+    if not args.no_save:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        date = datetime.now(tz=timezone.utc)
+        path = os.path.join(RESULTS_DIR, f"load_{date:%Y%m%d_%H%M%S}.json")
+        with open(path, "w") as file:
+            json.dump(results, file, indent=2)
+        print(f"Saved to {path}")
+
+
+if __name__ == "__main__":
+    main()
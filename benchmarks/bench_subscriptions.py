@@ -0,0 +1,146 @@
+"""Compare subscribe and unsubscribe throughput before and after the DAL
+
+Run from the repository root: python -m benchmarks.bench_subscriptions
+"""
+import tempfile
+import time
+from concurrent.futures import Future, wait
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from sqlalchemy.pool import QueuePool
+from sqlmodel import Session, SQLModel, create_engine, select
+
+import modules.exchange  # noqa: F401 Imported first like in main.py
+from models.dal import SubscriptionWriter
+from models.main import SQLITE_PRAGMAS, Alert, User, set_sqlite_pragmas
+from typings.alert import IAlert
+from typings.enums import UserRole
+
+USER_COUNT = 100
+ALERT_COUNT = 200
+SUBSCRIPTIONS_PER_USER = 10
+
+
+def create_legacy_engine(path: str) -> Engine:
+    """The engine as models.main created it before, one connection per session"""
+    return create_engine(f"sqlite:///{path}", echo=False)
+
+
+def create_tuned_engine(path: str) -> Engine:
+    engine = create_engine(
+        f"sqlite:///{path}",
+        echo=False,
+        poolclass=QueuePool,
+        pool_size=4,
+        connect_args={"check_same_thread": False},
+    )
+    event.listen(engine, "connect", set_sqlite_pragmas)
+    return engine
+
+
+def setup(engine: Engine) -> list[int]:
+    SQLModel.metadata.create_all(engine)
+    with Session(engine) as session:
+        users = [
+            User(username=f"user{i}", role=UserRole.User) for i in range(USER_COUNT)
+        ]
+        session.add_all(users)
+        session.commit()
+        return [user.id for user in users]
+
+
+def gen_subscriptions(user_ids: list[int]) -> list[tuple[int, str]]:
+    subscriptions = []
+    for i, user_id in enumerate(user_ids):
+        for j in range(SUBSCRIPTIONS_PER_USER):
+            alert_index = (i * SUBSCRIPTIONS_PER_USER + j) % ALERT_COUNT
+            subscriptions.append((user_id, f"binance_sym{alert_index}usdt_1m_50_100"))
+    return subscriptions
+
+
+def gen_alert(key: str) -> IAlert:
+    _, symbol, timeframe, candle_len, delta = key.split("_")
+    return {
+        "key": key,
+        "exchange": "binance",
+        "symbol": symbol,
+        "timeframe": timeframe,
+        "candle_len": int(candle_len),
+        "delta": int(delta),
+    }
+
+
+def legacy_subscribe(engine: Engine, user_id: int, key: str) -> None:
+    """TelegramListener.subscribe_command before the DAL, one commit per command"""
+    with Session(engine) as session:
+        user = session.exec(select(User).where(User.id == user_id)).first()
+        alert = session.exec(select(Alert).where(Alert.key == key)).first()
+        if alert is None:
+            alert = Alert(**gen_alert(key))
+        assert user is not None
+        alert.users.append(user)
+        session.add(alert)
+        session.commit()
+
+
+def legacy_unsubscribe(engine: Engine, user_id: int, key: str) -> None:
+    with Session(engine) as session:
+        user = session.exec(select(User).where(User.id == user_id)).first()
+        alert = session.exec(select(Alert).where(Alert.key == key)).first()
+        assert user is not None and alert is not None
+        alert.users.remove(user)
+        if len(alert.users) == 0:
+            session.delete(alert)
+        else:
+            session.add(alert)
+        session.commit()
+
+
+def run_legacy(engine: Engine, subscriptions: list[tuple[int, str]]) -> tuple:
+    start = time.perf_counter()
+    for user_id, key in subscriptions:
+        legacy_subscribe(engine, user_id, key)
+    subscribed = time.perf_counter()
+    for user_id, key in subscriptions:
+        legacy_unsubscribe(engine, user_id, key)
+    return subscribed - start, time.perf_counter() - subscribed
+
+
+def run_batched(engine: Engine, subscriptions: list[tuple[int, str]]) -> tuple:
+    writer = SubscriptionWriter(engine)
+    start = time.perf_counter()
+    futures: list[Future] = [
+        writer.subscribe(user_id, gen_alert(key)) for user_id, key in subscriptions
+    ]
+    wait(futures)
+    subscribed = time.perf_counter()
+    futures = [writer.unsubscribe(user_id, key) for user_id, key in subscriptions]
+    wait(futures)
+    for future in futures:
+        future.result()
+    print(f"  {writer.writes} writes in {writer.batches} transactions")
+    return subscribed - start, time.perf_counter() - subscribed
+
+
+def main() -> None:
+    print(f"Pragmas: {SQLITE_PRAGMAS}")
+    with tempfile.TemporaryDirectory() as directory:
+        for name, create, run in [
+            ("Legacy", create_legacy_engine, run_legacy),
+            ("Tuned", create_tuned_engine, run_legacy),
+            ("Batched", create_tuned_engine, run_batched),
+        ]:
+            engine = create(f"{directory}/{name}.sqlite3")
+            subscriptions = gen_subscriptions(setup(engine))
+            subscribe, unsubscribe = run(engine, subscriptions)
+            count = len(subscriptions)
+            print(
+                f"{name:>8}: subscribe {count / subscribe:>8.0f} ops/s, "
+                f"unsubscribe {count / unsubscribe:>8.0f} ops/s"
+            )
+            engine.dispose()
+
+
+if __name__ == "__main__":
+    main()
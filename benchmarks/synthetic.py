@@ -0,0 +1,141 @@
+"""Deterministic synthetic series, alerts and kline updates for the benchmarks"""
+import random
+from typing import Iterator
+
+from constants import MAX_CANDLE_LEN
+from modules.store.candle_rollup import split_timeframes
+from modules.store.store_updater import StoreUpdater
+from modules.store.volume_series import VolumeSeries
+from typings.alert import IAlert, SeriesKey
+from typings.enums import Exchange, Timeframe
+from utils.candlestick import get_candlestick_start_time, interval_in_ms
+
+# 2023-01-02 00:00 UTC, a Monday so that weekly candles start on it
+START_TIME = 1_672_617_600_000
+TIMEFRAMES = list(Timeframe)
+# Each symbol watches this many timeframes, spread over every Timeframe value
+TIMEFRAMES_PER_SYMBOL = 3
+# Kline updates a candle gets before the next one opens
+UPDATES_PER_CANDLE = 10
+
+# (exchange, symbol, timeframe, open_time, volume, event_time)
+KlineUpdate = tuple[str, str, str, int, int, int]
+
+
+def gen_series_keys(series_count: int) -> list[SeriesKey]:
+    keys = []
+    for i in range(series_count):
+        symbol = f"sym{i // TIMEFRAMES_PER_SYMBOL}usdt"
+        # Offsets 0, 5 and 10 give every symbol three different timeframes
+        position = i // TIMEFRAMES_PER_SYMBOL + (i % TIMEFRAMES_PER_SYMBOL) * 5
+        timeframe = TIMEFRAMES[position % len(TIMEFRAMES)]
+        keys.append((Exchange.Binance.value, symbol, timeframe.value))
+    return keys
+
+
+def gen_volume(rng: random.Random) -> int:
+    # Fixed-point with the default 4 digits, mostly quiet with rare spikes
+    volume = rng.randint(1_000_000, 10_000_000)
+    if rng.random() < 0.01:
+        volume *= 3
+    return volume
+
+
+def gen_series(timeframe: Timeframe, rng: random.Random) -> VolumeSeries:
+    """A full, ready series whose open candle is the one at START_TIME"""
+    volumes = VolumeSeries(timeframe)
+    interval = interval_in_ms(timeframe)
+    latest = get_candlestick_start_time(START_TIME, timeframe)
+    for i in range(volumes.capacity - 1, -1, -1):
+        volumes.update(latest - i * interval, gen_volume(rng))
+    volumes.ready = True
+    return volumes
+
+
+def gen_alerts(
+    series_keys: list[SeriesKey], alert_count: int, seed: int
+) -> list[IAlert]:
+    rng = random.Random(seed)
+    alerts: dict[str, IAlert] = {}
+    i = 0
+    while len(alerts) < alert_count:
+        exchange, symbol, timeframe = series_keys[i % len(series_keys)]
+        i += 1
+        candle_len = rng.randint(1, MAX_CANDLE_LEN[timeframe])
+        delta = rng.randint(1, 100)
+        key = f"{exchange}_{symbol}_{timeframe}_{candle_len}_{delta}"
+        alerts[key] = {
+            "key": key,
+            "exchange": exchange,
+            "symbol": symbol,
+            "timeframe": timeframe,
+            "candle_len": candle_len,
+            "delta": delta,
+        }
+    return list(alerts.values())
+
+
+def build_store(
+    store_updater: StoreUpdater, series_count: int, alert_count: int, seed: int
+) -> list[SeriesKey]:
+    """Fill the store like StoreUpdater.load does, return the streamed series"""
+    rng = random.Random(seed)
+    store = store_updater.store
+    series_keys = gen_series_keys(series_count)
+    for exchange, symbol, timeframe in series_keys:
+        symbols = store.data.setdefault(exchange, {})
+        volumes = gen_series(Timeframe(timeframe), rng)
+        symbols.setdefault(symbol, {})[timeframe] = volumes
+        store.series_count += 1
+        store.ready_series += 1
+        store.candles += len(volumes)
+    for a in gen_alerts(series_keys, alert_count, seed):
+        store.alerts[a["key"]] = a
+        series_key = (a["exchange"], a["symbol"], a["timeframe"])
+        store.series_alerts.setdefault(series_key, {})[a["key"]] = a
+
+    # Coarser timeframes are rolled up from the finest one of their symbol,
+    # as StoreUpdater.update_streams sets it up
+    streamed: list[SeriesKey] = []
+    for exchange, symbols in store.data.items():
+        for symbol, timeframes in symbols.items():
+            base, derived = split_timeframes(timeframes)
+            if len(derived):
+                store_updater.rollups[(exchange, symbol)] = (base, derived)
+            streamed.extend(
+                (exchange, symbol, timeframe)
+                for timeframe in timeframes
+                if timeframe not in derived
+            )
+    return streamed
+
+
+def gen_ticks(
+    streamed: list[SeriesKey], ticks: int, seed: int, first_tick: int = 0
+) -> Iterator[list[KlineUpdate]]:
+    """One update of every streamed series per tick, candles advance every
+    UPDATES_PER_CANDLE ticks
+    """
+    rng = random.Random(seed)
+    starts = {
+        timeframe: get_candlestick_start_time(START_TIME, timeframe)
+        for timeframe in TIMEFRAMES
+    }
+    volumes = {series_key: 0 for series_key in streamed}
+    for tick in range(first_tick, first_tick + ticks):
+        candle, update = divmod(tick, UPDATES_PER_CANDLE)
+        updates = []
+        for series_key in streamed:
+            exchange, symbol, timeframe = series_key
+            tf = Timeframe(timeframe)
+            open_time = starts[tf] + candle * interval_in_ms(tf)
+            if update == 0:
+                volumes[series_key] = 0
+            # Volumes of an open candle only grow
+            volumes[series_key] += gen_volume(rng) // UPDATES_PER_CANDLE
+            event_time = START_TIME + tick * 1000
+            volume = volumes[series_key]
+            updates.append(
+                (exchange, symbol, timeframe, open_time, volume, event_time)
+            )
+        yield updates
@@ -1,9 +1,12 @@
-from typing import Union
+from typing import Literal, Union
 
 from typings.enums import Timeframe
 
 SUBSCRIBE_ARGS_LEN = 5
 
+# Binance allows up to 1024 streams on a single combined-stream connection
+MAX_STREAMS_PER_SOCKET = 200
+
 MIN_CANDLE_LEN = 1
 MAX_CANDLE_LEN: dict[Union[str, Timeframe], int] = {
     Timeframe.Min1: 1000,
@@ -22,5 +25,56 @@ MAX_CANDLE_LEN: dict[Union[str, Timeframe], int] = {
     Timeframe.Week1: 10,
 }
 
+# Historical klines per request and the request weight Binance charges for it
+KLINES_LIMIT = 1000
+KLINES_REQUEST_WEIGHT = 2
+# Concurrent backfill downloads and the request weight they may use per minute,
+# kept below the 1200 allowed to leave room for other requests
+BACKFILL_CONCURRENCY = 5
+BACKFILL_WEIGHT_LIMIT = 1000
+# A failed backfill is retried after 10s, doubling up to 10 minutes, from a
+# timer checking for due retries every 5s
+BACKFILL_RETRY_DELAY_IN_SECONDS = 10
+BACKFILL_MAX_RETRY_DELAY_IN_SECONDS = 600
+BACKFILL_RETRY_CHECK_IN_SECONDS = 5
+
+# Decimal places of fixed-point volumes. A symbol keeps its quote asset
+# precision unless VOLUME_HEADROOM times its 24h quote volume would overflow
+# int64: a 3d series holds 150 days, a threshold multiplies a window by up to
+# 200, which leaves room for the volume to grow about 3000-fold. Symbols of
+# unknown volume use DEFAULT_VOLUME_DIGITS
+DEFAULT_VOLUME_DIGITS = 4
+VOLUME_HEADROOM = 10**8
+
+# How kline frames are decoded: "orjson" decodes the whole frame, with the json
+# module where orjson is not installed, "scan" reads the fields from the frame
+# text and decodes only the frames it cannot read
+KLINE_DECODER_BACKEND: Literal["orjson", "scan"] = "orjson"
+
+# Kline updates the market data bus holds before it drops new ones
+CANDLESTICK_QUEUE_SIZE = 65536
+
+# Age after which the in-memory exchangeInfo is downloaded again
+SYMBOL_INDEX_TTL_IN_SECONDS = 3600
+
+# /profile runs for 10 seconds unless told otherwise, at most a minute, and
+# samples the event loop every 5ms while that keeps the sampling under 2% of
+# the run
+DEFAULT_PROFILE_SECONDS = 10
+MAX_PROFILE_SECONDS = 60
+PROFILE_SAMPLE_INTERVAL_IN_SECONDS = 0.005
+PROFILE_OVERHEAD_BUDGET = 0.02
+
 MIN_DELTA_PERCENT = 1
 MAX_DELTA_PERCENT = 100
+
+# How often the coordinator of a sharded run restarts exited shards, and each
+# shard checks that its coordinator is still running
+SHARD_CHECK_INTERVAL_IN_SECONDS = 5
+
+# Symbols listed per page of /stats <exchange>, one short line each to keep a
+# page well under the 4096 characters of a Telegram message
+STATS_PAGE_SIZE = 40
+
+# Series the shared memory export indexes, 64 bytes of index each
+SERIES_EXPORT_SLOTS = 16384
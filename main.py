@@ -6,13 +6,20 @@ import nest_asyncio
 from dotenv import load_dotenv
 
 from core.loggings import logger
+from models.dal import subscription_writer
 from models.main import create_db_and_tables
 from modules.exchange import exchanges
+from modules.metrics.metrics_server import metrics_server
+from modules.sharding.shard_router import ShardRouter
+from modules.startup.pipeline import StartupPipeline
 from modules.store.alerter import Alerter
 from modules.store.garbage_cleaner import GarbageCleaner
 from modules.store.main import Store
+from modules.store.series_export import SeriesExport
 from modules.store.store_updater import StoreUpdater
 from modules.telegram.telegram_bot import telegram_bot
+from modules.telegram.user_directory import user_directory
+from settings import SERIES_EXPORT_NAME, SHARD_COUNT
 from typings.enums import Exchange
 
 load_dotenv("./.env")
@@ -22,27 +29,72 @@ BINANCE_SECRET_KEY = os.getenv("BINANCE_SECRET_KEY")
 nest_asyncio.apply()
 
 
-async def main() -> None:
-    logger.info("Starting main()")
-    create_db_and_tables()
-
+def start_telegram() -> None:
     telegram_bot.start_bot()
     telegram_bot.send_message(
         message=f"start tidehunter-bot {datetime.now(tz=timezone.utc):%Y-%m-%d %H:%M:%S}"
     )
-    await asyncio.gather(asyncio.to_thread(lambda: telegram_bot.run_bot()))
+    telegram_bot.run_bot()
+
 
+async def main() -> None:
+    logger.info("Starting main()")
+    pipeline = StartupPipeline()
+    await pipeline.run("metrics", metrics_server.start())
+    await pipeline.run("database", asyncio.to_thread(create_db_and_tables))
+    await pipeline.run("users", asyncio.to_thread(user_directory.load))
+    await pipeline.run("links", subscription_writer.start())
+    if SHARD_COUNT > 1:
+        await run_coordinator(pipeline)
+    else:
+        await run_single(pipeline)
+    pipeline.finish()
+
+    await asyncio.Event().wait()
+
+
+async def run_single(pipeline: StartupPipeline) -> None:
+    # Telegram and the exchange clients do not depend on each other
     exchange = exchanges[Exchange.Binance]
-    await exchange.start(api_key=BINANCE_API_KEY, secret_key=BINANCE_SECRET_KEY)
+    await asyncio.gather(
+        pipeline.run("telegram", asyncio.to_thread(start_telegram)),
+        pipeline.run(
+            "exchange",
+            exchange.start(api_key=BINANCE_API_KEY, secret_key=BINANCE_SECRET_KEY),
+        ),
+    )
+    # Messages queued so far are delivered once the bot is up
+    await telegram_bot.sender.start()
 
     store = Store()
-    StoreUpdater(store)
+    series_export = None
+    if SERIES_EXPORT_NAME is not None:
+        series_export = SeriesExport(SERIES_EXPORT_NAME)
+    store_updater = StoreUpdater(store, series_export=series_export)
     alerter = Alerter(store)
-    await alerter.start()
     garbage_cleaner = GarbageCleaner(store, alerter)
-    await garbage_cleaner.start()
+    # Started before the series are loaded, every series goes live as soon as
+    # its own history is in instead of waiting for the slowest one
+    await pipeline.run("alerter", alerter.start())
+    await pipeline.run("garbage_cleaner", garbage_cleaner.start())
+    await pipeline.run("series", store_updater.load())
 
-    await asyncio.Event().wait()
+
+async def run_coordinator(pipeline: StartupPipeline) -> None:
+    """Keep the database and Telegram, the shard processes stream and alert"""
+    shard_router = ShardRouter(SHARD_COUNT)
+    # Before Telegram, so that every alert change reaches a shard
+    await pipeline.run("shards", shard_router.start())
+    # The symbol index is still needed to validate commands
+    exchange = exchanges[Exchange.Binance]
+    await asyncio.gather(
+        pipeline.run("telegram", asyncio.to_thread(start_telegram)),
+        pipeline.run(
+            "exchange",
+            exchange.connect(api_key=BINANCE_API_KEY, secret_key=BINANCE_SECRET_KEY),
+        ),
+    )
+    await telegram_bot.sender.start()
 
 
 if __name__ == "__main__":
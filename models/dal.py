@@ -0,0 +1,196 @@
+"""Database access kept off the event loop and the Telegram thread"""
+import asyncio
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from functools import partial
+from typing import Any, Callable, Optional, TypeVar
+
+from sqlalchemy.engine import Engine
+from sqlmodel import Session, select
+
+from core.loggings import logger
+from models.main import Alert, User, UserAlertLink, engine
+from typings.alert import IAlert
+from utils.event_emitter import EStoreUpdater, ee
+
+T = TypeVar("T")
+
+# (event, alert) emitted once the transaction that changed the alert commits
+PendingEvent = tuple[str, Alert]
+# Applies one change inside a batch transaction and returns the reply to send
+SubscriptionWrite = Callable[[Session, list[PendingEvent]], str]
+
+# SQLite takes a single writer at a time, one thread keeps them from contending
+db_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="database")
+
+
+async def run_db(func: Callable[..., T], *args: Any) -> T:
+    """Run blocking database work on the database thread"""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(db_executor, func, *args)
+
+
+def get_alert(session: Session, key: str) -> Optional[Alert]:
+    """Alert by key, remembered for the rest of the batch as autoflush is off"""
+    alerts: dict[str, Optional[Alert]] = session.info.setdefault("alerts", {})
+    if key not in alerts:
+        alerts[key] = session.exec(select(Alert).where(Alert.key == key)).first()
+    return alerts[key]
+
+
+def subscribe_alert(
+    user_id: int, fields: IAlert, session: Session, events: list[PendingEvent]
+) -> str:
+    user = session.get(User, user_id)
+    if user is None:
+        return f"User {user_id} does not exist"
+
+    alert = get_alert(session, fields["key"])
+    if alert is None:
+        alert = Alert(**fields)
+        session.add(alert)
+        session.info["alerts"][alert.key] = alert
+        events.append((EStoreUpdater.ON_ADD_STORE_ALERT, alert))
+        events.append((EStoreUpdater.ON_ADD_STORE_DATA, alert))
+
+    if user in alert.users:
+        return f"Already subscribed to alert {alert.key}"
+    alert.users.append(user)
+    session.info["links"] = session.info.get("links", 0) + 1
+    return f"Successfully subscribed to alert {alert.key}"
+
+
+def unsubscribe_alert(
+    user_id: int, key: str, session: Session, events: list[PendingEvent]
+) -> str:
+    alert = get_alert(session, key)
+    if alert is None:
+        return f"Alert {key} does not exist"
+
+    user = session.get(User, user_id)
+    if user is None:
+        return f"User {user_id} does not exist"
+    if user not in alert.users:
+        return f"Not subscribed to alert {key}"
+    alert.users.remove(user)
+    session.info["links"] = session.info.get("links", 0) - 1
+
+    # No user is associated with the current alert
+    if len(alert.users) == 0:
+        session.delete(alert)
+        session.info["alerts"][key] = None
+        events.append((EStoreUpdater.ON_REMOVE_STORE_ALERT, alert))
+        events.append((EStoreUpdater.ON_REMOVE_STORE_DATA, alert))
+    return f"Successfully unsubscribed to alert {key}"
+
+
+class SubscriptionWriter:
+    """Commits subscription changes in batches on the database thread
+
+    Changes submitted while a batch is committing go into the next one, so a
+    burst of commands costs a few transactions instead of one each. The Store
+    events of a batch are handed to the event loop once it commits, in commit
+    order, the Store is only ever changed from the loop
+    """
+
+    engine: Engine
+    pending: list[tuple[SubscriptionWrite, Future]]
+    # Rows of UserAlertLink, counted once and kept current by the writes
+    links: Optional[int]
+    # Runs the event handlers, set by start()
+    loop: Optional[asyncio.AbstractEventLoop]
+
+    def __init__(self, engine: Engine = engine) -> None:
+        self.engine = engine
+        self.pending = []
+        self.lock = threading.Lock()
+        self.batches = 0
+        self.writes = 0
+        self.links = None
+        self.loop = None
+
+    async def start(self) -> None:
+        self.loop = asyncio.get_running_loop()
+        await run_db(self.count_links)
+
+    def subscribe(self, user_id: int, alert: IAlert) -> Future:
+        """Future of the reply, the alert is created unless its key exists"""
+        return self.submit(partial(subscribe_alert, user_id, alert))
+
+    def unsubscribe(self, user_id: int, key: str) -> Future:
+        return self.submit(partial(unsubscribe_alert, user_id, key))
+
+    def count_links(self) -> None:
+        """Count the links once, on the database thread like the writes"""
+        with Session(self.engine) as session:
+            links = session.query(UserAlertLink).count()
+        with self.lock:
+            self.links = links
+
+    def links_removed(self, count: int) -> None:
+        """Links deleted along with a user"""
+        with self.lock:
+            if self.links is not None:
+                self.links -= count
+
+    def submit(self, write: SubscriptionWrite) -> Future:
+        future: Future = Future()
+        with self.lock:
+            self.pending.append((write, future))
+            # The first change of a batch schedules its flush
+            if len(self.pending) == 1:
+                db_executor.submit(self.flush)
+        return future
+
+    def flush(self) -> None:
+        with self.lock:
+            batch, self.pending = self.pending, []
+        try:
+            self.apply(batch)
+        except Exception as ex:
+            if len(batch) == 1:
+                batch[0][1].set_exception(ex)
+                return
+            # Retry one by one so a single failing change does not fail the rest
+            logger.warning(f"Batch of {len(batch)} subscription writes failed: {ex}")
+            for item in batch:
+                try:
+                    self.apply([item])
+                except Exception as item_ex:
+                    item[1].set_exception(item_ex)
+
+    def apply(self, batch: list[tuple[SubscriptionWrite, Future]]) -> None:
+        events: list[PendingEvent] = []
+        replies = []
+        # Alerts stay readable by the event handlers after the session closes
+        with Session(self.engine, expire_on_commit=False) as session:
+            # Flushed once at commit rather than before every query
+            with session.no_autoflush:
+                for write, _ in batch:
+                    replies.append(write(session, events))
+            session.commit()
+            links = session.info.get("links", 0)
+
+        self.batches += 1
+        self.writes += len(batch)
+        with self.lock:
+            if self.links is not None:
+                self.links += links
+        # Committed whatever the handlers do, a failing one is not a failed write
+        if len(events):
+            if self.loop is None:
+                self.dispatch(events)
+            else:
+                self.loop.call_soon_threadsafe(self.dispatch, events)
+        for (_, future), reply in zip(batch, replies):
+            future.set_result(reply)
+
+    def dispatch(self, events: list[PendingEvent]) -> None:
+        for event, alert in events:
+            try:
+                ee.emit(event, alert)
+            except Exception as ex:
+                logger.error(f"Handler of {event} for alert {alert.key} failed: {ex}")
+
+
+subscription_writer = SubscriptionWriter()
@@ -1,10 +1,37 @@
-from sqlalchemy import Column, Enum
+from sqlalchemy import Column, Enum, event
+from sqlalchemy.pool import QueuePool
 from sqlmodel import Field, Relationship, SQLModel, create_engine
 
 from settings import DATABASE_URI
 from typings.enums import UserRole
 
-engine = create_engine(DATABASE_URI, echo=False)
+# Applied to every new connection. WAL lets the Telegram thread read while the
+# database thread writes, and NORMAL only syncs on checkpoints in WAL mode
+SQLITE_PRAGMAS = [
+    "PRAGMA journal_mode=WAL",
+    "PRAGMA synchronous=NORMAL",
+    "PRAGMA busy_timeout=5000",
+    "PRAGMA cache_size=-16000",
+    "PRAGMA temp_store=MEMORY",
+]
+
+# SQLAlchemy opens a new SQLite file connection per session by default, keep
+# them pooled instead so the pragmas and page cache are reused
+engine = create_engine(
+    DATABASE_URI,
+    echo=False,
+    poolclass=QueuePool,
+    pool_size=4,
+    connect_args={"check_same_thread": False},
+)
+
+
+@event.listens_for(engine, "connect")
+def set_sqlite_pragmas(dbapi_connection, connection_record) -> None:
+    cursor = dbapi_connection.cursor()
+    for pragma in SQLITE_PRAGMAS:
+        cursor.execute(pragma)
+    cursor.close()
 
 
 def create_db_and_tables():
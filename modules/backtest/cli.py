@@ -0,0 +1,239 @@
+"""Replay historical klines to see how often (candle_len, delta) pairs alert
+
+Run from the repository root, on Binance kline dumps from data.binance.vision:
+    python -m modules.backtest.cli data/dumps --timeframe 1m
+or on the kline cache of the bot:
+    python -m modules.backtest.cli --cache --timeframe 1h --delta 20:100:20
+"""
+import argparse
+import csv
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timezone
+from functools import partial
+from typing import Iterator, Optional
+
+import numpy as np
+
+from constants import (
+    DEFAULT_VOLUME_DIGITS,
+    MAX_CANDLE_LEN,
+    MAX_DELTA_PERCENT,
+    MIN_CANDLE_LEN,
+    MIN_DELTA_PERCENT,
+)
+from modules.backtest.kline_source import (
+    VolumeChunk,
+    find_cached_series,
+    find_dumps,
+    read_dumps,
+    read_kline_cache,
+)
+from modules.backtest.replay_engine import ReplayResult, SeriesReplay
+from settings import KLINE_CACHE_PATH
+from typings.enums import Exchange, Timeframe
+from utils.candlestick import interval_in_ms
+
+DEFAULT_CANDLE_LENS = [5, 10, 20, 50, 100, 200, 500, 1000]
+DEFAULT_DELTAS = list(range(10, 101, 10))
+DAY_IN_MS = 86_400_000
+
+
+class SeriesSource:
+    """Where the volumes of one series come from, picklable for the workers"""
+
+    def __init__(
+        self,
+        name: str,
+        files: Optional[list[str]] = None,
+        cache: Optional[tuple[str, str, str]] = None,
+    ) -> None:
+        self.name = name
+        self.files = files
+        # (kline cache path, exchange, symbol)
+        self.cache = cache
+
+    def read(self, timeframe: Timeframe, digits: int) -> Iterator[VolumeChunk]:
+        if self.files is not None:
+            return read_dumps(self.files, digits)
+        assert self.cache is not None
+        path, exchange, symbol = self.cache
+        return read_kline_cache(path, exchange, symbol, timeframe.value)
+
+
+def parse_values(text: str) -> list[int]:
+    """Comma separated values or an inclusive start:stop:step range"""
+    if ":" in text:
+        start, stop, *step = (int(part) for part in text.split(":"))
+        return list(range(start, stop + 1, step[0] if len(step) else 1))
+    return [int(value) for value in text.split(",")]
+
+
+def format_time(timestamp_in_ms: int) -> str:
+    if not timestamp_in_ms:
+        return "-"
+    date = datetime.fromtimestamp(timestamp_in_ms / 1000, tz=timezone.utc)
+    return f"{date:%Y-%m-%d %H:%M}"
+
+
+def replay(
+    source: SeriesSource,
+    timeframe: Timeframe,
+    candle_lens: list[int],
+    deltas: list[int],
+    digits: int,
+    events_dir: Optional[str],
+) -> tuple[str, ReplayResult]:
+    events = None
+    if events_dir is not None:
+        events = open(
+            os.path.join(events_dir, f"{source.name}_{timeframe.value}.csv"), "w"
+        )
+        writer = csv.writer(events)
+        writer.writerow(["candle_len", "delta", "open_time"])
+
+    def on_alert(candle_len: int, delta: int, open_times: np.ndarray) -> None:
+        writer.writerows((candle_len, delta, t) for t in open_times.tolist())
+
+    try:
+        series = SeriesReplay(
+            timeframe, candle_lens, deltas, on_alert if events is not None else None
+        )
+        for open_times, volumes in source.read(timeframe, digits):
+            series.feed(open_times, volumes)
+    finally:
+        if events is not None:
+            events.close()
+    return source.name, series.result
+
+
+def find_sources(args: argparse.Namespace) -> list[SeriesSource]:
+    if args.cache is not None:
+        return [
+            SeriesSource(f"{exchange}_{symbol}", cache=(args.cache, exchange, symbol))
+            for exchange, symbol in find_cached_series(args.cache, args.timeframe)
+        ]
+    return [
+        SeriesSource(f"{Exchange.Binance.value}_{symbol}", files=files)
+        for symbol, files in find_dumps(args.paths, args.timeframe).items()
+    ]
+
+
+def print_summary(
+    timeframe: Timeframe, results: list[tuple[str, ReplayResult]]
+) -> None:
+    """Alerts of every pair over all the series"""
+    candle_lens = results[0][1].candle_lens
+    deltas = results[0][1].deltas
+    counts = np.sum([result.counts for _, result in results], axis=0)
+    alerting = np.sum([result.counts > 0 for _, result in results], axis=0)
+    # Series-days replayed, alerts per day are per series
+    candles = sum(result.candles for _, result in results)
+    days = candles * interval_in_ms(timeframe) / DAY_IN_MS
+    print(
+        f"{'candle_len':>10} {'delta':>6} {'alerts':>10} "
+        f"{'per day':>9} {'series':>7}"
+    )
+    for i, candle_len in enumerate(candle_lens):
+        for j, delta in enumerate(deltas):
+            per_day = counts[i, j] / days if days else 0
+            print(
+                f"{candle_len:>10} {delta:>6} {counts[i, j]:>10} "
+                f"{per_day:>9.2f} {alerting[i, j]:>7}/{len(results)}"
+            )
+
+
+def write_results(path: str, results: list[tuple[str, ReplayResult]]) -> None:
+    with open(path, "w") as file:
+        writer = csv.writer(file)
+        writer.writerow(
+            ["series", "candle_len", "delta", "alerts", "first_alert", "last_alert"]
+        )
+        for name, result in results:
+            for candle_len, delta, count, first, last in result.rows():
+                writer.writerow(
+                    [
+                        name,
+                        candle_len,
+                        delta,
+                        count,
+                        format_time(first),
+                        format_time(last),
+                    ]
+                )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("paths", nargs="*", help="kline dump files or directories")
+    parser.add_argument(
+        "--cache",
+        nargs="?",
+        const=KLINE_CACHE_PATH,
+        help="replay the kline cache instead of dumps",
+    )
+    parser.add_argument("--timeframe", default=Timeframe.Min1.value)
+    parser.add_argument("--candle-len", type=parse_values)
+    parser.add_argument("--delta", type=parse_values, default=DEFAULT_DELTAS)
+    parser.add_argument(
+        "--digits",
+        type=int,
+        default=DEFAULT_VOLUME_DIGITS,
+        help="decimal places kept of the volumes, as the bot does",
+    )
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--output", help="CSV of the alerts per series and pair")
+    parser.add_argument("--events", help="directory for the alert times per series")
+    args = parser.parse_args()
+
+    if args.cache is None and not len(args.paths):
+        parser.error("give kline dump paths or --cache")
+    timeframe = Timeframe(args.timeframe)
+    max_candle_len = MAX_CANDLE_LEN[timeframe]
+    candle_lens = args.candle_len or [
+        candle_len
+        for candle_len in DEFAULT_CANDLE_LENS
+        if candle_len <= max_candle_len
+    ]
+    if not all(MIN_CANDLE_LEN <= c <= max_candle_len for c in candle_lens):
+        parser.error(f"candle_len must be {MIN_CANDLE_LEN} to {max_candle_len}")
+    if not all(MIN_DELTA_PERCENT <= d <= MAX_DELTA_PERCENT for d in args.delta):
+        parser.error(f"delta must be {MIN_DELTA_PERCENT} to {MAX_DELTA_PERCENT}")
+    if args.events is not None:
+        os.makedirs(args.events, exist_ok=True)
+
+    sources = find_sources(args)
+    if not len(sources):
+        parser.error(f"no {timeframe.value} klines found")
+    print(
+        f"Replaying {len(sources)} series with {len(candle_lens)} candle_len "
+        f"and {len(args.delta)} delta values"
+    )
+
+    start = time.perf_counter()
+    run = partial(
+        replay,
+        timeframe=timeframe,
+        candle_lens=candle_lens,
+        deltas=args.delta,
+        digits=args.digits,
+        events_dir=args.events,
+    )
+    if args.workers > 1 and len(sources) > 1:
+        with ProcessPoolExecutor(max_workers=args.workers) as executor:
+            results = list(executor.map(run, sources))
+    else:
+        results = [run(source) for source in sources]
+    elapsed = time.perf_counter() - start
+
+    candles = sum(result.candles for _, result in results)
+    print(f"{candles} candles in {elapsed:.1f}s, {candles / elapsed:.0f} per second")
+    print_summary(timeframe, results)
+    if args.output is not None:
+        write_results(args.output, results)
+        print(f"Saved to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,127 @@
+"""Historical candle volumes read from disk one file or chunk at a time"""
+import io
+import os
+import re
+import sqlite3
+import zipfile
+from typing import Iterator
+
+import numpy as np
+
+from utils.fixed_point import to_fixed
+
+# Binance public data dumps, e.g. BTCUSDT-1m-2023-01.zip or BTCUSDT-1h-2023-01-05.csv
+DUMP_FILENAME = re.compile(
+    r"^(?P<symbol>[A-Z0-9]+)-(?P<interval>\w+)-"
+    r"(?P<year>\d{4})-(?P<month>\d{2})(?:-(?P<day>\d{2}))?\.(?:zip|csv)$"
+)
+# Column of the quote asset volume, the volume the kline socket carries
+QUOTE_VOLUME_COLUMN = 7
+# Dumps from 2025 onwards have open times in microseconds
+MICROSECONDS_FROM = 10**14
+
+# (open times in ms, fixed-point quote volumes)
+VolumeChunk = tuple[np.ndarray, np.ndarray]
+
+
+def period_start(path: str) -> tuple[int, int, int]:
+    """(year, month, day) the candles of a dump start at, a monthly dump sorts
+    before the daily ones of its month
+    """
+    match = DUMP_FILENAME.match(os.path.basename(path))
+    assert match is not None
+    return int(match["year"]), int(match["month"]), int(match["day"] or 0)
+
+
+def find_dumps(paths: list[str], interval: str) -> dict[str, list[str]]:
+    """Dump files of the interval per symbol, in time order, from files and
+    directories searched recursively
+    """
+    files: list[str] = []
+    for path in paths:
+        if os.path.isdir(path):
+            for directory, _, names in os.walk(path):
+                files.extend(os.path.join(directory, name) for name in names)
+        else:
+            files.append(path)
+
+    dumps: dict[str, list[str]] = {}
+    for file in files:
+        match = DUMP_FILENAME.match(os.path.basename(file))
+        if match is None or match["interval"] != interval:
+            continue
+        dumps.setdefault(match["symbol"].lower(), []).append(file)
+    # Names do not sort in time order once daily and monthly dumps are mixed,
+    # SYMBOL-1m-2023-01-05 would come before SYMBOL-1m-2023-01
+    return {
+        symbol: sorted(files, key=period_start)
+        for symbol, files in sorted(dumps.items())
+    }
+
+
+def parse_dump(lines: Iterator[str], digits: int) -> VolumeChunk:
+    open_times = []
+    volumes = []
+    for line in lines:
+        columns = line.split(",", QUOTE_VOLUME_COLUMN + 1)
+        # Header row of the newer dumps
+        if not columns[0].isdigit():
+            continue
+        open_times.append(int(columns[0]))
+        volumes.append(to_fixed(columns[QUOTE_VOLUME_COLUMN], digits))
+    times = np.array(open_times, dtype=np.int64)
+    if len(times) and times[0] >= MICROSECONDS_FROM:
+        times //= 1000
+    return times, np.array(volumes, dtype=np.int64)
+
+
+def read_dump(path: str, digits: int) -> Iterator[VolumeChunk]:
+    """One chunk per CSV file, or per CSV in a zip archive"""
+    if path.endswith(".zip"):
+        with zipfile.ZipFile(path) as archive:
+            for name in sorted(archive.namelist()):
+                with archive.open(name) as file:
+                    yield parse_dump(io.TextIOWrapper(file, encoding="ascii"), digits)
+    else:
+        with open(path, encoding="ascii") as file:
+            yield parse_dump(file, digits)
+
+
+def read_dumps(paths: list[str], digits: int) -> Iterator[VolumeChunk]:
+    for path in paths:
+        yield from read_dump(path, digits)
+
+
+def find_cached_series(path: str, interval: str) -> list[tuple[str, str]]:
+    """(exchange, symbol) of the series of the interval in a kline cache"""
+    connection = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+    try:
+        cursor = connection.execute(
+            "SELECT DISTINCT exchange, symbol FROM kline_volume WHERE timeframe = ? "
+            "ORDER BY exchange, symbol",
+            (interval,),
+        )
+        return cursor.fetchall()
+    finally:
+        connection.close()
+
+
+def read_kline_cache(
+    path: str, exchange: str, symbol: str, interval: str, chunk_size: int = 100_000
+) -> Iterator[VolumeChunk]:
+    """Volumes of a series in the kline cache, already fixed-point"""
+    connection = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+    try:
+        cursor = connection.execute(
+            "SELECT open_time, volume FROM kline_volume WHERE exchange = ? "
+            "AND symbol = ? AND timeframe = ? ORDER BY open_time",
+            (exchange, symbol, interval),
+        )
+        while True:
+            rows = cursor.fetchmany(chunk_size)
+            if not len(rows):
+                break
+            chunk = np.array(rows, dtype=np.int64)
+            yield chunk[:, 0], chunk[:, 1]
+    finally:
+        connection.close()
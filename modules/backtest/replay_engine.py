@@ -0,0 +1,170 @@
+from typing import Callable, Optional
+
+import numpy as np
+
+from typings.enums import Timeframe
+from utils.candlestick import interval_in_ms
+
+# A zero-volume window alerts on any candle, as alert_volume is 0 then
+ALWAYS = np.iinfo(np.int64).max
+
+# (candle_len, delta, open times of the candles that alerted)
+AlertCallback = Callable[[int, int, np.ndarray], None]
+
+
+class ReplayResult:
+    """Alerts each (candle_len, delta) pair fired over a series"""
+
+    candle_lens: np.ndarray
+    deltas: np.ndarray
+    # Indexed [candle_len, delta] like the two arrays above
+    counts: np.ndarray
+    first_times: np.ndarray
+    last_times: np.ndarray
+
+    def __init__(self, candle_lens: np.ndarray, deltas: np.ndarray) -> None:
+        self.candle_lens = candle_lens
+        self.deltas = deltas
+        shape = (len(candle_lens), len(deltas))
+        self.counts = np.zeros(shape, dtype=np.int64)
+        # 0 until a pair fires
+        self.first_times = np.zeros(shape, dtype=np.int64)
+        self.last_times = np.zeros(shape, dtype=np.int64)
+        self.candles = 0
+        self.start_time = 0
+        self.end_time = 0
+
+    def rows(self) -> list[tuple[int, int, int, int, int]]:
+        """(candle_len, delta, alerts, first, last) for every pair"""
+        return [
+            (
+                int(candle_len),
+                int(delta),
+                int(self.counts[i, j]),
+                int(self.first_times[i, j]),
+                int(self.last_times[i, j]),
+            )
+            for i, candle_len in enumerate(self.candle_lens)
+            for j, delta in enumerate(self.deltas)
+        ]
+
+
+class SeriesReplay:
+    """Replays the candle volumes of one series through the Alerter rules
+
+    A candle alerts when its final volume reaches alert_volume of the
+    candle_len complete candles before it, which is what Alerter sees as the
+    volume of an open candle only grows. As on a backfilled live series, a
+    candle is evaluated once a whole window precedes it, and candles missing
+    from the input count as zero volume but never alert themselves.
+
+    Volumes are fed in chunks of any size, only the last max(candle_lens)
+    candles are kept between chunks
+    """
+
+    timeframe: Timeframe
+    interval: int
+    result: ReplayResult
+    on_alert: Optional[AlertCallback]
+    # Volumes and presence of the candles before the next chunk
+    tail_volumes: np.ndarray
+    tail_present: np.ndarray
+    next_open_time: Optional[int]
+
+    def __init__(
+        self,
+        timeframe: Timeframe,
+        candle_lens: list[int],
+        deltas: list[int],
+        on_alert: Optional[AlertCallback] = None,
+    ) -> None:
+        self.timeframe = timeframe
+        self.interval = interval_in_ms(timeframe)
+        self.result = ReplayResult(
+            np.array(sorted(set(candle_lens)), dtype=np.int64),
+            np.array(sorted(set(deltas)), dtype=np.int64),
+        )
+        self.on_alert = on_alert
+        self.max_candle_len = int(self.result.candle_lens[-1])
+        self.tail_volumes = np.zeros(0, dtype=np.int64)
+        self.tail_present = np.zeros(0, dtype=bool)
+        self.next_open_time = None
+        # Candles seen so far, gaps included
+        self.seen = 0
+
+    def feed(self, open_times: np.ndarray, volumes: np.ndarray) -> None:
+        """Add candles in open time order, ones already replayed are skipped"""
+        if self.next_open_time is not None:
+            keep = open_times >= self.next_open_time
+            open_times, volumes = open_times[keep], volumes[keep]
+        if not len(open_times):
+            return
+        start = open_times[0] if self.next_open_time is None else self.next_open_time
+        positions = (open_times - start) // self.interval
+        size = int(positions[-1]) + 1
+        # Missing candles stay at zero volume, repeated ones keep the last value
+        chunk_volumes = np.zeros(size, dtype=np.int64)
+        chunk_present = np.zeros(size, dtype=bool)
+        chunk_volumes[positions] = volumes
+        chunk_present[positions] = True
+
+        if self.result.start_time == 0:
+            self.result.start_time = int(start)
+        self.evaluate(int(start), chunk_volumes, chunk_present)
+
+        self.tail_volumes = np.concatenate([self.tail_volumes, chunk_volumes])[
+            -self.max_candle_len :
+        ]
+        self.tail_present = np.concatenate([self.tail_present, chunk_present])[
+            -self.max_candle_len :
+        ]
+        self.seen += size
+        self.next_open_time = int(start) + size * self.interval
+        self.result.candles += size
+        self.result.end_time = self.next_open_time - self.interval
+
+    def evaluate(self, start: int, volumes: np.ndarray, present: np.ndarray) -> None:
+        result = self.result
+        offset = len(self.tail_volumes)
+        combined = np.concatenate([self.tail_volumes, volumes])
+        # prefix[i] is the volume of the candles before combined[i]
+        prefix = np.zeros(len(combined) + 1, dtype=np.int64)
+        np.cumsum(combined, out=prefix[1:])
+        positions = np.arange(offset, len(combined))
+        # Index of every chunk candle since the first candle of the series
+        indexes = positions - offset + self.seen
+        open_times = start + np.arange(len(volumes), dtype=np.int64) * self.interval
+
+        for i, candle_len in enumerate(result.candle_lens):
+            evaluable = present & (indexes >= candle_len)
+            if not evaluable.any():
+                continue
+            window_sums = prefix[positions] - prefix[positions - candle_len]
+            # Largest delta each candle alerts at: the candle alerts when
+            # 100 * candle_len * volume >= window_sum * (100 + delta)
+            excess = 100 * candle_len * volumes - 100 * window_sums
+            max_deltas = np.full(len(volumes), ALWAYS, dtype=np.int64)
+            np.floor_divide(excess, window_sums, out=max_deltas, where=window_sums > 0)
+            max_deltas[~evaluable] = -1
+
+            fired = max_deltas[None, :] >= result.deltas[:, None]
+            counts = fired.sum(axis=1)
+            any_fired = counts > 0
+            if not any_fired.any():
+                continue
+            first = np.argmax(fired, axis=1)
+            last = len(volumes) - 1 - np.argmax(fired[:, ::-1], axis=1)
+            result.counts[i] += counts
+            result.first_times[i] = np.where(
+                any_fired & (result.first_times[i] == 0),
+                open_times[first],
+                result.first_times[i],
+            )
+            result.last_times[i] = np.where(
+                any_fired, open_times[last], result.last_times[i]
+            )
+            if self.on_alert is not None:
+                for j in np.nonzero(any_fired)[0]:
+                    self.on_alert(
+                        int(candle_len), int(result.deltas[j]), open_times[fired[j]]
+                    )
@@ -0,0 +1,116 @@
+import asyncio
+import json
+from asyncio import Task
+from typing import Callable, Optional, Union
+
+from binance import BinanceSocketManager
+from binance.streams import ReconnectingWebsocket
+
+from core.loggings import logger
+from modules.exchange.kline_decoder import KlineDecoder, KlineFrame
+
+# Binance drops connections sending more than 5 messages per second
+MIN_SEND_INTERVAL_IN_SECONDS = 0.25
+
+
+def gen_kline_stream(symbol: str, interval: str) -> str:
+    return f"{symbol.lower()}@kline_{interval}"
+
+
+class KlineSocket(ReconnectingWebsocket):
+    """A combined-stream socket queueing raw frames for its listener to decode
+
+    Every connect, reconnects included, asks for the streams live at the time.
+    Built outside BinanceSocketManager, which caches sockets by path for good
+    """
+
+    def __init__(self, url: str, streams: set[str]) -> None:
+        super().__init__(url, prefix="stream?")
+        self.streams = streams
+
+    async def _before_connect(self) -> None:
+        self._path = f'streams={"/".join(sorted(self.streams))}'
+
+    def _handle_message(self, evt: str) -> str:
+        return evt
+
+
+class CombinedStream:
+    """A single combined-stream connection carrying many kline streams"""
+
+    name: str
+    streams: set[str]
+    socket: KlineSocket
+    decoder: KlineDecoder
+    task: Optional[Task]
+
+    def __init__(
+        self,
+        name: str,
+        ws_client: BinanceSocketManager,
+        streams: list[str],
+        on_message: Callable[[KlineFrame], None],
+        decoder: KlineDecoder,
+    ) -> None:
+        self.name = name
+        self.streams = set(streams)
+        if ws_client.testnet:
+            url = ws_client.STREAM_TESTNET_URL
+        else:
+            url = ws_client.STREAM_URL
+        self.socket = KlineSocket(url, self.streams)
+        # Raw frames are decoded straight into KlineFrame records instead of
+        # the full dicts python-binance would queue
+        self.decoder = decoder
+        self.task = None
+        self.on_message = on_message
+        self.ready = asyncio.Event()
+        self.request_id = 0
+        self.send_lock = asyncio.Lock()
+
+    def __len__(self) -> int:
+        return len(self.streams)
+
+    def start(self) -> Task:
+        self.task = asyncio.create_task(self.listen())
+        return self.task
+
+    def close(self) -> None:
+        if self.task is not None:
+            self.task.cancel()
+
+    async def listen(self) -> None:
+        async with self.socket as tscm:
+            self.ready.set()
+            while True:
+                res: Union[str, dict] = await tscm.recv()
+                # python-binance queues its own errors as dicts
+                if isinstance(res, dict):
+                    logger.warning(f"{self.name} socket error: {res.get('m')}")
+                    continue
+                record = self.decoder.decode(res)
+                # SUBSCRIBE/UNSUBSCRIBE acknowledgements decode to None
+                if record is not None:
+                    self.on_message(record)
+
+    async def subscribe(self, streams: list[str]) -> None:
+        self.streams.update(streams)
+        await self.send("SUBSCRIBE", streams)
+
+    async def unsubscribe(self, streams: list[str]) -> None:
+        self.streams.difference_update(streams)
+        await self.send("UNSUBSCRIBE", streams)
+
+    async def send(self, method: str, streams: list[str]) -> None:
+        await self.ready.wait()
+        async with self.send_lock:
+            # A reconnecting socket picks the streams up from the path instead
+            if self.socket.ws is None:
+                return
+            self.request_id += 1
+            payload = {"method": method, "params": streams, "id": self.request_id}
+            try:
+                await self.socket.ws.send(json.dumps(payload))
+            except Exception as ex:
+                logger.warning(f"{self.name} failed to {method} {streams}: {ex}")
+            await asyncio.sleep(MIN_SEND_INTERVAL_IN_SECONDS)
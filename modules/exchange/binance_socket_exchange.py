@@ -1,89 +1,208 @@
 import asyncio
+import math
 from asyncio import Task
-from decimal import Decimal
-from typing import Any, Callable, Union
-
-from binance import AsyncClient, BinanceSocketManager, Client
-
+from typing import Optional
+
+from binance import AsyncClient, BinanceSocketManager
+
+from constants import (
+    KLINE_DECODER_BACKEND,
+    MAX_STREAMS_PER_SOCKET,
+    SYMBOL_INDEX_TTL_IN_SECONDS,
+)
+from modules.exchange.binance_combined_stream import CombinedStream
+from modules.exchange.binance_symbol_index import SymbolIndex
+from modules.exchange.kline_backfiller import KlineBackfiller
+from modules.exchange.kline_decoder import KlineDecoder, KlineFrame
+from modules.exchange.stream_scheduler import StreamScheduler
+from modules.metrics.registry import metrics
 from modules.telegram.telegram_bot import telegram_bot
-from typings.enums import Exchange, Timeframe
-from typings.exchange import ICandlestickEvent
-from utils.decorators import set_interval
-from utils.event_emitter import EExchange, ETelegramEvent, ee
+from modules.timer.timer_service import timer_service
+from typings.enums import Exchange
+from utils.event_emitter import ETelegramEvent, ee, market_data
+from utils.fixed_point import to_fixed
+
+stream_messages = metrics.counter(
+    "tidehunter_stream_messages",
+    "Kline messages received per stream",
+    ("exchange", "symbol", "interval"),
+)
 
 
 class BinanceExchange:
     tasks: dict[str, Task]
-    callables: list[tuple]
-    client: Client
+    connections: dict[str, CombinedStream]
+    streams: dict[str, CombinedStream]
+    connection_count: int
     async_client: AsyncClient
     ws_client: BinanceSocketManager
+    backfiller: KlineBackfiller
+    symbol_index: SymbolIndex
+    stream_scheduler: StreamScheduler
+    decoder: KlineDecoder
 
     def __init__(self) -> None:
+        # Both keyed by the name of a combined-stream connection
         self.tasks = {}
-        self.callables = []
+        self.connections = {}
+        # Kline stream name to the connection carrying it
+        self.streams = {}
+        self.connection_count = 0
+        self.streaming = False
+        self.decoder = KlineDecoder(KLINE_DECODER_BACKEND)
         ee.on(ETelegramEvent.STATS, self.stats_requested)
 
-    async def start(self, api_key: str, secret_key: str) -> None:
-        self.client = Client(api_key=api_key, api_secret=secret_key)
+    async def start(
+        self, api_key: Optional[str], secret_key: Optional[str]
+    ) -> None:
+        await self.connect(api_key, secret_key)
+        self.stream_scheduler = StreamScheduler(self.add_streams, self.remove_streams)
+        asyncio.create_task(self.stream_scheduler.run())
+        self.streaming = True
+
+    async def connect(
+        self, api_key: Optional[str], secret_key: Optional[str]
+    ) -> None:
+        """REST client and symbol index only, enough to validate commands
+
+        The keys are optional, the public market data needs none
+        """
         self.async_client = await AsyncClient.create(
             api_key=api_key, api_secret=secret_key
         )
         self.ws_client = BinanceSocketManager(self.async_client)
+        # Reuses the pooled keep-alive aiohttp session of the async client
+        self.backfiller = KlineBackfiller(self.async_client)
 
-        asyncio.create_task(self.scheduler())
+        self.symbol_index = SymbolIndex(self.async_client)
+        await self.symbol_index.load()
+
+        timer_service.schedule(
+            "symbol_index",
+            self.symbol_index.refresh,
+            interval_in_seconds=SYMBOL_INDEX_TTL_IN_SECONDS,
+        )
 
     def stats_requested(self, chat_id: int) -> None:
+        # The coordinator of a sharded run streams nothing itself
+        if not self.streaming:
+            return
+        sockets = {name: len(conn) for name, conn in self.connections.items()}
+        scheduler = self.stream_scheduler.stats()
+        bus = market_data.candlesticks.stats()
         msg = (
             f"📊 EXCHANGE STATS\n"
             f"==========================\n"
-            f"{'Sockets':<15}: {list(self.tasks)}\n"
-            f"{'Pending calls':<15}: {self.callables}\n"
+            f"{'Sockets':<15}: {sockets}\n"
+            f"{'Streams':<15}: {len(self.streams)}\n"
+            f"{'Symbols':<15}: {len(self.symbol_index.symbols)}\n"
+            f"{'Pending ops':<15}: {scheduler['pending']}\n"
+            f"{'Applied ops':<15}: {scheduler['applied']}\n"
+            f"{'Cancelled ops':<15}: {scheduler['cancelled']}\n"
+            f"{'Op wait (s)':<15}: last {scheduler['last_wait']}, "
+            f"avg {scheduler['avg_wait']}, max {scheduler['max_wait']}\n"
+            f"{'Kline queue':<15}: {bus['queued']}/{bus['capacity']}, "
+            f"max {bus['max_queued']}\n"
+            f"{'Klines':<15}: {bus['published']} published, "
+            f"{bus['dropped']} dropped, {bus['avg_batch']} per batch\n"
+            f"{'Frames':<15}: {self.decoder.name}, "
+            f"{self.decoder.scanned} scanned, {self.decoder.decoded} decoded, "
+            f"{self.decoder.failed} failed\n"
             f"==========================\n"
         )
         telegram_bot.send_message(chat_id=chat_id, message=msg)
 
-    def schedule_task(self, *args: Union[list[Callable], list[Any]]) -> None:
-        self.callables.append(args)
-
-    @set_interval(2, "dynamic")
-    async def scheduler(self) -> None:
-        if len(self.callables):
-            for call in self.callables:
-                function = call[0]
-                await function(*call[1:])
-            self.callables = []
-
-    async def add_symbol(self, symbol: str, interval: Union[str, Timeframe]) -> None:
-        symbol_upper = symbol.upper()
-        symbol_lower = symbol.lower()
-
-        async def listen():
-            ts = self.ws_client.kline_socket(symbol_upper, interval)
-
-            async with ts as tscm:
-                while True:
-                    res: ICandlestickEvent = await tscm.recv()
-                    ee.emit(
-                        EExchange.CANDLESTICK_EVENT,
-                        {
-                            "exchange": Exchange.Binance,
-                            "symbol": symbol_lower,
-                            "timeframe": interval,
-                            "open_time": res["k"]["t"],
-                            "volume": Decimal(res["k"]["q"]),
-                        },
-                    )
-
-        task = asyncio.create_task(listen())
-        self.tasks[f"{symbol_upper}_{interval}"] = task
-
-    def remove_symbol(self, symbol: str, interval: Union[str, Timeframe]) -> None:
-        symbol_upper = symbol.upper()
-        task = self.tasks[f"{symbol_upper}_{interval}"]
-        task.cancel()
-        del self.tasks[f"{symbol_upper}_{interval}"]
+    def on_kline_message(self, frame: KlineFrame) -> None:
+        stream_messages.labels(Exchange.Binance, frame.symbol, frame.interval).inc()
+        digits = self.symbol_index.volume_digits(frame.symbol)
+        market_data.candlesticks.publish(
+            Exchange.Binance,
+            frame.symbol.lower(),
+            frame.interval,
+            frame.open_time,
+            to_fixed(frame.quote_volume, digits),
+            frame.event_time,
+        )
+
+    async def add_streams(self, streams: list[str]) -> None:
+        # One SUBSCRIBE per connection carries all of its new streams
+        planned: dict[CombinedStream, list[str]] = {}
+        unplaced: list[str] = []
+        for stream in dict.fromkeys(streams):
+            if stream in self.streams or stream in unplaced:
+                continue
+            available = [
+                conn
+                for conn in self.connections.values()
+                if len(conn) + len(planned.get(conn, [])) < MAX_STREAMS_PER_SOCKET
+            ]
+            if not len(available):
+                unplaced.append(stream)
+                continue
+            # Fill the least loaded connection to keep the shards balanced
+            conn = min(available, key=lambda c: len(c) + len(planned.get(c, [])))
+            planned.setdefault(conn, []).append(stream)
+            self.streams[stream] = conn
+
+        for i in range(0, len(unplaced), MAX_STREAMS_PER_SOCKET):
+            self.open_connection(unplaced[i : i + MAX_STREAMS_PER_SOCKET])
+        await asyncio.gather(
+            *(conn.subscribe(added) for conn, added in planned.items())
+        )
+
+    async def remove_streams(self, streams: list[str]) -> None:
+        planned: dict[CombinedStream, list[str]] = {}
+        for stream in dict.fromkeys(streams):
+            conn = self.streams.pop(stream, None)
+            if conn is not None:
+                planned.setdefault(conn, []).append(stream)
+
+        unsubscribes = []
+        for conn, removed in planned.items():
+            if len(conn) == len(removed):
+                self.close_connection(conn)
+            else:
+                unsubscribes.append(conn.unsubscribe(removed))
+        await asyncio.gather(*unsubscribes)
+        await self.rebalance()
+
+    async def rebalance(self) -> None:
+        """Merge the least loaded connections while fewer could carry all streams"""
+        required = math.ceil(len(self.streams) / MAX_STREAMS_PER_SOCKET)
+        while len(self.connections) > max(required, 1):
+            source = min(self.connections.values(), key=len)
+            streams = sorted(source.streams)
+            for conn in sorted(self.connections.values(), key=len):
+                if conn is source or not len(streams):
+                    continue
+                room = MAX_STREAMS_PER_SOCKET - len(conn)
+                moved, streams = streams[:room], streams[room:]
+                if not len(moved):
+                    continue
+                # Subscribe on the target first so no candle update is missed
+                await conn.subscribe(moved)
+                for stream in moved:
+                    self.streams[stream] = conn
+            if len(streams):
+                return
+            self.close_connection(source)
+
+    def open_connection(self, streams: list[str]) -> CombinedStream:
+        self.connection_count += 1
+        name = f"combined_{self.connection_count}"
+        conn = CombinedStream(
+            name, self.ws_client, streams, self.on_kline_message, self.decoder
+        )
+        self.connections[name] = conn
+        for stream in streams:
+            self.streams[stream] = conn
+        self.tasks[name] = conn.start()
+        return conn
+
+    def close_connection(self, conn: CombinedStream) -> None:
+        conn.close()
+        del self.connections[conn.name]
+        del self.tasks[conn.name]
 
     async def close(self) -> None:
-        self.client.close_connection()
         await self.async_client.close_connection()
@@ -0,0 +1,96 @@
+import asyncio
+import time
+from decimal import Decimal
+from typing import Optional
+
+from binance import AsyncClient
+
+from constants import DEFAULT_VOLUME_DIGITS, VOLUME_HEADROOM
+from core.loggings import logger
+from typings.exchange import ISymbolInfo
+
+TRADING_STATUS = "TRADING"
+INT64_MAX = 2**63 - 1
+
+
+def scale_digits(quote_asset_precision: int, quote_volume: Decimal) -> int:
+    """Decimal places that keep VOLUME_HEADROOM times the volume inside int64"""
+    digits = quote_asset_precision
+    while digits > 0 and quote_volume * VOLUME_HEADROOM * 10**digits > INT64_MAX:
+        digits -= 1
+    return digits
+
+
+class SymbolIndex:
+    """exchangeInfo held in memory and refreshed in the background
+
+    Lookups only read a dict that each refresh replaces whole, so they are
+    safe from the Telegram thread
+    """
+
+    client: AsyncClient
+    symbols: dict[str, ISymbolInfo]
+    # Volume digits per symbol, fixed once known as the series and the socket
+    # of a symbol must agree on them
+    digits: dict[str, int]
+    loaded_at: Optional[float]
+
+    def __init__(self, client: AsyncClient) -> None:
+        self.client = client
+        # Keyed by the uppercase symbol
+        self.symbols = {}
+        self.digits = {}
+        self.loaded_at = None
+
+    @property
+    def loaded(self) -> bool:
+        return self.loaded_at is not None
+
+    async def load(self) -> None:
+        exchange_info, tickers = await asyncio.gather(
+            self.client.get_exchange_info(), self.client.get_ticker()
+        )
+        quote_volumes = {t["symbol"]: Decimal(t["quoteVolume"]) for t in tickers}
+        symbols: dict[str, ISymbolInfo] = {}
+        digits = dict(self.digits)
+        for info in exchange_info["symbols"]:
+            symbols[info["symbol"]] = {
+                "symbol": info["symbol"],
+                "status": info["status"],
+                "base_asset": info["baseAsset"],
+                "quote_asset": info["quoteAsset"],
+                "base_asset_precision": info["baseAssetPrecision"],
+                "quote_asset_precision": info["quoteAssetPrecision"],
+            }
+            if info["symbol"] in digits:
+                continue
+            quote_volume = quote_volumes.get(info["symbol"], Decimal(0))
+            # A new listing has no volume to size its digits from yet
+            if quote_volume > 0:
+                digits[info["symbol"]] = scale_digits(
+                    info["quoteAssetPrecision"], quote_volume
+                )
+            else:
+                digits[info["symbol"]] = DEFAULT_VOLUME_DIGITS
+        self.symbols = symbols
+        self.digits = digits
+        self.loaded_at = time.time()
+        logger.info(f"Loaded {len(symbols)} symbols from exchangeInfo")
+
+    async def refresh(self) -> None:
+        try:
+            await self.load()
+        except Exception as ex:
+            # Keep answering from the previous copy until the next refresh
+            logger.warning(f"Failed to refresh exchangeInfo: {ex}")
+
+    def get(self, symbol: str) -> Optional[ISymbolInfo]:
+        return self.symbols.get(symbol.upper())
+
+    def is_trading(self, symbol: str) -> bool:
+        info = self.get(symbol)
+        return info is not None and info["status"] == TRADING_STATUS
+
+    def volume_digits(self, symbol: str) -> int:
+        """Decimal places of the fixed-point volumes of a symbol"""
+        return self.digits.get(symbol.upper(), DEFAULT_VOLUME_DIGITS)
@@ -0,0 +1,114 @@
+import asyncio
+import time
+from typing import Union
+
+from binance import AsyncClient
+
+from constants import (
+    BACKFILL_CONCURRENCY,
+    BACKFILL_WEIGHT_LIMIT,
+    KLINES_LIMIT,
+    KLINES_REQUEST_WEIGHT,
+)
+from core.loggings import logger
+from modules.metrics.registry import metrics
+from typings.enums import Timeframe
+from utils.candlestick import interval_in_ms
+
+USED_WEIGHT_HEADER = "X-MBX-USED-WEIGHT-1M"
+
+backfill_duration = metrics.histogram(
+    "tidehunter_backfill_seconds",
+    "Time to download the history of a series, waits for the budget included",
+    buckets=(0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 300.0),
+).labels()
+
+
+class RequestWeightBudget:
+    """Request weight spent in the current minute, as counted by Binance"""
+
+    limit: int
+    used: int
+    minute: int
+
+    def __init__(self, limit: int) -> None:
+        self.limit = limit
+        self.used = 0
+        self.minute = 0
+        self.lock = asyncio.Lock()
+
+    def roll(self) -> None:
+        minute = int(time.time() // 60)
+        if minute != self.minute:
+            self.minute = minute
+            self.used = 0
+
+    async def acquire(self, weight: int) -> None:
+        async with self.lock:
+            self.roll()
+            while self.used + weight > self.limit:
+                await asyncio.sleep(60 - time.time() % 60)
+                self.roll()
+            self.used += weight
+
+    def update(self, used_weight: int) -> None:
+        """Sync with the weight Binance reports, which includes other clients"""
+        self.roll()
+        self.used = max(self.used, used_weight)
+
+
+class KlineBackfiller:
+    """Fetches historical klines concurrently without blocking the event loop"""
+
+    client: AsyncClient
+    budget: RequestWeightBudget
+    pending: dict[tuple[str, str, int], asyncio.Task]
+
+    def __init__(self, client: AsyncClient) -> None:
+        self.client = client
+        self.budget = RequestWeightBudget(BACKFILL_WEIGHT_LIMIT)
+        self.semaphore = asyncio.Semaphore(BACKFILL_CONCURRENCY)
+        self.pending = {}
+
+    async def fetch(
+        self, symbol: str, interval: Union[str, Timeframe], start_time: int
+    ) -> list[list]:
+        key = (symbol.upper(), str(interval), start_time)
+
+        # Requests for the same series share a single download
+        task = self.pending.get(key)
+        if task is None:
+            task = asyncio.create_task(self._fetch(*key))
+            self.pending[key] = task
+            task.add_done_callback(lambda _: self.pending.pop(key, None))
+        return await asyncio.shield(task)
+
+    async def _fetch(self, symbol: str, interval: str, start_time: int) -> list[list]:
+        klines: list[list] = []
+        step = interval_in_ms(Timeframe(interval))
+        started_at = time.perf_counter()
+        async with self.semaphore:
+            while True:
+                await self.budget.acquire(KLINES_REQUEST_WEIGHT)
+                page = await self.client.get_klines(
+                    symbol=symbol,
+                    interval=interval,
+                    startTime=start_time,
+                    limit=KLINES_LIMIT,
+                )
+                self.on_response()
+                klines.extend(page)
+                if len(page) < KLINES_LIMIT:
+                    break
+                start_time = page[-1][0] + step
+        backfill_duration.observe(time.perf_counter() - started_at)
+        logger.info(f"Backfilled {len(klines)} {symbol} {interval} klines")
+        return klines
+
+    def on_response(self) -> None:
+        response = self.client.response
+        if response is None:
+            return
+        used_weight = response.headers.get(USED_WEIGHT_HEADER)
+        if used_weight is not None:
+            self.budget.update(int(used_weight))
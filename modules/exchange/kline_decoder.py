@@ -0,0 +1,105 @@
+import json
+from typing import Literal, NamedTuple, Optional, Union
+
+try:
+    import orjson
+except ImportError:
+    orjson = None  # type: ignore
+
+JsonBackend = Literal["orjson", "scan"]
+
+
+class KlineFrame(NamedTuple):
+    """The fields of a combined-stream kline frame tidehunter reads"""
+
+    symbol: str  # Uppercase symbol
+    interval: str
+    open_time: int
+    quote_volume: str  # Decimal string, parsed to fixed-point by the exchange
+    closed: bool
+    event_time: int
+
+
+def _string_field(frame: str, key: str) -> str:
+    start = frame.index(key) + len(key)
+    return frame[start : frame.index('"', start)]
+
+
+def _number_field(frame: str, key: str) -> int:
+    # "E" and "t" are never the last field of their object
+    start = frame.index(key) + len(key)
+    return int(frame[start : frame.index(",", start)])
+
+
+def scan_kline_frame(frame: str) -> Optional[KlineFrame]:
+    """Read the fields straight from the frame text without decoding it
+
+    Relies on every key read being unique in a kline frame, "s" appears twice
+    with the same symbol. Anything else is left to the JSON decoder
+    """
+    if '"e":"kline"' not in frame:
+        return None
+    return KlineFrame(
+        _string_field(frame, '"s":"'),
+        _string_field(frame, '"i":"'),
+        _number_field(frame, '"t":'),
+        _string_field(frame, '"q":"'),
+        frame[frame.index('"x":') + 4] == "t",
+        _number_field(frame, '"E":'),
+    )
+
+
+def to_kline_frame(message: dict) -> Optional[KlineFrame]:
+    data = message.get("data")
+    # SUBSCRIBE/UNSUBSCRIBE acknowledgements carry no data
+    if data is None or data.get("e") != "kline":
+        return None
+    kline = data["k"]
+    return KlineFrame(
+        data["s"], kline["i"], kline["t"], kline["q"], kline["x"], data["E"]
+    )
+
+
+class KlineDecoder:
+    """Decodes raw combined-stream frames into KlineFrame records
+
+    "orjson" decodes every frame, with the json module when orjson is not
+    installed. "scan" falls back to it for frames it cannot read
+    """
+
+    backend: JsonBackend
+
+    def __init__(self, backend: JsonBackend = "orjson") -> None:
+        self.backend = backend
+        self.scanned = 0
+        self.decoded = 0
+        self.failed = 0
+
+    @property
+    def name(self) -> str:
+        if self.backend == "orjson" and orjson is None:
+            return "json"
+        return self.backend
+
+    def loads(self, frame: Union[str, bytes]) -> dict:
+        if orjson is not None:
+            return orjson.loads(frame)
+        return json.loads(frame)
+
+    def decode(self, frame: Union[str, bytes]) -> Optional[KlineFrame]:
+        if self.backend == "scan" and isinstance(frame, str):
+            try:
+                record = scan_kline_frame(frame)
+                if record is not None:
+                    self.scanned += 1
+                    return record
+            except (ValueError, IndexError):
+                pass
+        try:
+            record = to_kline_frame(self.loads(frame))
+        except (ValueError, KeyError, TypeError):
+            self.failed += 1
+            return None
+        if record is not None:
+            self.decoded += 1
+        return record
@@ -0,0 +1,114 @@
+import asyncio
+import time
+from typing import Awaitable, Callable, Literal, Union
+
+from core.loggings import logger
+from modules.exchange.binance_combined_stream import gen_kline_stream
+from typings.enums import Timeframe
+
+StreamOperation = Literal["add", "remove"]
+# (operation, stream, time it was queued at)
+ScheduledItem = tuple[StreamOperation, str, float]
+
+
+class StreamScheduler:
+    """Applies stream additions and removals as soon as they are queued
+
+    Everything queued while a batch is being applied goes into the next batch,
+    where an addition and a removal of the same stream cancel out
+    """
+
+    loop: asyncio.AbstractEventLoop
+    queue: asyncio.Queue
+    add_streams: Callable[[list[str]], Awaitable[None]]
+    remove_streams: Callable[[list[str]], Awaitable[None]]
+
+    def __init__(
+        self,
+        add_streams: Callable[[list[str]], Awaitable[None]],
+        remove_streams: Callable[[list[str]], Awaitable[None]],
+    ) -> None:
+        self.loop = asyncio.get_running_loop()
+        self.queue = asyncio.Queue()
+        self.add_streams = add_streams
+        self.remove_streams = remove_streams
+        # Operations taken off the queue but not applied yet
+        self.in_flight = 0
+
+        self.applied = 0
+        self.cancelled = 0
+        self.last_wait = 0.0
+        self.max_wait = 0.0
+        self.total_wait = 0.0
+
+    def add(self, symbol: str, interval: Union[str, Timeframe]) -> None:
+        self.put(("add", gen_kline_stream(symbol, interval), time.monotonic()))
+
+    def remove(self, symbol: str, interval: Union[str, Timeframe]) -> None:
+        self.put(("remove", gen_kline_stream(symbol, interval), time.monotonic()))
+
+    def put(self, item: ScheduledItem) -> None:
+        """Queue an operation, safe to call from any thread"""
+        try:
+            running_loop = asyncio.get_running_loop()
+        except RuntimeError:
+            running_loop = None
+        if running_loop is self.loop:
+            self.queue.put_nowait(item)
+        else:
+            self.loop.call_soon_threadsafe(self.queue.put_nowait, item)
+
+    @property
+    def pending(self) -> int:
+        return self.queue.qsize() + self.in_flight
+
+    async def run(self) -> None:
+        while True:
+            batch = [await self.queue.get()]
+            while not self.queue.empty():
+                batch.append(self.queue.get_nowait())
+            self.in_flight = len(batch)
+            try:
+                await self.apply(batch)
+            except Exception as ex:
+                logger.error(f"Failed to apply {len(batch)} stream operations: {ex}")
+            self.in_flight = 0
+
+    async def apply(self, batch: list[ScheduledItem]) -> None:
+        operations: dict[str, ScheduledItem] = {}
+        for item in batch:
+            operation, stream, _ = item
+            queued = operations.get(stream)
+            if queued is None:
+                operations[stream] = item
+            elif queued[0] != operation:
+                # Removing a stream that is still to be added, or the reverse
+                del operations[stream]
+                self.cancelled += 2
+
+        removals = [s for s, item in operations.items() if item[0] == "remove"]
+        additions = [s for s, item in operations.items() if item[0] == "add"]
+        # Removals first to free room on the existing connections
+        if len(removals):
+            await self.remove_streams(removals)
+        if len(additions):
+            await self.add_streams(additions)
+
+        now = time.monotonic()
+        for _, _, queued_at in operations.values():
+            wait = now - queued_at
+            self.applied += 1
+            self.last_wait = wait
+            self.max_wait = max(self.max_wait, wait)
+            self.total_wait += wait
+
+    def stats(self) -> dict:
+        avg_wait = self.total_wait / self.applied if self.applied else 0
+        return {
+            "pending": self.pending,
+            "applied": self.applied,
+            "cancelled": self.cancelled,
+            "last_wait": round(self.last_wait, 3),
+            "avg_wait": round(avg_wait, 3),
+            "max_wait": round(self.max_wait, 3),
+        }
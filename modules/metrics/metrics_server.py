@@ -0,0 +1,69 @@
+import asyncio
+from typing import Optional
+
+from core.loggings import logger
+from modules.metrics.registry import MetricsRegistry, metrics
+from settings import METRICS_HOST, METRICS_PORT
+
+LOOP_LAG_INTERVAL_IN_SECONDS = 0.5
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+loop_lag = metrics.histogram(
+    "tidehunter_event_loop_lag_seconds",
+    "Delay of the event loop in waking up a sleeping task",
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 5.0),
+).labels()
+
+
+class MetricsServer:
+    """Serves the registry over HTTP at /metrics and samples the loop lag"""
+
+    registry: MetricsRegistry
+    server: Optional[asyncio.AbstractServer]
+
+    def __init__(self, registry: MetricsRegistry = metrics) -> None:
+        self.registry = registry
+        self.server = None
+
+    async def start(self, host: str = METRICS_HOST, port: int = METRICS_PORT) -> None:
+        self.server = await asyncio.start_server(self.on_connection, host, port)
+        asyncio.create_task(self.sample_loop_lag())
+        logger.info(f"Serving metrics on http://{host}:{port}/metrics")
+
+    async def on_connection(
+        self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter
+    ) -> None:
+        try:
+            request_line = await reader.readline()
+            # Headers are not needed, read up to the blank line ending them
+            while (await reader.readline()).strip():
+                pass
+            parts = request_line.decode("latin-1").split()
+            if len(parts) >= 2 and parts[0] == "GET" and parts[1] == "/metrics":
+                status, body = "200 OK", self.registry.expose().encode()
+            else:
+                status, body = "404 Not Found", b"Not found\n"
+            writer.write(
+                f"HTTP/1.1 {status}\r\n"
+                f"Content-Type: {CONTENT_TYPE}\r\n"
+                f"Content-Length: {len(body)}\r\n"
+                f"Connection: close\r\n\r\n".encode()
+                + body
+            )
+            await writer.drain()
+        except Exception as ex:
+            logger.warning(f"Metrics request failed: {ex}")
+        finally:
+            writer.close()
+
+    async def sample_loop_lag(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            start = loop.time()
+            await asyncio.sleep(LOOP_LAG_INTERVAL_IN_SECONDS)
+            loop_lag.observe(
+                max(0.0, loop.time() - start - LOOP_LAG_INTERVAL_IN_SECONDS)
+            )
+
+
+metrics_server = MetricsServer()
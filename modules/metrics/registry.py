@@ -0,0 +1,250 @@
+import math
+from abc import ABC, abstractmethod
+from bisect import bisect_left
+from typing import Generic, TypeVar
+
+# Seconds, from sub-millisecond evaluations up to slow backfills
+DEFAULT_BUCKETS = (
+    0.0001,
+    0.0005,
+    0.001,
+    0.005,
+    0.01,
+    0.05,
+    0.1,
+    0.5,
+    1.0,
+    5.0,
+    10.0,
+    60.0,
+)
+
+TChild = TypeVar("TChild")
+
+
+def format_value(value: float) -> str:
+    if value == math.inf:
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+def escape_label_value(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def format_labels(label_names: tuple[str, ...], values: tuple[str, ...]) -> str:
+    if not len(label_names):
+        return ""
+    pairs = ",".join(
+        f'{name}="{escape_label_value(value)}"'
+        for name, value in zip(label_names, values)
+    )
+    return "{" + pairs + "}"
+
+
+class CounterChild:
+    __slots__ = ("value",)
+
+    def __init__(self) -> None:
+        self.value = 0.0
+
+    def inc(self, amount: float = 1) -> None:
+        self.value += amount
+
+
+class GaugeChild:
+    __slots__ = ("value",)
+
+    def __init__(self) -> None:
+        self.value = 0.0
+
+    def set(self, value: float) -> None:
+        self.value = value
+
+    def inc(self, amount: float = 1) -> None:
+        self.value += amount
+
+    def dec(self, amount: float = 1) -> None:
+        self.value -= amount
+
+
+class HistogramChild:
+    __slots__ = ("bounds", "counts", "sum")
+
+    def __init__(self, bounds: tuple[float, ...]) -> None:
+        self.bounds = bounds
+        # One count per bucket plus +Inf, made cumulative when exposed
+        self.counts = [0] * (len(bounds) + 1)
+        self.sum = 0.0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect_left(self.bounds, value)] += 1
+        self.sum += value
+
+
+class Metric(ABC, Generic[TChild]):
+    """A metric family, one child per combination of label values
+
+    Recording only touches plain attributes of a child, callers on hot paths
+    can keep the child returned by labels() instead of looking it up each
+    time. Only used from the event loop thread
+    """
+
+    kind: str
+    name: str
+    documentation: str
+    label_names: tuple[str, ...]
+    children: dict[tuple[str, ...], TChild]
+
+    def __init__(
+        self, name: str, documentation: str, label_names: tuple[str, ...] = ()
+    ) -> None:
+        self.name = name
+        self.documentation = documentation
+        self.label_names = label_names
+        self.children = {}
+
+    @abstractmethod
+    def new_child(self) -> TChild:
+        pass
+
+    def labels(self, *values: str) -> TChild:
+        child = self.children.get(values)
+        if child is None:
+            assert len(values) == len(self.label_names)
+            child = self.new_child()
+            self.children[values] = child
+        return child
+
+    @abstractmethod
+    def samples(self) -> list[tuple[str, str, float]]:
+        """(name suffix, labels, value) of every child"""
+
+    def expose(self) -> str:
+        lines = [
+            f"# HELP {self.name} {self.documentation}",
+            f"# TYPE {self.name} {self.kind}",
+        ]
+        for suffix, labels, value in self.samples():
+            lines.append(f"{self.name}{suffix}{labels} {format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+
+class Counter(Metric[CounterChild]):
+    kind = "counter"
+
+    def new_child(self) -> CounterChild:
+        return CounterChild()
+
+    def inc(self, amount: float = 1) -> None:
+        self.labels().inc(amount)
+
+    def samples(self) -> list[tuple[str, str, float]]:
+        return [
+            ("_total", format_labels(self.label_names, values), child.value)
+            for values, child in self.children.items()
+        ]
+
+
+class Gauge(Metric[GaugeChild]):
+    kind = "gauge"
+
+    def new_child(self) -> GaugeChild:
+        return GaugeChild()
+
+    def set(self, value: float) -> None:
+        self.labels().set(value)
+
+    def inc(self, amount: float = 1) -> None:
+        self.labels().inc(amount)
+
+    def dec(self, amount: float = 1) -> None:
+        self.labels().dec(amount)
+
+    def samples(self) -> list[tuple[str, str, float]]:
+        return [
+            ("", format_labels(self.label_names, values), child.value)
+            for values, child in self.children.items()
+        ]
+
+
+class Histogram(Metric[HistogramChild]):
+    kind = "histogram"
+    buckets: tuple[float, ...]
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        label_names: tuple[str, ...] = (),
+        buckets: tuple[float, ...] = DEFAULT_BUCKETS,
+    ) -> None:
+        super().__init__(name, documentation, label_names)
+        self.buckets = tuple(sorted(buckets))
+
+    def new_child(self) -> HistogramChild:
+        return HistogramChild(self.buckets)
+
+    def observe(self, value: float) -> None:
+        self.labels().observe(value)
+
+    def samples(self) -> list[tuple[str, str, float]]:
+        samples: list[tuple[str, str, float]] = []
+        names = self.label_names + ("le",)
+        for values, child in self.children.items():
+            cumulative = 0
+            for bound, count in zip(self.buckets + (math.inf,), child.counts):
+                cumulative += count
+                labels = format_labels(names, values + (format_value(bound),))
+                samples.append(("_bucket", labels, cumulative))
+            labels = format_labels(self.label_names, values)
+            samples.append(("_sum", labels, child.sum))
+            samples.append(("_count", labels, cumulative))
+        return samples
+
+
+class MetricsRegistry:
+    """Every metric of the bot, exposed in the Prometheus text format"""
+
+    metrics: dict[str, Metric]
+
+    def __init__(self) -> None:
+        self.metrics = {}
+
+    def register(self, metric: Metric[TChild]) -> Metric[TChild]:
+        assert metric.name not in self.metrics, f"Duplicate metric {metric.name}"
+        self.metrics[metric.name] = metric
+        return metric
+
+    def counter(
+        self, name: str, documentation: str, label_names: tuple[str, ...] = ()
+    ) -> Counter:
+        metric = Counter(name, documentation, label_names)
+        self.register(metric)
+        return metric
+
+    def gauge(
+        self, name: str, documentation: str, label_names: tuple[str, ...] = ()
+    ) -> Gauge:
+        metric = Gauge(name, documentation, label_names)
+        self.register(metric)
+        return metric
+
+    def histogram(
+        self,
+        name: str,
+        documentation: str,
+        label_names: tuple[str, ...] = (),
+        buckets: tuple[float, ...] = DEFAULT_BUCKETS,
+    ) -> Histogram:
+        metric = Histogram(name, documentation, label_names, buckets)
+        self.register(metric)
+        return metric
+
+    def expose(self) -> str:
+        return "".join(metric.expose() for metric in self.metrics.values())
+
+
+metrics = MetricsRegistry()
@@ -0,0 +1,306 @@
+import os
+import sys
+import threading
+import time
+import tracemalloc
+from datetime import datetime, timezone
+from types import CodeType, FrameType
+from typing import Callable, Optional
+
+from constants import (
+    MAX_PROFILE_SECONDS,
+    PROFILE_OVERHEAD_BUDGET,
+    PROFILE_SAMPLE_INTERVAL_IN_SECONDS,
+)
+from core.loggings import logger
+from settings import BASE_DIR, PROFILE_DIR
+
+# Frames kept per allocation site, enough to tell the callers apart
+TRACEMALLOC_FRAMES = 5
+# Rounds of the allocations timed with and without tracing, under 10ms
+CALIBRATION_ROUNDS = 50
+# Lines per section of the Telegram report, which is capped at 4096 characters
+REPORT_TOP = 10
+
+# (code object, line being executed) of the innermost frame
+Location = tuple[CodeType, int]
+# Code objects from the outermost frame to the innermost
+Stack = tuple[CodeType, ...]
+
+
+def short_filename(filename: str) -> str:
+    """Path within the repository, file name alone for libraries"""
+    if filename.startswith(BASE_DIR):
+        return filename[len(BASE_DIR) + 1 :]
+    return os.path.basename(filename)
+
+
+def describe(code: CodeType, lineno: Optional[int] = None) -> str:
+    line = code.co_firstlineno if lineno is None else lineno
+    return f"{code.co_name} ({short_filename(code.co_filename)}:{line})"
+
+
+class ProfileResult:
+    """Samples of one profiling run, see SamplingProfiler"""
+
+    stacks: dict[Stack, int]
+    locations: dict[Location, int]
+    memory_diff: Optional[list[tracemalloc.StatisticDiff]]
+
+    def __init__(self) -> None:
+        self.stacks = {}
+        self.locations = {}
+        self.memory_diff = None
+        self.samples = 0
+        self.duration = 0.0
+        self.sampling_time = 0.0
+        # How much slower allocations are while traced, the wall and process
+        # CPU seconds they were traced for, and the time spent calibrating and
+        # taking snapshots
+        self.tracing_slowdown = 0.0
+        self.traced_time = 0.0
+        self.traced_cpu_time = 0.0
+        self.memory_time = 0.0
+
+    @property
+    def tracing_share(self) -> float:
+        """Share of the traced CPU time tracing accounts for at most, were
+        all of it spent allocating
+        """
+        return self.tracing_slowdown / (1 + self.tracing_slowdown)
+
+    @property
+    def tracing_cost(self) -> float:
+        return self.memory_time + self.tracing_share * self.traced_cpu_time
+
+    @property
+    def overhead(self) -> float:
+        """Share of the run spent taking samples and tracing allocations"""
+        cost = self.sampling_time + self.tracing_cost
+        return cost / self.duration if self.duration else 0
+
+    def inclusive(self) -> dict[CodeType, int]:
+        """Samples each function was on the stack for, recursion counted once"""
+        counts: dict[CodeType, int] = {}
+        for stack, count in self.stacks.items():
+            for code in set(stack):
+                counts[code] = counts.get(code, 0) + count
+        return counts
+
+    def top_lines(self, top: Optional[int] = REPORT_TOP) -> list[str]:
+        lines = []
+        if not self.samples:
+            return ["No samples"]
+        locations = sorted(self.locations.items(), key=lambda item: -item[1])
+        lines.append("Self time:")
+        for (code, lineno), count in locations[:top]:
+            lines.append(f"{count / self.samples:>6.1%} {describe(code, lineno)}")
+        inclusive = sorted(self.inclusive().items(), key=lambda item: -item[1])
+        lines.append("Total time:")
+        for code, count in inclusive[:top]:
+            lines.append(f"{count / self.samples:>6.1%} {describe(code)}")
+        if self.memory_diff is not None:
+            lines.append("Allocations:")
+            for stat in self.memory_diff[:top]:
+                frame = stat.traceback[0]
+                lines.append(
+                    f"{stat.size_diff / 1024:>+9.1f} KiB "
+                    f"{stat.count_diff:>+7} "
+                    f"{short_filename(frame.filename)}:{frame.lineno}"
+                )
+        return lines
+
+    def folded(self) -> str:
+        """One line per stack as "outer;inner count", read by flame graph tools"""
+        return "".join(
+            ";".join(describe(code) for code in stack) + f" {count}\n"
+            for stack, count in self.stacks.items()
+        )
+
+
+def time_allocations() -> float:
+    started_at = time.perf_counter()
+    for _ in range(CALIBRATION_ROUNDS):
+        [{"volume": i} for i in range(100)]
+    return time.perf_counter() - started_at
+
+
+class SamplingProfiler:
+    """Samples the stack of a running thread from a background thread
+
+    Every sample holds the GIL while the stack is walked, so the pause after
+    each sample is stretched to keep the time spent sampling below
+    overhead_budget of the run. Tracing allocations slows every thread down
+    by a factor measured when it starts. A memory profile gives half of the
+    budget to tracing, counted from the CPU time the process uses while
+    traced, and stops tracing once that half is spent
+    """
+
+    thread_id: int
+    interval: float
+    overhead_budget: float
+
+    def __init__(
+        self,
+        thread_id: int,
+        interval: float = PROFILE_SAMPLE_INTERVAL_IN_SECONDS,
+        overhead_budget: float = PROFILE_OVERHEAD_BUDGET,
+    ) -> None:
+        self.thread_id = thread_id
+        self.interval = interval
+        self.overhead_budget = overhead_budget
+
+    def sample(self, result: ProfileResult) -> None:
+        frame: Optional[FrameType] = sys._current_frames().get(self.thread_id)
+        if frame is None:
+            return
+        location = (frame.f_code, frame.f_lineno)
+        result.locations[location] = result.locations.get(location, 0) + 1
+        codes = []
+        while frame is not None:
+            codes.append(frame.f_code)
+            frame = frame.f_back
+        stack = tuple(reversed(codes))
+        result.stacks[stack] = result.stacks.get(stack, 0) + 1
+        result.samples += 1
+
+    def run(self, seconds: float, memory: bool = False) -> ProfileResult:
+        """Profile for the given seconds, blocking the calling thread"""
+        result = ProfileResult()
+        budget = self.overhead_budget / 2 if memory else self.overhead_budget
+        # Tracing started elsewhere costs the same with or without the profile
+        tracing = memory and not tracemalloc.is_tracing()
+        started_at = time.perf_counter()
+        try:
+            before = self.start_tracing(result, tracing) if memory else None
+            traced_at = time.perf_counter()
+            traced_cpu_at = time.process_time()
+            deadline = started_at + seconds
+            while True:
+                sample_started_at = time.perf_counter()
+                if sample_started_at >= deadline:
+                    break
+                self.sample(result)
+                cost = time.perf_counter() - sample_started_at
+                result.sampling_time += cost
+                pause = max(self.interval, cost / budget - cost)
+                if before is not None and tracing:
+                    result.traced_time = time.perf_counter() - traced_at
+                    result.traced_cpu_time = time.process_time() - traced_cpu_at
+                    cpu_rate = result.traced_cpu_time / result.traced_time
+                    # Stopped before the pause would take tracing past its
+                    # budget, the last snapshot costs about as much as the first
+                    cost_at_stop = (
+                        result.tracing_cost
+                        + result.tracing_share * cpu_rate * pause
+                        + result.memory_time
+                    )
+                    if cost_at_stop >= budget * seconds:
+                        self.stop_tracing(result, before, tracing)
+                        before = None
+                time.sleep(pause)
+            if before is not None:
+                self.stop_tracing(result, before, tracing)
+            result.duration = time.perf_counter() - started_at
+        finally:
+            # Allocations are only traced for as long as the profile needs
+            if tracing and tracemalloc.is_tracing():
+                tracemalloc.stop()
+        return result
+
+    def start_tracing(
+        self, result: ProfileResult, tracing: bool
+    ) -> tracemalloc.Snapshot:
+        started_at = time.perf_counter()
+        if tracing:
+            untraced = time_allocations()
+            tracemalloc.start(TRACEMALLOC_FRAMES)
+            traced = time_allocations()
+            result.tracing_slowdown = max(traced / untraced - 1, 0)
+        snapshot = tracemalloc.take_snapshot()
+        result.memory_time += time.perf_counter() - started_at
+        return snapshot
+
+    def stop_tracing(
+        self, result: ProfileResult, before: tracemalloc.Snapshot, tracing: bool
+    ) -> None:
+        started_at = time.perf_counter()
+        after = tracemalloc.take_snapshot()
+        if tracing:
+            tracemalloc.stop()
+        result.memory_diff = after.compare_to(before, "lineno")
+        result.memory_time += time.perf_counter() - started_at
+
+
+class Profiler:
+    """Runs one profile at a time on its own thread and reports when done"""
+
+    thread: Optional[threading.Thread]
+
+    def __init__(self) -> None:
+        self.thread = None
+        self.lock = threading.Lock()
+
+    def start(
+        self, seconds: float, memory: bool, on_report: Callable[[str], None]
+    ) -> bool:
+        """Profile the event loop thread, False if a profile is already running"""
+        seconds = max(1, min(seconds, MAX_PROFILE_SECONDS))
+        with self.lock:
+            if self.thread is not None and self.thread.is_alive():
+                return False
+            # asyncio.run in main.py keeps the event loop on the main thread
+            profiler = SamplingProfiler(threading.main_thread().ident or 0)
+            self.thread = threading.Thread(
+                target=self.run,
+                args=(profiler, seconds, memory, on_report),
+                name="profiler",
+                daemon=True,
+            )
+            self.thread.start()
+            return True
+
+    def run(
+        self,
+        profiler: SamplingProfiler,
+        seconds: float,
+        memory: bool,
+        on_report: Callable[[str], None],
+    ) -> None:
+        try:
+            result = profiler.run(seconds, memory)
+            path = self.save(result)
+        except Exception as ex:
+            logger.error(f"Profile failed: {ex}")
+            on_report(f"Profile failed: {ex}")
+            return
+        msg = (
+            f"🔬 PROFILE\n"
+            f"==========================\n"
+            f"{'Duration (s)':<15}: {result.duration:.1f}\n"
+            f"{'Samples':<15}: {result.samples}\n"
+            f"{'Overhead':<15}: {result.overhead:.2%} "
+            f"(budget {profiler.overhead_budget:.0%})\n"
+        )
+        if result.memory_diff is not None:
+            msg += (
+                f"{'Traced (s)':<15}: {result.traced_time:.2f}, allocations "
+                f"{result.tracing_slowdown + 1:.1f}x slower\n"
+            )
+        msg += f"{'Saved to':<15}: {path}\n==========================\n"
+        msg += "\n".join(result.top_lines()) + "\n"
+        on_report(msg)
+
+    def save(self, result: ProfileResult) -> str:
+        """Write the folded stacks and the full report, return their path stem"""
+        os.makedirs(PROFILE_DIR, exist_ok=True)
+        date = datetime.now(tz=timezone.utc)
+        path = os.path.join(PROFILE_DIR, f"profile_{date:%Y%m%d_%H%M%S}")
+        with open(f"{path}.folded", "w") as file:
+            file.write(result.folded())
+        with open(f"{path}.txt", "w") as file:
+            file.write("\n".join(result.top_lines(top=None)) + "\n")
+        return path
+
+
+profiler = Profiler()
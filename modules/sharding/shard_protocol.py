@@ -0,0 +1,46 @@
+"""What the coordinator and the shards of a sharded run send each other"""
+import zlib
+from typing import NamedTuple, Optional, Union
+
+from models.main import Alert
+from modules.telegram.telegram_sender import ChatId
+from typings.alert import IAlert
+
+
+class AlertEvent(NamedTuple):
+    """An EStoreUpdater event for an alert of the shard"""
+
+    event: str
+    alert: IAlert
+
+
+class StatsRequest(NamedTuple):
+    chat_id: ChatId
+
+
+class SeriesStatsRequest(NamedTuple):
+    chat_id: ChatId
+    exchange: str
+    symbol: Optional[str]
+    page: int
+
+
+ShardCommand = Union[AlertEvent, StatsRequest, SeriesStatsRequest]
+# (chat_id, message) for the Telegram bot of the coordinator
+OutboxMessage = tuple[ChatId, str]
+
+
+def shard_of(exchange: str, symbol: str, shard_count: int) -> int:
+    """Shard owning a pair, the same in every process unlike hash()"""
+    return zlib.crc32(f"{exchange}_{symbol}".encode()) % shard_count
+
+
+def alert_fields(a: Alert) -> IAlert:
+    return {
+        "key": a.key,
+        "exchange": a.exchange,
+        "symbol": a.symbol,
+        "timeframe": a.timeframe,
+        "candle_len": a.candle_len,
+        "delta": a.delta,
+    }
@@ -0,0 +1,199 @@
+import asyncio
+import multiprocessing
+import threading
+from functools import partial
+from multiprocessing.process import BaseProcess
+from multiprocessing.queues import Queue
+from typing import Optional
+
+from sqlmodel import Session, select
+
+from constants import SHARD_CHECK_INTERVAL_IN_SECONDS
+from core.loggings import logger
+from models.dal import run_db
+from models.main import Alert, engine
+from modules.sharding.shard_protocol import (
+    AlertEvent,
+    OutboxMessage,
+    SeriesStatsRequest,
+    StatsRequest,
+    alert_fields,
+    shard_of,
+)
+from modules.sharding.shard_worker import run_shard
+from modules.telegram.telegram_bot import telegram_bot
+from modules.timer.timer_service import timer_service
+from utils.event_emitter import EStoreUpdater, ETelegramEvent, ee
+
+ROUTED_EVENTS = [
+    EStoreUpdater.ON_ADD_STORE_ALERT,
+    EStoreUpdater.ON_ADD_STORE_DATA,
+    EStoreUpdater.ON_REMOVE_STORE_ALERT,
+    EStoreUpdater.ON_REMOVE_STORE_DATA,
+]
+
+
+class Shard:
+    """A shard process and the queue of the commands it reads"""
+
+    process: BaseProcess
+    commands: Queue
+    alert_count: int
+
+    def __init__(self, process: BaseProcess, commands: Queue, alert_count: int):
+        self.process = process
+        self.commands = commands
+        self.alert_count = alert_count
+        self.restarts = 0
+
+
+class ShardRouter:
+    """Coordinator side of a sharded run
+
+    Every (exchange, symbol) pair belongs to the shard process shard_of gives,
+    which streams and alerts on it like a single process would. Alert changes
+    reach the loop in commit order once committed and are forwarded from there
+    to the owning shard, so each shard gets the same events for its pairs as
+    the Store of a single process
+    """
+
+    shard_count: int
+    shards: list[Shard]
+    outbox: Queue
+    loop: asyncio.AbstractEventLoop
+
+    def __init__(self, shard_count: int) -> None:
+        # Shards start from a clean interpreter rather than a copy of the
+        # threads and connections of the coordinator
+        self.context = multiprocessing.get_context("spawn")
+        self.shard_count = shard_count
+        self.shards = []
+        self.outbox = self.context.Queue()
+        for event in ROUTED_EVENTS:
+            ee.on(event, partial(self.route, event))
+        ee.on(ETelegramEvent.STATS, self.stats_requested)
+        ee.on(ETelegramEvent.SERIES_STATS, self.series_stats_requested)
+
+    async def start(self) -> None:
+        self.loop = asyncio.get_running_loop()
+        # Nothing commits before the shards are started, Telegram starts after
+        await run_db(self.spawn_all)
+        threading.Thread(
+            target=self.relay_outbox, name="shard-outbox", daemon=True
+        ).start()
+        timer_service.schedule(
+            "shards",
+            self.check_shards,
+            interval_in_seconds=SHARD_CHECK_INTERVAL_IN_SECONDS,
+        )
+
+    def query_alerts(self) -> list[Alert]:
+        with Session(engine) as session:
+            return session.exec(select(Alert)).all()
+
+    def owned_alerts(self, alerts: list[Alert], index: int) -> list[Alert]:
+        return [
+            a
+            for a in alerts
+            if shard_of(a.exchange, a.symbol, self.shard_count) == index
+        ]
+
+    def spawn_all(self) -> None:
+        alerts = self.query_alerts()
+        self.shards = [
+            self.spawn(index, self.owned_alerts(alerts, index))
+            for index in range(self.shard_count)
+        ]
+
+    def spawn(self, index: int, alerts: list[Alert]) -> Shard:
+        commands = self.context.Queue()
+        process = self.context.Process(
+            target=run_shard,
+            args=(
+                index,
+                self.shard_count,
+                [alert_fields(a) for a in alerts],
+                commands,
+                self.outbox,
+            ),
+            name=f"shard-{index + 1}",
+            daemon=True,
+        )
+        process.start()
+        logger.info(
+            f"Started shard {index + 1}/{self.shard_count} with {len(alerts)} "
+            f"alerts, pid {process.pid}"
+        )
+        return Shard(process, commands, len(alerts))
+
+    def respawn(self, index: int) -> None:
+        """Replace an exited shard with one started from the committed alerts"""
+        alerts = self.owned_alerts(self.query_alerts(), index)
+        # The events of the changes committed before the query are already
+        # queued on the loop and the later ones go after this, so the shard
+        # is swapped in between the two
+        self.loop.call_soon_threadsafe(self.replace, index, alerts)
+
+    def replace(self, index: int, alerts: list[Alert]) -> None:
+        previous = self.shards[index]
+        shard = self.spawn(index, alerts)
+        shard.restarts = previous.restarts + 1
+        self.shards[index] = shard
+        previous.commands.close()
+
+    async def check_shards(self) -> None:
+        for index, shard in enumerate(self.shards):
+            if shard.process.is_alive():
+                continue
+            logger.error(
+                f"Shard {index + 1} exited with code {shard.process.exitcode}, "
+                f"restarting it"
+            )
+            await run_db(self.respawn, index)
+
+    def route(self, event: str, a: Alert) -> None:
+        if not len(self.shards):
+            return
+        shard = self.shards[shard_of(a.exchange, a.symbol, self.shard_count)]
+        if event == EStoreUpdater.ON_ADD_STORE_ALERT:
+            shard.alert_count += 1
+        elif event == EStoreUpdater.ON_REMOVE_STORE_ALERT:
+            shard.alert_count -= 1
+        shard.commands.put(AlertEvent(event, alert_fields(a)))
+
+    def relay_outbox(self) -> None:
+        """Deliver the alerts and replies of every shard through the bot"""
+        while True:
+            item: OutboxMessage = self.outbox.get()
+            chat_id, message = item
+            telegram_bot.send_message(chat_id=chat_id, message=message)
+
+    def stats_requested(self, chat_id: int) -> None:
+        lines = []
+        for index, shard in enumerate(self.shards):
+            state = "alive" if shard.process.is_alive() else "exited"
+            lines.append(
+                f"{f'Shard {index + 1}':<15}: pid {shard.process.pid} {state}, "
+                f"{shard.alert_count} alerts, {shard.restarts} restarts\n"
+            )
+        msg = (
+            f"📊 SHARD STATS\n"
+            f"==========================\n"
+            f"{''.join(lines)}"
+            f"==========================\n"
+        )
+        telegram_bot.send_message(chat_id=chat_id, message=msg)
+        for shard in self.shards:
+            shard.commands.put(StatsRequest(chat_id))
+
+    def series_stats_requested(
+        self, chat_id: int, exchange: str, symbol: Optional[str], page: int
+    ) -> None:
+        request = SeriesStatsRequest(chat_id, exchange, symbol, page)
+        # A symbol lives on one shard, every shard has a page of the exchange
+        if symbol is not None:
+            shard_index = shard_of(exchange, symbol, self.shard_count)
+            self.shards[shard_index].commands.put(request)
+            return
+        for shard in self.shards:
+            shard.commands.put(request)
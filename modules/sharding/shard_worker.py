@@ -0,0 +1,150 @@
+import asyncio
+import os
+import signal
+import threading
+from multiprocessing.queues import Queue
+from typing import Optional
+
+from constants import SHARD_CHECK_INTERVAL_IN_SECONDS
+from core.loggings import logger
+from models.main import Alert
+from modules.exchange import exchanges
+from modules.metrics.metrics_server import metrics_server
+from modules.sharding.shard_protocol import (
+    AlertEvent,
+    OutboxMessage,
+    SeriesStatsRequest,
+    ShardCommand,
+    StatsRequest,
+)
+from modules.startup.pipeline import StartupPipeline
+from modules.store.alerter import Alerter
+from modules.store.garbage_cleaner import GarbageCleaner
+from modules.store.main import Store
+from modules.store.series_export import SeriesExport
+from modules.store.store_updater import StoreUpdater
+from modules.telegram.telegram_bot import telegram_bot
+from modules.telegram.telegram_sender import ChatId
+from modules.timer.timer_service import timer_service
+from settings import METRICS_PORT, SERIES_EXPORT_NAME
+from typings.alert import IAlert
+from typings.enums import Exchange
+from utils.event_emitter import ETelegramEvent, ee
+
+BINANCE_API_KEY = os.getenv("BINANCE_API_KEY")
+BINANCE_SECRET_KEY = os.getenv("BINANCE_SECRET_KEY")
+
+
+class ShardWorker:
+    """One shard of a sharded run: the exchange streams, Store, StoreUpdater
+    and Alerter of the pairs it owns, as main.py runs them for all pairs
+
+    Alert changes come from the coordinator in commit order and are applied on
+    the event loop. Alerts and /stats replies go back to the coordinator, which
+    owns the Telegram bot
+    """
+
+    index: int
+    shard_count: int
+    commands: Queue
+    outbox: Queue
+    loop: asyncio.AbstractEventLoop
+    # Heads the messages sent while answering a /stats request
+    tag: Optional[str]
+
+    def __init__(
+        self, index: int, shard_count: int, commands: Queue, outbox: Queue
+    ) -> None:
+        self.index = index
+        self.shard_count = shard_count
+        self.commands = commands
+        self.outbox = outbox
+        self.tag = None
+        self.coordinator_pid = os.getppid()
+
+    async def run(self, alerts: list[IAlert]) -> None:
+        self.loop = asyncio.get_running_loop()
+        telegram_bot.relay(self.send)
+        logger.info(f"Starting shard {self.index + 1}/{self.shard_count}")
+
+        pipeline = StartupPipeline()
+        await pipeline.run(
+            "metrics", metrics_server.start(port=METRICS_PORT + 1 + self.index)
+        )
+        exchange = exchanges[Exchange.Binance]
+        await pipeline.run(
+            "exchange",
+            exchange.start(api_key=BINANCE_API_KEY, secret_key=BINANCE_SECRET_KEY),
+        )
+        timer_service.schedule(
+            "coordinator",
+            self.check_coordinator,
+            interval_in_seconds=SHARD_CHECK_INTERVAL_IN_SECONDS,
+        )
+
+        store = Store(show_users=False)
+        series_export = None
+        if SERIES_EXPORT_NAME is not None:
+            series_export = SeriesExport(f"{SERIES_EXPORT_NAME}_{self.index + 1}")
+        store_updater = StoreUpdater(store, series_export=series_export)
+        alerter = Alerter(store)
+        garbage_cleaner = GarbageCleaner(store, alerter)
+        await pipeline.run("alerter", alerter.start())
+        await pipeline.run("garbage_cleaner", garbage_cleaner.start())
+        # Changes read from here on apply on top of the alerts the shard was
+        # started with, those are all added before the first one
+        backfills = store_updater.add_alerts([Alert(**a) for a in alerts])
+        threading.Thread(
+            target=self.read_commands, name="shard-commands", daemon=True
+        ).start()
+        await pipeline.run("series", asyncio.gather(*backfills))
+        pipeline.finish()
+
+        await asyncio.Event().wait()
+
+    def read_commands(self) -> None:
+        while True:
+            command: ShardCommand = self.commands.get()
+            self.loop.call_soon_threadsafe(self.apply, command)
+
+    def apply(self, command: ShardCommand) -> None:
+        if isinstance(command, AlertEvent):
+            ee.emit(command.event, Alert(**command.alert))
+        elif isinstance(command, StatsRequest):
+            self.emit_tagged(ETelegramEvent.STATS, command.chat_id)
+        elif isinstance(command, SeriesStatsRequest):
+            self.emit_tagged(ETelegramEvent.SERIES_STATS, *command)
+
+    def emit_tagged(self, event: str, *args) -> None:
+        # Every handler replies before emit returns, alerts cannot slip in
+        self.tag = f"🧩 SHARD {self.index + 1}/{self.shard_count}"
+        try:
+            ee.emit(event, *args)
+        finally:
+            self.tag = None
+
+    def send(self, chat_id: ChatId, message: str) -> None:
+        if self.tag is not None:
+            message = f"{self.tag}\n{message}"
+        item: OutboxMessage = (chat_id, message)
+        self.outbox.put(item)
+
+    async def check_coordinator(self) -> None:
+        # Orphaned shards would stream and alert with nowhere to send to
+        if os.getppid() != self.coordinator_pid:
+            logger.error(f"Coordinator exited, stopping shard {self.index + 1}")
+            os._exit(1)
+
+
+def run_shard(
+    index: int,
+    shard_count: int,
+    alerts: list[IAlert],
+    commands: Queue,
+    outbox: Queue,
+) -> None:
+    """Entry point of a shard process"""
+    # Ctrl+C reaches the whole process group, the coordinator stops the shards
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    worker = ShardWorker(index, shard_count, commands, outbox)
+    asyncio.run(worker.run(alerts))
@@ -0,0 +1,74 @@
+import time
+from typing import Any, Awaitable, Optional, TypeVar
+
+from core.loggings import logger
+from modules.telegram.telegram_bot import telegram_bot
+from typings.alert import SeriesKey
+from utils.event_emitter import EStoreUpdater, ETelegramEvent, ee
+
+T = TypeVar("T")
+
+
+def round_or_none(seconds: Optional[float]) -> Optional[float]:
+    return None if seconds is None else round(seconds, 3)
+
+
+class StartupPipeline:
+    """Times each startup stage and how soon the first alert can be evaluated"""
+
+    started_at: float
+    timings: dict[str, float]
+    first_evaluable_alert: Optional[float]
+    warm_series: int
+    finished_at: Optional[float]
+
+    def __init__(self) -> None:
+        self.started_at = time.perf_counter()
+        self.timings = {}
+        self.first_evaluable_alert = None
+        self.warm_series = 0
+        self.finished_at = None
+        ee.on(EStoreUpdater.ON_SERIES_READY, self.on_series_ready)
+        ee.on(ETelegramEvent.STATS, self.stats_requested)
+
+    async def run(self, stage: str, awaitable: Awaitable[T]) -> T:
+        start = time.perf_counter()
+        try:
+            return await awaitable
+        finally:
+            self.timings[stage] = time.perf_counter() - start
+            logger.info(f"Startup stage {stage} took {self.timings[stage]:.3f}s")
+
+    def on_series_ready(self, series_key: SeriesKey) -> None:
+        self.warm_series += 1
+        if self.first_evaluable_alert is None:
+            self.first_evaluable_alert = time.perf_counter() - self.started_at
+            logger.info(
+                f"First alert evaluable after {self.first_evaluable_alert:.3f}s "
+                f"on {series_key}"
+            )
+
+    def finish(self) -> None:
+        self.finished_at = time.perf_counter() - self.started_at
+        logger.info(f"Startup finished after {self.finished_at:.3f}s: {self.report()}")
+
+    def report(self) -> dict[str, Any]:
+        """Seconds since startup, None for milestones not reached yet"""
+        return {
+            "stages": {stage: round(t, 3) for stage, t in self.timings.items()},
+            "first_evaluable_alert": round_or_none(self.first_evaluable_alert),
+            "ready": round_or_none(self.finished_at),
+        }
+
+    def stats_requested(self, chat_id: int) -> None:
+        report = self.report()
+        msg = (
+            f"📊 STARTUP STATS\n"
+            f"==========================\n"
+            f"{'Stages':<15}: {report['stages']}\n"
+            f"{'First alert':<15}: {report['first_evaluable_alert']}\n"
+            f"{'All ready':<15}: {report['ready']}\n"
+            f"{'Warm series':<15}: {self.warm_series}\n"
+            f"==========================\n"
+        )
+        telegram_bot.send_message(chat_id=chat_id, message=msg)
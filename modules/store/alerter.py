@@ -1,67 +1,155 @@
-import asyncio
-from collections import OrderedDict
+import time
 from datetime import datetime, timezone
 from decimal import Decimal
-from statistics import fmean
+from typing import Literal, Optional
 
+from modules.metrics.registry import metrics
+from modules.store.batch_evaluator import BatchEvaluator
 from modules.store.main import Store
+from modules.store.volume_series import VolumeSeries
 from modules.telegram.telegram_bot import telegram_bot
-from utils.decorators import set_interval
-from utils.event_emitter import ETelegramEvent, ee
+from modules.timer.timer_service import timer_service
+from typings.alert import IAlert, SeriesKey
+from utils.event_emitter import CandlestickRecord, ETelegramEvent, ee, market_data
+from utils.fixed_point import alert_volume, from_fixed
+
+# Below this many alerts on a series a plain loop beats the array set-up
+MIN_BATCH_ALERTS = 8
+
+evaluation_duration = metrics.histogram(
+    "tidehunter_alert_evaluation_seconds",
+    "Time spent evaluating the alerts of a batch of kline updates",
+).labels()
+alerts_fired = metrics.counter(
+    "tidehunter_alerts_fired", "Alerts sent to Telegram"
+).labels()
 
 
 class Alerter:
     store: Store
     last_alerts: dict[str, int]
+    mode: Literal["tick", "event"]
+    batch_evaluator: BatchEvaluator
 
-    def __init__(self, store: Store):
+    def __init__(self, store: Store, mode: Literal["tick", "event"] = "event"):
         self.store = store
         self.last_alerts = {}
+        # Key and date of the most recent alert sent
+        self.last_alert: Optional[tuple[str, datetime]] = None
+        self.mode = mode
+        self.batch_evaluator = BatchEvaluator(store)
         ee.on(ETelegramEvent.STATS, self.stats_requested)
 
     async def start(self) -> None:
-        asyncio.create_task(self.on_tick())
+        if self.mode == "event":
+            # Subscribed after StoreUpdater so the series are already updated
+            market_data.candlesticks.subscribe(self.on_candlesticks)
+        else:
+            timer_service.schedule("alerter", self.on_tick, interval_in_seconds=2)
 
     def stats_requested(self, chat_id: int):
+        last_alert = "-"
+        if self.last_alert is not None:
+            key, date = self.last_alert
+            last_alert = f"{key} at {date:%Y-%m-%d %H:%M:%S}"
         msg = (
             f"📊 ALERTER STATS\n"
             f"==========================\n"
-            f"{'Last alerts':<15}: {self.last_alerts}\n"
+            f"{'Mode':<15}: {self.mode}\n"
+            f"{'Alerts fired':<15}: {int(alerts_fired.value)}\n"
+            f"{'Open candles':<15}: {len(self.last_alerts)} alerted\n"
+            f"{'Last alert':<15}: {last_alert}\n"
             f"==========================\n"
         )
         telegram_bot.send_message(chat_id=chat_id, message=msg)
 
-    @set_interval(interval_in_seconds=2, interval_type="dynamic")
     async def on_tick(self) -> None:
-        data = self.store.data
-        alerts = self.store.alerts
-        for a in alerts.values():
-            candle_len = a["candle_len"]
-            delta_percent = Decimal(a["delta"]) / Decimal(100)
-
-            volumes: OrderedDict = data[a["exchange"]][a["symbol"]][a["timeframe"]]
-            volume_values = list(volumes.values())
-            if not len(volume_values):
-                return
-            current_volume = volume_values[-1]
-            avg_volume = Decimal(fmean(volume_values[-candle_len - 1 : -1]))
-            alert_volume = avg_volume + (avg_volume * delta_percent)
-
-            if current_volume >= alert_volume:
-                key = a["key"]
-                current_time = list(volumes)[-1]
-                last_alert_time = self.last_alerts.get(key, 0)
-
-                if current_time > last_alert_time:
-                    self.last_alerts[key] = current_time
-                    msg = (
-                        f"🚨 ALERT TRIGGERED\n"
-                        f"==========================\n"
-                        f"{'Date':<15}: {datetime.now(tz=timezone.utc):%Y-%m-%d %H:%M:%S}\n"
-                        f"{'Alert key':<15}: {a['key']}\n"
-                        f"{'Alert volume':<15}: {alert_volume:.3f}\n"
-                        f"{'Trigger delta':<15}: {Decimal(a['delta']):.3f}%\n"
-                        f"{'Average volume':<15}: {avg_volume:.3f}\n"
-                        f"==========================\n"
-                    )
-                    telegram_bot.send_message(message=msg)
+        start = time.perf_counter()
+        for series_key in list(self.store.series_alerts):
+            self.evaluate_series(series_key)
+        evaluation_duration.observe(time.perf_counter() - start)
+
+    def on_candlesticks(self, records: list[CandlestickRecord]) -> None:
+        start = time.perf_counter()
+        # Each series is evaluated once per batch, with the open times it got
+        series_open_times: dict[SeriesKey, set[int]] = {}
+        for r in records:
+            series_key = (r.exchange, r.symbol, r.timeframe)
+            series_open_times.setdefault(series_key, set()).add(r.open_time)
+        for series_key, open_times in series_open_times.items():
+            self.evaluate_series(series_key, open_times)
+        evaluation_duration.observe(time.perf_counter() - start)
+
+    def evaluate_series(
+        self, series_key: SeriesKey, open_times: Optional[set[int]] = None
+    ) -> None:
+        alerts = self.store.series_alerts.get(series_key)
+        if not alerts:
+            return
+        exchange, symbol, timeframe = series_key
+        volumes = self.store.data[exchange][symbol][timeframe]
+        if not volumes.ready:
+            return
+
+        offsets = [0]
+        # The closing update of a candle batched with the first update of the
+        # next one is evaluated on the closed candle first
+        if open_times is not None and any(
+            volumes.offset_of(open_time) == 1 for open_time in open_times
+        ):
+            offsets = [1, 0]
+
+        for offset in offsets:
+            if len(alerts) >= MIN_BATCH_ALERTS:
+                for a, window_sum, count, threshold in self.batch_evaluator.evaluate(
+                    series_key, volumes, offset
+                ):
+                    self.trigger(a, volumes, window_sum, count, threshold, offset)
+            else:
+                for a in list(alerts.values()):
+                    self.evaluate(a, volumes, offset)
+
+    def evaluate(self, a: IAlert, volumes: VolumeSeries, offset: int = 0) -> None:
+        # Not enough candles yet to average
+        if len(volumes) - offset < 2:
+            return
+        _, current_volume = volumes.candle(offset)
+        window_sum, count = volumes.window_sum(a["candle_len"], offset)
+        threshold = alert_volume(window_sum, count, a["delta"])
+
+        if current_volume >= threshold:
+            self.trigger(a, volumes, window_sum, count, threshold, offset)
+
+    def trigger(
+        self,
+        a: IAlert,
+        volumes: VolumeSeries,
+        window_sum: int,
+        count: int,
+        threshold: int,
+        offset: int = 0,
+    ) -> None:
+        key = a["key"]
+        current_time, _ = volumes.candle(offset)
+        last_alert_time = self.last_alerts.get(key, 0)
+
+        # Alert at most once per candle
+        if current_time > last_alert_time:
+            self.last_alerts[key] = current_time
+            # Converted to decimals only for display
+            avg_volume = from_fixed(window_sum, volumes.digits) / count
+            alert_volume = from_fixed(threshold, volumes.digits)
+            date = datetime.now(tz=timezone.utc)
+            self.last_alert = (key, date)
+            msg = (
+                f"🚨 ALERT TRIGGERED\n"
+                f"==========================\n"
+                f"{'Date':<15}: {date:%Y-%m-%d %H:%M:%S}\n"
+                f"{'Alert key':<15}: {a['key']}\n"
+                f"{'Alert volume':<15}: {alert_volume:.3f}\n"
+                f"{'Trigger delta':<15}: {Decimal(a['delta']):.3f}%\n"
+                f"{'Average volume':<15}: {avg_volume:.3f}\n"
+                f"==========================\n"
+            )
+            telegram_bot.send_message(message=msg)
+            alerts_fired.inc()
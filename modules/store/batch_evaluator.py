@@ -0,0 +1,97 @@
+from typing import Optional
+
+import numpy as np
+
+from models.main import Alert
+from modules.store.main import Store
+from modules.store.volume_series import VolumeSeries
+from typings.alert import IAlert, SeriesKey
+from utils.event_emitter import EStoreUpdater, ee
+from utils.fixed_point import alert_volume
+
+INT64_MAX = np.iinfo(np.int64).max
+
+
+def alert_volumes(
+    window_sums: np.ndarray, counts: np.ndarray, deltas: np.ndarray
+) -> np.ndarray:
+    """Volumes an open candle has to reach to alert, see fixed_point.alert_volume"""
+    # int64 products would wrap silently past this, Python ints keep the
+    # thresholds of huge windows exact
+    if int(window_sums.max()) > INT64_MAX // (100 + int(deltas.max())):
+        return np.array(
+            [
+                alert_volume(int(window_sum), int(count), int(delta))
+                for window_sum, count, delta in zip(window_sums, counts, deltas)
+            ],
+            dtype=object,
+        )
+    return -(-(window_sums * (100 + deltas)) // (100 * counts))
+
+
+class SeriesAlertBatch:
+    """Alerts sharing a series, laid out as arrays"""
+
+    alerts: list[IAlert]
+    candle_lens: np.ndarray
+    deltas: np.ndarray
+
+    def __init__(self, alerts: list[IAlert]) -> None:
+        self.alerts = alerts
+        self.candle_lens = np.array([a["candle_len"] for a in alerts], dtype=np.int64)
+        self.deltas = np.array([a["delta"] for a in alerts], dtype=np.int64)
+
+    def __len__(self) -> int:
+        return len(self.alerts)
+
+
+class BatchEvaluator:
+    """Check every alert of a series with array operations on its prefix sums"""
+
+    store: Store
+    batches: dict[SeriesKey, SeriesAlertBatch]
+
+    def __init__(self, store: Store) -> None:
+        self.store = store
+        self.batches = {}
+        ee.on(EStoreUpdater.ON_ADD_STORE_ALERT, self.on_alert_changed)
+        ee.on(EStoreUpdater.ON_REMOVE_STORE_ALERT, self.on_alert_changed)
+
+    def on_alert_changed(self, a: Alert) -> None:
+        # Rebuilt from Store.series_alerts on the next evaluation
+        self.batches.pop((a.exchange, a.symbol, a.timeframe), None)
+
+    def get_batch(self, series_key: SeriesKey) -> Optional[SeriesAlertBatch]:
+        batch = self.batches.get(series_key)
+        if batch is None:
+            alerts = self.store.series_alerts.get(series_key)
+            if not alerts:
+                return None
+            batch = SeriesAlertBatch(list(alerts.values()))
+            self.batches[series_key] = batch
+        return batch
+
+    def evaluate(
+        self, series_key: SeriesKey, volumes: VolumeSeries, offset: int = 0
+    ) -> list[tuple[IAlert, int, int, int]]:
+        """Alerts over their threshold on the candle offset candles before the
+        latest, with their window sum, count and threshold
+        """
+        batch = self.get_batch(series_key)
+        # Not enough candles yet to average
+        if batch is None or len(volumes) - offset < 2:
+            return []
+
+        slot = (volumes.head - offset) % volumes.capacity
+        prefix = np.frombuffer(volumes.prefix, dtype=np.int64)
+        counts = np.minimum(batch.candle_lens, len(volumes) - 1 - offset)
+        starts = (slot - counts) % volumes.capacity
+        window_sums = prefix[slot] - prefix[starts]
+        thresholds = alert_volumes(window_sums, counts, batch.deltas)
+
+        current_volume = volumes.volumes[slot]
+        fired = np.flatnonzero(current_volume >= thresholds)
+        return [
+            (batch.alerts[i], int(window_sums[i]), int(counts[i]), int(thresholds[i]))
+            for i in fired
+        ]
@@ -0,0 +1,23 @@
+from typing import Iterable, Union
+
+from constants import MAX_CANDLE_LEN
+from typings.enums import Timeframe
+from utils.candlestick import interval_in_ms
+
+
+def can_roll_up(base: Union[str, Timeframe], timeframe: Union[str, Timeframe]) -> bool:
+    """Whether the open candle of timeframe can be summed from base candles"""
+    base_interval = interval_in_ms(Timeframe(base))
+    interval = interval_in_ms(Timeframe(timeframe))
+    # The whole open candle has to fit in the base volume buffer
+    return (
+        interval > base_interval
+        and interval % base_interval == 0
+        and interval <= base_interval * MAX_CANDLE_LEN[base]
+    )
+
+
+def split_timeframes(timeframes: Iterable[str]) -> tuple[str, set[str]]:
+    """The finest timeframe to stream and the ones that can be rolled up from it"""
+    base = min(timeframes, key=lambda tf: interval_in_ms(Timeframe(tf)))
+    return base, {tf for tf in timeframes if can_roll_up(base, tf)}
@@ -0,0 +1,193 @@
+import asyncio
+import sqlite3
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional
+
+from constants import DEFAULT_VOLUME_DIGITS
+from settings import KLINE_CACHE_PATH
+
+Series = tuple[str, str, str]
+SeriesCandle = tuple[str, str, str, int]
+
+
+class KlineCache:
+    """On-disk copy of the candle volumes so a restart only fetches the gap"""
+
+    pending: dict[SeriesCandle, int]
+    pending_digits: dict[Series, int]
+    pending_listings: dict[Series, int]
+    # Digits recorded for the series, only touched on the executor thread
+    digits: dict[Series, int]
+
+    def __init__(self, path: str = KLINE_CACHE_PATH) -> None:
+        # Latest volume of every candle updated since the last flush, and the
+        # digits of the series they belong to
+        self.pending = {}
+        self.pending_digits = {}
+        self.pending_listings = {}
+        self.digits = {}
+        # SQLite work runs on one dedicated thread, off the event loop
+        self.executor = ThreadPoolExecutor(max_workers=1)
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        # The shards of a sharded run share the file and take turns writing
+        self.connection.execute("PRAGMA busy_timeout=5000")
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS kline_volume ("
+            "exchange TEXT NOT NULL, symbol TEXT NOT NULL, timeframe TEXT NOT NULL, "
+            "open_time INTEGER NOT NULL, volume INTEGER NOT NULL, "
+            "PRIMARY KEY (exchange, symbol, timeframe, open_time)"
+            ") WITHOUT ROWID"
+        )
+        # Decimal places of the cached volumes of each series
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS kline_digits ("
+            "exchange TEXT NOT NULL, symbol TEXT NOT NULL, timeframe TEXT NOT NULL, "
+            "digits INTEGER NOT NULL, PRIMARY KEY (exchange, symbol, timeframe)"
+            ") WITHOUT ROWID"
+        )
+        # Open time of the first candle the exchange has of a series listed
+        # after the window started, there is nothing to fetch before it
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS kline_listing ("
+            "exchange TEXT NOT NULL, symbol TEXT NOT NULL, timeframe TEXT NOT NULL, "
+            "open_time INTEGER NOT NULL, PRIMARY KEY (exchange, symbol, timeframe)"
+            ") WITHOUT ROWID"
+        )
+        self.connection.commit()
+
+    def append(
+        self,
+        exchange: str,
+        symbol: str,
+        timeframe: str,
+        open_time: int,
+        volume: int,
+        digits: int,
+    ) -> None:
+        self.pending[(exchange, symbol, timeframe, open_time)] = volume
+        self.pending_digits[(exchange, symbol, timeframe)] = digits
+
+    def set_listing(
+        self, exchange: str, symbol: str, timeframe: str, open_time: int
+    ) -> None:
+        """Record the first candle of a series, the exchange has none before"""
+        self.pending_listings[(exchange, symbol, timeframe)] = open_time
+
+    def remove(self, exchange: str, symbol: str, timeframe: str) -> None:
+        """Forget a series that is no longer watched"""
+        series = (exchange, symbol, timeframe)
+        self.pending = {
+            candle: volume
+            for candle, volume in self.pending.items()
+            if candle[:3] != series
+        }
+        self.pending_digits.pop(series, None)
+        self.pending_listings.pop(series, None)
+        self.executor.submit(self._delete, series)
+
+    async def flush(self) -> None:
+        if not len(self.pending) and not len(self.pending_listings):
+            return
+        rows = [(*candle, volume) for candle, volume in self.pending.items()]
+        listings = [
+            (*series, open_time)
+            for series, open_time in self.pending_listings.items()
+        ]
+        series_digits = self.pending_digits
+        self.pending = {}
+        self.pending_digits = {}
+        self.pending_listings = {}
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(
+            self.executor, self._write, rows, series_digits, listings
+        )
+
+    def _write(
+        self,
+        rows: list[tuple],
+        series_digits: dict[Series, int],
+        listings: list[tuple],
+    ) -> None:
+        with self.connection:
+            for series, digits in series_digits.items():
+                self._rescale(series, digits)
+            self.connection.executemany(
+                "INSERT OR REPLACE INTO kline_volume VALUES (?, ?, ?, ?, ?)", rows
+            )
+            self.connection.executemany(
+                "INSERT OR REPLACE INTO kline_listing VALUES (?, ?, ?, ?)", listings
+            )
+
+    async def load(
+        self, exchange: str, symbol: str, timeframe: str, start_time: int, digits: int
+    ) -> tuple[Optional[int], list[tuple[int, int]]]:
+        """Open time of the first candle of the series if it was recorded, and
+        the cached (open_time, volume) from start_time onwards, with digits
+        decimal places
+        """
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            self.executor, self._read, (exchange, symbol, timeframe), start_time, digits
+        )
+
+    def _read(
+        self, series: Series, start_time: int, digits: int
+    ) -> tuple[Optional[int], list[tuple[int, int]]]:
+        with self.connection:
+            # Candles older than the window are never read again
+            self.connection.execute(
+                "DELETE FROM kline_volume WHERE exchange = ? AND symbol = ? "
+                "AND timeframe = ? AND open_time < ?",
+                (*series, start_time),
+            )
+            self._rescale(series, digits)
+        cursor = self.connection.execute(
+            "SELECT open_time, volume FROM kline_volume WHERE exchange = ? "
+            "AND symbol = ? AND timeframe = ? ORDER BY open_time",
+            series,
+        )
+        rows = cursor.fetchall()
+        listing = self.connection.execute(
+            "SELECT open_time FROM kline_listing WHERE exchange = ? AND symbol = ? "
+            "AND timeframe = ?",
+            series,
+        ).fetchone()
+        return None if listing is None else listing[0], rows
+
+    def _delete(self, series: Series) -> None:
+        with self.connection:
+            for table in ("kline_volume", "kline_digits", "kline_listing"):
+                self.connection.execute(
+                    f"DELETE FROM {table} WHERE exchange = ? AND symbol = ? "
+                    "AND timeframe = ?",
+                    series,
+                )
+        self.digits.pop(series, None)
+
+    def _rescale(self, series: Series, digits: int) -> None:
+        """Bring the cached volumes of a series to digits decimal places, the
+        digits of a symbol follow its volume and can change between runs
+        """
+        if self.digits.get(series) == digits:
+            return
+        row = self.connection.execute(
+            "SELECT digits FROM kline_digits WHERE exchange = ? AND symbol = ? "
+            "AND timeframe = ?",
+            series,
+        ).fetchone()
+        # Rows cached before the digits were recorded have the default ones
+        cached_digits = DEFAULT_VOLUME_DIGITS if row is None else row[0]
+        if cached_digits != digits:
+            operator = "*" if cached_digits < digits else "/"
+            self.connection.execute(
+                f"UPDATE kline_volume SET volume = volume {operator} ? "
+                "WHERE exchange = ? AND symbol = ? AND timeframe = ?",
+                (10 ** abs(digits - cached_digits), *series),
+            )
+        self.connection.execute(
+            "INSERT OR REPLACE INTO kline_digits VALUES (?, ?, ?, ?)",
+            (*series, digits),
+        )
+        self.digits[series] = digits
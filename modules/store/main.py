@@ -1,48 +1,123 @@
-from sqlmodel import Session, select
+import math
+from itertools import islice
+from typing import Optional
 
-from models.main import User, UserAlertLink, engine
+from constants import STATS_PAGE_SIZE
+from models.dal import subscription_writer
+from modules.store.volume_series import VolumeSeries
 from modules.telegram.telegram_bot import telegram_bot
-from typings.alert import IAlert
+from modules.telegram.user_directory import user_directory
+from typings.alert import IAlert, SeriesKey
 from utils.event_emitter import ETelegramEvent, ee
 
 
 class Store:
-    data: dict
+    # exchange -> symbol -> timeframe -> volumes
+    data: dict[str, dict[str, dict[str, VolumeSeries]]]
     alerts: dict[str, IAlert]
+    # Alerts keyed by the series they watch
+    series_alerts: dict[SeriesKey, dict[str, IAlert]]
+    # Kept current by StoreUpdater so that /stats never walks the data
+    series_count: int
+    ready_series: int
+    candles: int
+    # Failed attempts and monotonic retry time of the series whose history
+    # could not be downloaded, StoreUpdater retries them
+    failed_backfills: dict[SeriesKey, tuple[int, float]]
 
-    def __init__(self):
+    def __init__(self, show_users: bool = True):
         self.data = {}
         self.alerts = {}
+        self.series_alerts = {}
+        self.series_count = 0
+        self.ready_series = 0
+        self.candles = 0
+        self.failed_backfills = {}
+        # The shards of a sharded run leave the database to the coordinator
+        self.show_users = show_users
         ee.on(ETelegramEvent.STATS, self.stats_requested)
+        ee.on(ETelegramEvent.SERIES_STATS, self.series_stats_requested)
 
     def stats_requested(self, chat_id: int):
-        users, user_alert_links = self.query_users()
-
-        display_data: dict = {}
-        for exchange, symbols in self.data.items():
-            for symbol, timeframes in symbols.items():
-                if not display_data.get(exchange):
-                    display_data[exchange] = {}
-                _symbols: dict = display_data[exchange]
-                if not _symbols.get(symbol):
-                    timeframe_volume = []
-                    for timeframe, volumes in timeframes.items():
-                        timeframe_volume.append((timeframe, len(volumes)))
-                    _symbols[symbol] = timeframe_volume
-
+        symbols = sum(len(symbols) for symbols in self.data.values())
         msg = (
             f"📊 STORE STATS\n"
             f"==========================\n"
-            f"{'Alerts':<15}: {list(self.alerts)}\n"
-            f"{'Data':<15}: {display_data}\n"
-            f"{'Users':<15}: {users}\n"
-            f"{'UserAlertLinks':<15}: {user_alert_links}\n"
-            f"==========================\n"
+            f"{'Exchanges':<15}: {len(self.data)}\n"
+            f"{'Symbols':<15}: {symbols}\n"
+            f"{'Series':<15}: {self.series_count}, {self.ready_series} ready\n"
+            f"{'Failed loads':<15}: {len(self.failed_backfills)}\n"
+            f"{'Candles held':<15}: {self.candles}\n"
+            f"{'Alerts':<15}: {len(self.alerts)}\n"
+        )
+        if self.show_users:
+            # Counted once the links stage of the startup has run
+            links = subscription_writer.links
+            msg += (
+                f"{'Users':<15}: {len(user_directory.users)}\n"
+                f"{'UserAlertLinks':<15}: {'-' if links is None else links}\n"
+            )
+        msg += (
+            "==========================\n"
+            "/stats <exchange> [page] for its symbols\n"
+            "/stats <exchange> <symbol> for its series\n"
         )
         telegram_bot.send_message(chat_id=chat_id, message=msg)
 
-    def query_users(self) -> tuple[list[User], list[UserAlertLink]]:
-        with Session(engine) as session:
-            users = session.exec(select(User)).all()
-            user_alert_links = session.exec(select(UserAlertLink)).all()
-            return users, user_alert_links
+    def series_stats_requested(
+        self, chat_id: int, exchange: str, symbol: Optional[str], page: int
+    ) -> None:
+        if symbol is None:
+            msg = self.symbols_page(exchange, page)
+        else:
+            msg = self.symbol_series(exchange, symbol)
+        telegram_bot.send_message(chat_id=chat_id, message=msg)
+
+    def symbols_page(self, exchange: str, page: int) -> str:
+        """One line per symbol, STATS_PAGE_SIZE symbols from the page"""
+        symbols = self.data.get(exchange, {})
+        pages = max(math.ceil(len(symbols) / STATS_PAGE_SIZE), 1)
+        page = min(max(page, 1), pages)
+        start = (page - 1) * STATS_PAGE_SIZE
+        end = start + STATS_PAGE_SIZE
+        lines = []
+        for symbol, timeframes in islice(symbols.items(), start, end):
+            candles = sum(len(volumes) for volumes in timeframes.values())
+            alerts = sum(
+                len(self.series_alerts.get((exchange, symbol, timeframe), {}))
+                for timeframe in timeframes
+            )
+            lines.append(
+                f"{symbol:<15}: {len(timeframes)} series, {candles} candles, "
+                f"{alerts} alerts\n"
+            )
+        body = "".join(lines) or "No series\n"
+        return (
+            f"📊 STORE STATS {exchange} page {page}/{pages}\n"
+            f"==========================\n"
+            f"{body}"
+            f"==========================\n"
+        )
+
+    def symbol_series(self, exchange: str, symbol: str) -> str:
+        lines = []
+        for timeframe, volumes in self.data.get(exchange, {}).get(symbol, {}).items():
+            alerts = len(self.series_alerts.get((exchange, symbol, timeframe), {}))
+            failed = self.failed_backfills.get((exchange, symbol, timeframe))
+            if volumes.ready:
+                state = "ready"
+            elif failed is not None:
+                state = f"load failed {failed[0]}x, retrying"
+            else:
+                state = "loading"
+            lines.append(
+                f"{timeframe:<15}: {len(volumes)}/{volumes.capacity} candles, "
+                f"{state}, {alerts} alerts\n"
+            )
+        body = "".join(lines) or "No series\n"
+        return (
+            f"📊 STORE STATS {exchange} {symbol}\n"
+            f"==========================\n"
+            f"{body}"
+            f"==========================\n"
+        )
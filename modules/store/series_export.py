@@ -0,0 +1,372 @@
+"""Live volume series mirrored into shared memory for other local processes
+
+Layout, every word a little-endian int64:
+
+Index segment `<name>`:
+    header  INDEX_HEADER_WORDS words: seq, layout version, slots, series count
+    slots   ENTRY.size bytes each: exchange, symbol and timeframe as NUL-padded
+            UTF-8, then the capacity of the series, an empty exchange is a
+            free slot
+
+Series segment `<name>_<exchange>_<symbol>_<timeframe>`:
+    header      SERIES_HEADER_WORDS words: seq, layout version, capacity, head,
+                size, digits, interval in ms, ready, removed
+    open_times  capacity words, a ring buffer like VolumeSeries, the latest
+                candle at head and the oldest size - 1 slots before it
+    volumes     capacity words, fixed-point with digits decimal places
+
+Both seq words are seqlocks: the bot makes them odd while it writes and even
+again after. A read is consistent when seq was even before it and unchanged
+after it. A removed series keeps its segment mapped for readers still
+holding it, with removed set, and the name is unlinked
+"""
+import struct
+from multiprocessing import resource_tracker
+from multiprocessing.shared_memory import SharedMemory
+from typing import Optional
+
+import numpy as np
+
+from constants import SERIES_EXPORT_SLOTS
+from core.loggings import logger
+from modules.store.volume_series import VolumeSeries
+from typings.alert import SeriesKey
+
+LAYOUT_VERSION = 1
+WORD = 8
+
+INDEX_HEADER_WORDS = 8
+INDEX_SEQ, INDEX_VERSION, INDEX_SLOTS, INDEX_COUNT = range(4)
+ENTRY = struct.Struct("<16s32s8sq")
+
+SERIES_HEADER_WORDS = 16
+(
+    SEQ,
+    VERSION,
+    CAPACITY,
+    HEAD,
+    SIZE,
+    DIGITS,
+    INTERVAL,
+    READY,
+    REMOVED,
+) = range(9)
+
+
+def series_segment_name(name: str, series_key: SeriesKey) -> str:
+    exchange, symbol, timeframe = series_key
+    return f"{name}_{exchange}_{symbol}_{timeframe}"
+
+
+def create_segment(name: str, size: int) -> SharedMemory:
+    try:
+        return SharedMemory(name=name, create=True, size=size)
+    except FileExistsError:
+        # Left behind by a run that did not shut down cleanly
+        stale = SharedMemory(name=name)
+        stale.close()
+        stale.unlink()
+        return SharedMemory(name=name, create=True, size=size)
+
+
+class ExportedSeries:
+    """The shared memory segment of one series and what it last copied"""
+
+    segment: SharedMemory
+    words: memoryview
+    open_times: memoryview
+    volumes: memoryview
+    # The VolumeSeries copied from, a backfilled series replaces the object
+    source: Optional[VolumeSeries]
+    latest_open_time: int
+
+    def __init__(self, segment: SharedMemory, capacity: int) -> None:
+        self.segment = segment
+        buf = segment.buf
+        assert buf is not None
+        start = SERIES_HEADER_WORDS * WORD
+        middle = start + capacity * WORD
+        self.words = buf[:start].cast("q")
+        self.open_times = buf[start:middle].cast("q")
+        self.volumes = buf[middle : middle + capacity * WORD].cast("q")
+        self.source = None
+        self.latest_open_time = 0
+
+    def release(self) -> None:
+        # The segment cannot close while views of it are alive
+        self.words.release()
+        self.open_times.release()
+        self.volumes.release()
+        self.segment.close()
+
+
+class SeriesExport:
+    """Writes every live volume series of a Store into shared memory
+
+    Only ever called from the event loop thread, there is a single writer. An
+    update copies the candles that changed, a replaced or resized series is
+    copied whole
+    """
+
+    name: str
+    index: SharedMemory
+    index_buf: memoryview
+    index_words: memoryview
+    slots: dict[SeriesKey, int]
+    free_slots: list[int]
+    exported: dict[SeriesKey, ExportedSeries]
+
+    def __init__(self, name: str, slots: int = SERIES_EXPORT_SLOTS) -> None:
+        self.name = name
+        self.index = create_segment(
+            name, INDEX_HEADER_WORDS * WORD + slots * ENTRY.size
+        )
+        assert self.index.buf is not None
+        self.index_buf = self.index.buf
+        self.index_words = self.index_buf[: INDEX_HEADER_WORDS * WORD].cast("q")
+        self.index_words[INDEX_VERSION] = LAYOUT_VERSION
+        self.index_words[INDEX_SLOTS] = slots
+        self.slots = {}
+        self.free_slots = list(range(slots - 1, -1, -1))
+        self.exported = {}
+        self.full = False
+        logger.info(f"Exporting volume series to shared memory {name}")
+
+    def sync(
+        self, series_key: SeriesKey, volumes: VolumeSeries, open_time: int
+    ) -> None:
+        """Copy the candles changed by an update of open_time"""
+        exported = self.exported.get(series_key)
+        if exported is None or exported.source is not volumes:
+            self.copy(series_key, volumes)
+            return
+        if not volumes.size:
+            return
+
+        words = exported.words
+        capacity = volumes.capacity
+        latest_open_time = volumes.open_times[volumes.head]
+        # Candles appended since the last copy, gaps included, or the one
+        # updated in place
+        appended = (latest_open_time - exported.latest_open_time) // volumes.interval
+        if appended > 0:
+            offsets = range(min(appended, capacity) - 1, -1, -1)
+        else:
+            offset = volumes.offset_of(open_time)
+            offsets = range(0) if offset is None else range(offset, offset + 1)
+
+        words[SEQ] += 1
+        for offset in offsets:
+            slot = (volumes.head - offset) % capacity
+            exported.open_times[slot] = volumes.open_times[slot]
+            exported.volumes[slot] = volumes.volumes[slot]
+        words[HEAD] = volumes.head
+        words[SIZE] = volumes.size
+        words[READY] = volumes.ready
+        words[SEQ] += 1
+        exported.latest_open_time = latest_open_time
+
+    def copy(self, series_key: SeriesKey, volumes: VolumeSeries) -> None:
+        """Copy a whole series, creating its segment the first time"""
+        exported = self.exported.get(series_key)
+        if exported is not None and len(exported.open_times) != volumes.capacity:
+            self.remove(series_key)
+            exported = None
+        if exported is None:
+            exported = self.create(series_key, volumes)
+            if exported is None:
+                return
+
+        words = exported.words
+        words[SEQ] += 1
+        exported.open_times[:] = volumes.open_times
+        exported.volumes[:] = volumes.volumes
+        words[HEAD] = volumes.head
+        words[SIZE] = volumes.size
+        words[DIGITS] = volumes.digits
+        words[INTERVAL] = volumes.interval
+        words[READY] = volumes.ready
+        words[SEQ] += 1
+        exported.source = volumes
+        exported.latest_open_time = volumes.open_times[volumes.head]
+
+    def create(
+        self, series_key: SeriesKey, volumes: VolumeSeries
+    ) -> Optional[ExportedSeries]:
+        if not len(self.free_slots):
+            if not self.full:
+                logger.warning(
+                    f"Shared memory index {self.name} is full, series past "
+                    f"{len(self.slots)} are not exported"
+                )
+                self.full = True
+            return None
+
+        capacity = volumes.capacity
+        segment = create_segment(
+            series_segment_name(self.name, series_key),
+            (SERIES_HEADER_WORDS + 2 * capacity) * WORD,
+        )
+        exported = ExportedSeries(segment, capacity)
+        exported.words[VERSION] = LAYOUT_VERSION
+        exported.words[CAPACITY] = capacity
+        self.exported[series_key] = exported
+
+        slot = self.free_slots.pop()
+        self.slots[series_key] = slot
+        exchange, symbol, timeframe = series_key
+        self.write_entry(
+            slot,
+            ENTRY.pack(
+                str(exchange).encode(),
+                symbol.encode(),
+                str(timeframe).encode(),
+                capacity,
+            ),
+            1,
+        )
+        return exported
+
+    def remove(self, series_key: SeriesKey) -> None:
+        exported = self.exported.pop(series_key, None)
+        if exported is None:
+            return
+        exported.words[SEQ] += 1
+        exported.words[REMOVED] = 1
+        exported.words[SEQ] += 1
+        exported.release()
+        exported.segment.unlink()
+
+        slot = self.slots.pop(series_key)
+        self.write_entry(slot, bytes(ENTRY.size), -1)
+        self.free_slots.append(slot)
+        self.full = False
+
+    def write_entry(self, slot: int, entry: bytes, change: int) -> None:
+        start = INDEX_HEADER_WORDS * WORD + slot * ENTRY.size
+        self.index_words[INDEX_SEQ] += 1
+        self.index_buf[start : start + ENTRY.size] = entry
+        self.index_words[INDEX_COUNT] += change
+        self.index_words[INDEX_SEQ] += 1
+
+    def close(self) -> None:
+        for series_key in list(self.exported):
+            self.remove(series_key)
+        self.index_words.release()
+        self.index.close()
+        self.index.unlink()
+
+
+def attach_segment(name: str) -> SharedMemory:
+    segment = SharedMemory(name=name)
+    # Python tracks attached segments like created ones and would unlink them
+    # when the reader exits, they belong to the bot
+    resource_tracker.unregister(segment._name, "shared_memory")  # type: ignore
+    return segment
+
+
+class SharedSeries:
+    """Zero-copy view of an exported series
+
+    open_times and volumes are the live ring buffers. Read them between
+    begin() and a False valid(seq), or take a snapshot() copy
+    """
+
+    segment: SharedMemory
+    words: np.ndarray
+    open_times: np.ndarray
+    volumes: np.ndarray
+
+    def __init__(self, segment: SharedMemory) -> None:
+        self.segment = segment
+        header = np.ndarray(SERIES_HEADER_WORDS, dtype="<i8", buffer=segment.buf)
+        capacity = int(header[CAPACITY])
+        start = SERIES_HEADER_WORDS * WORD
+        self.words = header
+        self.open_times = np.ndarray(
+            capacity, dtype="<i8", buffer=segment.buf, offset=start
+        )
+        self.volumes = np.ndarray(
+            capacity, dtype="<i8", buffer=segment.buf, offset=start + capacity * WORD
+        )
+        self.capacity = capacity
+        self.digits = int(header[DIGITS])
+        self.interval = int(header[INTERVAL])
+
+    def begin(self) -> int:
+        """seq to check with valid() once done reading"""
+        while True:
+            seq = int(self.words[SEQ])
+            if not seq % 2:
+                return seq
+
+    def valid(self, seq: int) -> bool:
+        return int(self.words[SEQ]) == seq
+
+    @property
+    def removed(self) -> bool:
+        return bool(self.words[REMOVED])
+
+    def snapshot(self) -> tuple[np.ndarray, np.ndarray, bool]:
+        """(open_times, volumes, ready) from the oldest to the latest candle"""
+        while True:
+            seq = self.begin()
+            head = int(self.words[HEAD])
+            size = int(self.words[SIZE])
+            ready = bool(self.words[READY])
+            slots = np.arange(head - size + 1, head + 1) % self.capacity
+            open_times = self.open_times[slots]
+            volumes = self.volumes[slots]
+            if self.valid(seq):
+                return open_times, volumes, ready
+
+    def close(self) -> None:
+        del self.words, self.open_times, self.volumes
+        self.segment.close()
+
+
+class SeriesReader:
+    """Maps the series a running bot exports under name"""
+
+    name: str
+    index: SharedMemory
+
+    def __init__(self, name: str) -> None:
+        self.name = name
+        self.index = attach_segment(name)
+        self.header = np.ndarray(INDEX_HEADER_WORDS, dtype="<i8", buffer=self.index.buf)
+        if int(self.header[INDEX_VERSION]) != LAYOUT_VERSION:
+            raise ValueError(f"Unsupported shared memory layout in {name}")
+
+    def series(self) -> list[SeriesKey]:
+        """Series exported right now"""
+        buf = self.index.buf
+        assert buf is not None
+        slots = int(self.header[INDEX_SLOTS])
+        start = INDEX_HEADER_WORDS * WORD
+        while True:
+            seq = int(self.header[INDEX_SEQ])
+            if seq % 2:
+                continue
+            entries = buf[start : start + slots * ENTRY.size].tobytes()
+            if int(self.header[INDEX_SEQ]) == seq:
+                break
+
+        keys: list[SeriesKey] = []
+        for exchange, symbol, timeframe, _ in ENTRY.iter_unpack(entries):
+            if exchange[0]:
+                keys.append(
+                    (
+                        exchange.rstrip(b"\0").decode(),
+                        symbol.rstrip(b"\0").decode(),
+                        timeframe.rstrip(b"\0").decode(),
+                    )
+                )
+        return keys
+
+    def open(self, series_key: SeriesKey) -> SharedSeries:
+        return SharedSeries(attach_segment(series_segment_name(self.name, series_key)))
+
+    def close(self) -> None:
+        del self.header
+        self.index.close()
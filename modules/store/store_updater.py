@@ -1,41 +1,123 @@
-from collections import OrderedDict
-from decimal import Decimal
+import asyncio
+import time
+from typing import Any, Coroutine, Optional
 
 from sqlmodel import Session, select
 
-from constants import MAX_CANDLE_LEN
+from constants import (
+    BACKFILL_MAX_RETRY_DELAY_IN_SECONDS,
+    BACKFILL_RETRY_CHECK_IN_SECONDS,
+    BACKFILL_RETRY_DELAY_IN_SECONDS,
+    MAX_CANDLE_LEN,
+)
+from core.loggings import logger
+from models.dal import run_db
 from models.main import Alert, engine
 from modules.exchange import exchanges
+from modules.metrics.registry import metrics
+from modules.store.candle_rollup import split_timeframes
+from modules.store.kline_cache import KlineCache
 from modules.store.main import Store
+from modules.store.series_export import SeriesExport
+from modules.store.volume_series import VolumeSeries
+from modules.timer.timer_service import timer_service
+from typings.alert import IAlert, SeriesKey
 from typings.enums import Timeframe
-from typings.exchange import ISocketEmit
 from utils.candlestick import (
+    get_candlestick_start_time,
     get_latest_incomplete_candlestick_start_time,
     interval_in_ms,
 )
-from utils.event_emitter import EExchange, EStoreUpdater, ee
+from utils.event_emitter import CandlestickRecord, EStoreUpdater, ee, market_data
+from utils.fixed_point import to_fixed
+
+store_update_latency = metrics.histogram(
+    "tidehunter_store_update_latency_seconds",
+    "Time from the exchange event to the store update",
+    buckets=(0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0),
+).labels()
+backfill_failures = metrics.counter(
+    "tidehunter_backfill_failures", "Series history downloads that failed"
+).labels()
+
+
+def first_uncached(
+    cached: list[tuple[int, int]],
+    start_time: int,
+    interval: int,
+    listing: Optional[int] = None,
+) -> int:
+    """Open time to backfill from: the first candle missing from the cache, a
+    hole left by downtime between two flushes included, or else the last
+    cached candle as it may have been cached while still open
+
+    Nothing is missing before the listing of a series, when it is known
+    """
+    expected_open_time = start_time if listing is None else max(start_time, listing)
+    for open_time, _ in cached:
+        if open_time > expected_open_time:
+            return expected_open_time
+        expected_open_time = open_time + interval
+    return cached[-1][0] if len(cached) else start_time
 
 
 class StoreUpdater:
     store: Store
+    loop: asyncio.AbstractEventLoop
+    kline_cache: KlineCache
+    # Timeframes streamed from the exchange per (exchange, symbol)
+    streams: dict[tuple[str, str], set[str]]
+    # Base timeframe and the timeframes rolled up from it per (exchange, symbol)
+    rollups: dict[tuple[str, str], tuple[str, set[str]]]
+    series_export: Optional[SeriesExport]
 
-    def __init__(self, store: Store) -> None:
+    def __init__(
+        self,
+        store: Store,
+        kline_cache: Optional[KlineCache] = None,
+        series_export: Optional[SeriesExport] = None,
+    ) -> None:
         self.store = store
+        self.streams = {}
+        self.rollups = {}
+        self.kline_cache = kline_cache or KlineCache()
+        self.series_export = series_export
+        timer_service.schedule(
+            "kline_cache", self.kline_cache.flush, interval_in_seconds=5
+        )
+        timer_service.schedule(
+            "backfill_retry",
+            self.retry_backfills,
+            interval_in_seconds=BACKFILL_RETRY_CHECK_IN_SECONDS,
+        )
 
-        with Session(engine) as session:
-            alerts = session.exec(select(Alert)).all()
-            for a in alerts:
-                self.on_add_store_alert(a)
-                self.on_add_store_data(a)
         ee.on(EStoreUpdater.ON_ADD_STORE_ALERT, self.on_add_store_alert)
-        ee.on(EStoreUpdater.ON_REMOVE_STORE_DATA, self.on_remove_store_alert)
+        ee.on(EStoreUpdater.ON_REMOVE_STORE_ALERT, self.on_remove_store_alert)
         ee.on(EStoreUpdater.ON_ADD_STORE_DATA, self.on_add_store_data)
         ee.on(EStoreUpdater.ON_REMOVE_STORE_DATA, self.on_remove_store_data)
-        ee.on(EExchange.CANDLESTICK_EVENT, self.on_candlestick_event)
+        market_data.candlesticks.subscribe(self.on_candlesticks)
+
+    async def load(self) -> None:
+        """Add every stored alert, then warm all of their series concurrently"""
+        alerts = await run_db(self.query_alerts)
+        await asyncio.gather(*self.add_alerts(alerts))
+
+    def add_alerts(self, alerts: list[Alert]) -> list[Coroutine[Any, Any, None]]:
+        """Add alerts and their series, return the backfills still to run"""
+        backfills = []
+        for a in alerts:
+            self.on_add_store_alert(a)
+            if self.add_series(a):
+                backfills.append(self.backfill(a.exchange, a.symbol, a.timeframe))
+        return backfills
+
+    def query_alerts(self) -> list[Alert]:
+        with Session(engine) as session:
+            return session.exec(select(Alert)).all()
 
     def on_add_store_alert(self, a: Alert) -> None:
         alerts = self.store.alerts
-        alerts[a.key] = {
+        alert: IAlert = {
             "key": a.key,
             "exchange": a.exchange,
             "symbol": a.symbol,
@@ -43,12 +125,25 @@ class StoreUpdater:
             "candle_len": a.candle_len,
             "delta": a.delta,
         }
+        alerts[a.key] = alert
+        series_key = (a.exchange, a.symbol, a.timeframe)
+        self.store.series_alerts.setdefault(series_key, {})[a.key] = alert
 
     def on_remove_store_alert(self, a: Alert) -> None:
         alerts = self.store.alerts
         del alerts[a.key]
+        series_key = (a.exchange, a.symbol, a.timeframe)
+        series_alerts = self.store.series_alerts[series_key]
+        del series_alerts[a.key]
+        if not len(series_alerts):
+            del self.store.series_alerts[series_key]
 
     def on_add_store_data(self, a: Alert) -> None:
+        if self.add_series(a):
+            asyncio.create_task(self.backfill(a.exchange, a.symbol, a.timeframe))
+
+    def add_series(self, a: Alert) -> bool:
+        """Create the series of an alert, return whether it has to be backfilled"""
         data = self.store.data
         if not data.get(a.exchange):
             data[a.exchange] = {}
@@ -56,68 +151,198 @@ class StoreUpdater:
         if not symbols.get(a.symbol):
             symbols[a.symbol] = {}
         timeframes: dict = symbols[a.symbol]
-        if not timeframes.get(a.timeframe):
-            timeframes[a.timeframe] = OrderedDict()
-        volumes: OrderedDict = timeframes[a.timeframe]
-
-        # Add only absent data in the store
-        if not len(volumes):
-            timeframe = Timeframe(a.timeframe)
-            latest_candle_start_time = get_latest_incomplete_candlestick_start_time(
-                timeframe
-            )
-            start_time = latest_candle_start_time - (
-                interval_in_ms(timeframe) * MAX_CANDLE_LEN[timeframe]
-            )
+        # An empty series is falsy, test for the key instead
+        if a.timeframe in timeframes:
+            return False
+        digits = exchanges[a.exchange].symbol_index.volume_digits(a.symbol)
+        timeframes[a.timeframe] = VolumeSeries(a.timeframe, digits)
+        self.store.series_count += 1
+        # Stream live candles right away, the history is merged in later
+        self.update_streams(a.exchange, a.symbol)
+        return True
 
-            exchange = exchanges[a.exchange]
-            klines = exchange.client.get_historical_klines(
-                a.symbol.upper(), a.timeframe, start_time
-            )
-            for kline in klines:
-                open_time: int = kline[0]
-                volume = Decimal(kline[5])
-                volumes[open_time] = volume
-            self.add_socket(a)
-
-    def add_socket(self, a: Alert) -> None:
-        task_key = f"{a.symbol.upper()}_{a.timeframe}"
-        exchange = exchanges[a.exchange]
-
-        # Add only absent listener in the socket
-        if exchange.tasks.get(task_key) is None:
-            exchange.schedule_task(exchange.add_symbol, a.symbol, a.timeframe)
-
-    def on_candlestick_event(self, socket_data: ISocketEmit) -> None:
-        exchange = socket_data["exchange"]
-        symbol = socket_data["symbol"]
-        timeframe = socket_data["timeframe"]
-        open_time = socket_data["open_time"]
-        volume = socket_data["volume"]
+    async def backfill(self, exchange_name: str, symbol: str, timeframe: str) -> None:
+        series_key = (exchange_name, symbol, timeframe)
+        interval = Timeframe(timeframe)
+        latest_candle_start_time = get_latest_incomplete_candlestick_start_time(
+            interval
+        )
+        start_time = latest_candle_start_time - (
+            interval_in_ms(interval) * MAX_CANDLE_LEN[interval]
+        )
 
-        data = self.store.data
-        data[exchange][symbol][timeframe][open_time] = volume
+        timeframes = self.store.data.get(exchange_name, {}).get(symbol, {})
+        if timeframe not in timeframes:
+            return
+        digits = timeframes[timeframe].digits
+        window_start_time = start_time
+        listing, cached = await self.kline_cache.load(
+            exchange_name, symbol, timeframe, start_time, digits
+        )
+        start_time = first_uncached(
+            cached, start_time, interval_in_ms(interval), listing
+        )
 
-    def on_remove_store_data(self, a: Alert) -> None:
-        with Session(engine) as session:
-            statement = (
-                select(Alert)
-                .where(Alert.exchange == a.exchange)
-                .where(Alert.symbol == a.symbol)
-                .where(Alert.timeframe == a.timeframe)
+        exchange = exchanges[exchange_name]
+        try:
+            klines = await exchange.backfiller.fetch(symbol, interval, start_time)
+        except Exception as ex:
+            self.backfill_failed(series_key, ex)
+            return
+
+        timeframes = self.store.data.get(exchange_name, {}).get(symbol, {})
+        live_volumes = timeframes.get(timeframe)
+        # The series was removed while the history was downloading
+        if live_volumes is None:
+            return
+        self.store.failed_backfills.pop(series_key, None)
+        # Fetched from the window start, the history begins where the symbol
+        # was listed, restarts have no need to fetch the window up to there
+        listed_in_window = len(klines) > 0 and klines[0][0] > window_start_time
+        if start_time == window_start_time and listed_in_window:
+            self.kline_cache.set_listing(exchange_name, symbol, timeframe, klines[0][0])
+
+        volumes = VolumeSeries(interval, digits)
+        for open_time, volume in cached:
+            volumes.update(open_time, volume)
+        for kline in klines:
+            open_time = kline[0]
+            # Quote asset volume, as carried by the kline socket
+            volume = to_fixed(kline[7], volumes.digits)
+            volumes.update(open_time, volume)
+            self.kline_cache.append(
+                exchange_name, symbol, timeframe, open_time, volume, volumes.digits
             )
-            alerts = session.exec(statement).all()
+        # Candles streamed during the download are the most recent values
+        for open_time, volume in live_volumes:
+            volumes.update(open_time, volume)
+        volumes.ready = True
+        timeframes[timeframe] = volumes
+        self.store.candles += len(volumes) - len(live_volumes)
+        # Backfills of a series removed and added again can overlap
+        if not live_volumes.ready:
+            self.store.ready_series += 1
+        if self.series_export is not None:
+            self.series_export.copy(series_key, volumes)
+        # A loaded base series can take over the streams of coarser timeframes
+        self.update_streams(exchange_name, symbol)
+        ee.emit(EStoreUpdater.ON_SERIES_READY, series_key)
+
+    def backfill_failed(self, series_key: SeriesKey, ex: Exception) -> None:
+        """Schedule another attempt, the series stays loading until one works"""
+        exchange, symbol, timeframe = series_key
+        # The series was removed while the history was downloading
+        if timeframe not in self.store.data.get(exchange, {}).get(symbol, {}):
+            return
+        attempts = self.store.failed_backfills.get(series_key, (0, 0.0))[0] + 1
+        delay = min(
+            BACKFILL_RETRY_DELAY_IN_SECONDS * 2 ** (attempts - 1),
+            BACKFILL_MAX_RETRY_DELAY_IN_SECONDS,
+        )
+        self.store.failed_backfills[series_key] = (attempts, time.monotonic() + delay)
+        backfill_failures.inc()
+        logger.error(
+            f"Backfill of {symbol} {timeframe} failed {attempts} times, "
+            f"retrying in {delay}s: {ex}"
+        )
+
+    async def retry_backfills(self) -> None:
+        now = time.monotonic()
+        due = [
+            series_key
+            for series_key, (_, retry_at) in self.store.failed_backfills.items()
+            if retry_at <= now
+        ]
+        await asyncio.gather(*(self.backfill(*series_key) for series_key in due))
 
-            # Remove OrderedDict if no associated alert
-            if not len(alerts):
-                self.remove_socket(a)
-                data = self.store.data
-                del data[a.exchange][a.symbol][a.timeframe]
+    def update_streams(self, exchange: str, symbol: str) -> None:
+        """Stream the finest timeframe of a symbol and roll the others up from it"""
+        symbol_key = (exchange, symbol)
+        timeframes = self.store.data.get(exchange, {}).get(symbol, {})
+        streams = set(timeframes)
+        self.rollups.pop(symbol_key, None)
+        if len(timeframes):
+            base, derived = split_timeframes(timeframes)
+            # Until its history is loaded the base cannot sum a whole open candle
+            if timeframes[base].ready and len(derived):
+                self.rollups[symbol_key] = (base, derived)
+                streams -= derived
 
-    def remove_socket(self, a: Alert) -> None:
-        task_key = f"{a.symbol.upper()}_{a.timeframe}"
-        exchange = exchanges[a.exchange]
+        current_streams = self.streams.pop(symbol_key, set())
+        if len(streams):
+            self.streams[symbol_key] = streams
+        stream_scheduler = exchanges[exchange].stream_scheduler
+        for timeframe in streams - current_streams:
+            stream_scheduler.add(symbol, timeframe)
+        for timeframe in current_streams - streams:
+            stream_scheduler.remove(symbol, timeframe)
 
-        # Remove only present listener in the socket
-        if exchange.tasks.get(task_key) is not None:
-            exchange.remove_symbol(a.symbol, a.timeframe)
+    def on_candlesticks(self, records: list[CandlestickRecord]) -> None:
+        now = time.time() * 1000
+        for r in records:
+            self.on_candlestick(r)
+            store_update_latency.observe((now - r.event_time) / 1000)
+
+    def on_candlestick(self, r: CandlestickRecord) -> None:
+        exchange = r.exchange
+        symbol = r.symbol
+        timeframe = r.timeframe
+        open_time = r.open_time
+
+        timeframes = self.store.data.get(exchange, {}).get(symbol, {})
+        volumes = timeframes.get(timeframe)
+        # A candle still in flight for a removed series
+        if volumes is None:
+            return
+        size = volumes.size
+        volumes.update(open_time, r.volume)
+        self.store.candles += volumes.size - size
+        self.kline_cache.append(
+            exchange, symbol, timeframe, open_time, r.volume, volumes.digits
+        )
+        if self.series_export is not None:
+            self.series_export.sync((exchange, symbol, timeframe), volumes, open_time)
+
+        rollup = self.rollups.get((exchange, symbol))
+        if rollup is None or rollup[0] != timeframe:
+            return
+        latest_open_time = volumes.latest()[0]
+        for derived_timeframe in rollup[1]:
+            derived = Timeframe(derived_timeframe)
+            derived_open_time = get_candlestick_start_time(open_time, derived)
+            volume = volumes.sum_since(derived_open_time)
+            # A late update of a closed base candle is rolled up into the
+            # closed derived candle holding it, less the base candles after it
+            next_open_time = derived_open_time + interval_in_ms(derived)
+            if next_open_time <= latest_open_time:
+                # Its first base candles have left the buffer
+                if volumes.offset_of(derived_open_time) is None:
+                    continue
+                volume -= volumes.sum_since(next_open_time)
+            # Delivered with the next batch
+            market_data.candlesticks.publish(
+                exchange,
+                symbol,
+                derived_timeframe,
+                derived_open_time,
+                volume,
+                r.event_time,
+            )
+
+    def on_remove_store_data(self, a: Alert) -> None:
+        # Remove VolumeSeries if no associated alert, the alert itself is
+        # already out of the index
+        if (a.exchange, a.symbol, a.timeframe) not in self.store.series_alerts:
+            timeframes = self.store.data[a.exchange][a.symbol]
+            volumes = timeframes.pop(a.timeframe)
+            self.store.failed_backfills.pop((a.exchange, a.symbol, a.timeframe), None)
+            self.store.series_count -= 1
+            if volumes.ready:
+                self.store.ready_series -= 1
+            self.store.candles -= len(volumes)
+            if not len(timeframes):
+                del self.store.data[a.exchange][a.symbol]
+            if self.series_export is not None:
+                self.series_export.remove((a.exchange, a.symbol, a.timeframe))
+            self.kline_cache.remove(a.exchange, a.symbol, a.timeframe)
+            self.update_streams(a.exchange, a.symbol)
@@ -0,0 +1,135 @@
+from array import array
+from typing import Iterator, Optional, Union
+
+from constants import DEFAULT_VOLUME_DIGITS, MAX_CANDLE_LEN
+from typings.enums import Timeframe
+from utils.candlestick import interval_in_ms
+
+
+class VolumeSeries:
+    """Fixed-capacity ring buffer of candle volumes ordered by open time
+
+    Volumes are fixed-point integers with `digits` decimal places
+    """
+
+    timeframe: Timeframe
+    digits: int
+    interval: int
+    capacity: int
+    open_times: array
+    volumes: array
+    prefix: array
+    head: int
+    size: int
+    ready: bool
+
+    def __init__(
+        self, timeframe: Union[str, Timeframe], digits: int = DEFAULT_VOLUME_DIGITS
+    ) -> None:
+        self.timeframe = Timeframe(timeframe)
+        self.digits = digits
+        self.interval = interval_in_ms(self.timeframe)
+        # The open candle is held next to the complete ones
+        self.capacity = MAX_CANDLE_LEN[self.timeframe] + 1
+        self.open_times = array("q", bytes(8 * self.capacity))
+        self.volumes = array("q", bytes(8 * self.capacity))
+        # Sum of the complete volumes before each candle, window sums are a
+        # difference of two entries
+        self.prefix = array("q", bytes(8 * self.capacity))
+        self.head = -1
+        self.size = 0
+        # Set once the history is loaded, alerts wait for a full window
+        self.ready = False
+
+    def __len__(self) -> int:
+        return self.size
+
+    def __iter__(self) -> Iterator[tuple[int, int]]:
+        """Yield (open_time, volume) from the oldest to the latest candle"""
+        for offset in range(self.size - 1, -1, -1):
+            slot = (self.head - offset) % self.capacity
+            yield self.open_times[slot], self.volumes[slot]
+
+    def latest(self) -> tuple[int, int]:
+        return self.open_times[self.head], self.volumes[self.head]
+
+    def candle(self, offset: int = 0) -> tuple[int, int]:
+        """(open_time, volume) of the candle offset candles before the latest"""
+        slot = (self.head - offset) % self.capacity
+        return self.open_times[slot], self.volumes[slot]
+
+    def offset_of(self, open_time: int) -> Optional[int]:
+        """How many candles before the latest one a held candle opened"""
+        if not self.size:
+            return None
+        offset = (self.open_times[self.head] - open_time) // self.interval
+        if not 0 <= offset < self.size:
+            return None
+        return offset
+
+    def window_sum(self, candle_len: int, offset: int = 0) -> tuple[int, int]:
+        """Sum and count of up to candle_len complete candles before a candle,
+        the open one by default
+        """
+        slot = (self.head - offset) % self.capacity
+        count = min(candle_len, self.size - 1 - offset)
+        start = (slot - count) % self.capacity
+        return self.prefix[slot] - self.prefix[start], count
+
+    def sum_since(self, open_time: int) -> int:
+        """Total volume of the candles opened at or after open_time"""
+        count = (self.open_times[self.head] - open_time) // self.interval
+        if not self.size or count < 0:
+            return 0
+        start = (self.head - min(count, self.size - 1)) % self.capacity
+        return self.prefix[self.head] - self.prefix[start] + self.volumes[self.head]
+
+    def update(self, open_time: int, volume: int) -> None:
+        if not self.size:
+            self._append(open_time, volume)
+            return
+
+        last_open_time = self.open_times[self.head]
+        if open_time == last_open_time:
+            self.volumes[self.head] = volume
+        elif open_time > last_open_time:
+            # Keep the buffer contiguous in time, missed candles hold no volume
+            gap_start = max(
+                last_open_time + self.interval,
+                open_time - (self.capacity - 1) * self.interval,
+            )
+            for gap_open_time in range(gap_start, open_time, self.interval):
+                self._append(gap_open_time, 0)
+            self._append(open_time, volume)
+        else:
+            # A late update of a candle still held in the buffer
+            offset = (last_open_time - open_time) // self.interval
+            if offset < self.size:
+                slot = (self.head - offset) % self.capacity
+                if self.open_times[slot] == open_time:
+                    change = volume - self.volumes[slot]
+                    self.volumes[slot] = volume
+                    # Every later candle counts the corrected volume
+                    for later in range(offset - 1, -1, -1):
+                        self.prefix[(self.head - later) % self.capacity] += change
+
+    def _append(self, open_time: int, volume: int) -> None:
+        # The previous candle is complete once the next one opens
+        prefix = 0
+        if self.size:
+            prefix = self.prefix[self.head] + self.volumes[self.head]
+
+        # Overwrite the oldest slot once the buffer is full
+        self.head = (self.head + 1) % self.capacity
+        self.open_times[self.head] = open_time
+        self.volumes[self.head] = volume
+        self.prefix[self.head] = prefix
+        if self.size < self.capacity:
+            self.size += 1
+
+        # Rebase once per lap so the running sums stay within the window and
+        # far from the int64 limit
+        if self.head == 0:
+            base = self.prefix[(self.head - self.size + 1) % self.capacity]
+            for slot in range(self.capacity):
+                self.prefix[slot] -= base
@@ -1,6 +1,5 @@
 from typing import Optional
 
-from sqlmodel import Session, select
 from telegram.ext import CallbackContext
 from telegram.update import Update
 
@@ -12,8 +11,9 @@ from constants import (
     MIN_DELTA_PERCENT,
     SUBSCRIBE_ARGS_LEN,
 )
-from models.main import Alert, User
-from typings.enums import Exchange, Timeframe, UserRole
+from modules.telegram.user_directory import user_directory
+from typings.enums import Exchange, Timeframe
+from typings.user import IUser
 
 
 def gen_alert_key(
@@ -22,58 +22,35 @@ def gen_alert_key(
     return f"{exchange}_{symbol}_{timeframe}_{candle_len}_{delta}"
 
 
-def validate_is_admin(
-    session: Session, username: str, update: Update
-) -> Optional[User]:
+def validate_is_admin(username: str, update: Update) -> Optional[IUser]:
     assert update.message is not None
 
-    statement = (
-        select(User).where(User.username == username).where(User.role == UserRole.Admin)
-    )
-    user = session.exec(statement).first()
-    if user is None:
+    if not user_directory.is_admin(username):
         update.message.reply_text(f"User {username} is not an admin")
         return None
-    return user
+    return user_directory.get(username)
 
 
-def validate_user_present(
-    session: Session, username: str, update: Update
-) -> Optional[User]:
+def validate_user_present(username: str, update: Update) -> Optional[IUser]:
     assert update.message is not None
 
-    statement = select(User).where(User.username == username)
-    user = session.exec(statement).first()
+    user = user_directory.get(username)
     if user is None:
         update.message.reply_text(f"User {username} does not exist")
         return None
     return user
 
 
-def validate_user_absent(session: Session, username: str, update: Update) -> bool:
+def validate_user_absent(username: str, update: Update) -> bool:
     assert update.message is not None
 
-    statement = select(User).where(User.username == username)
-    user = session.exec(statement).first()
+    user = user_directory.get(username)
     if user is not None:
         update.message.reply_text(f"User {username} already exists")
         return False
     return True
 
 
-def validate_alert_present(
-    session: Session, key: str, update: Update
-) -> Optional[Alert]:
-    assert update.message is not None
-
-    statement = select(Alert).where(Alert.key == key)
-    alert = session.exec(statement).first()
-    if alert is None:
-        update.message.reply_text(f"Alert {key} does not exist")
-        return None
-    return alert
-
-
 def validate_args_len(update: Update, context: CallbackContext) -> Optional[int]:
     assert update.message is not None
     assert context.args is not None
@@ -100,16 +77,25 @@ def validate_exchange(update: Update, context: CallbackContext) -> Optional[str]
     return exchange
 
 
-def validate_symbol(update: Update, context: CallbackContext) -> Optional[str]:
+def validate_symbol(
+    update: Update, context: CallbackContext, trading: bool = False
+) -> Optional[str]:
     assert update.message is not None
     assert context.args is not None
 
     exchange = context.args[0].lower()
     symbol = str(context.args[1].upper())
-    info = modules.exchange.exchanges[exchange].client.get_symbol_info(symbol)
+    symbol_index = modules.exchange.exchanges[exchange].symbol_index
+    if not symbol_index.loaded:
+        update.message.reply_text("Symbols are still loading, try again shortly")
+        return None
+    info = symbol_index.get(symbol)
     if info is None:
         update.message.reply_text(f"Invalid symbol given")
         return None
+    if trading and not symbol_index.is_trading(symbol):
+        update.message.reply_text(f"Symbol {symbol} is not trading ({info['status']})")
+        return None
     return symbol.lower()
 
 
@@ -1,10 +1,7 @@
 import logging
 import os
-import queue
-import threading
-import time
 from datetime import datetime, timezone
-from typing import Callable
+from typing import Callable, Optional
 
 from dotenv import load_dotenv
 from telegram.ext import CallbackContext, CommandHandler, Dispatcher, Updater
@@ -13,22 +10,27 @@ from telegram.update import Update
 from core.extensions import Singleton
 from core.loggings import telegram_logger as logger
 from modules.telegram.telegram_listener import TelegramListener
+from modules.telegram.telegram_sender import ChatId, TelegramSender
+from utils.event_emitter import ETelegramEvent, ee
 
 load_dotenv()
 
 TELEGRAM_API_KEY = os.getenv("TELEGRAM_API_KEY")
 TELEGRAM_GROUP_ID = os.getenv("TELEGRAM_GROUP_ID")
 
-my_queue: queue.Queue = queue.Queue()
-
 
 class TelegramBot(metaclass=Singleton):
     dispatcher: Dispatcher
     updater: Updater
-    queued_msg_started = False
+    sender: TelegramSender
+    # Takes the messages instead of the sender in processes without the bot
+    relay_to: Optional[Callable[[ChatId, str], None]]
 
     def __init__(self) -> None:
         logger.setLevel(logging.INFO)
+        self.sender = TelegramSender(self._send_message)
+        self.relay_to = None
+        ee.on(ETelegramEvent.STATS, self.stats_requested)
 
     def start_bot(self):
         date = datetime.now(tz=timezone.utc)
@@ -52,47 +54,39 @@ class TelegramBot(metaclass=Singleton):
         logger.error(f"Update {update} caused error {context.error}")
 
     def send_message(self, chat_id=TELEGRAM_GROUP_ID, message="blank"):
-        item = {"chat_id": chat_id, "message": message}
-        my_queue.put(item)
-
-        # logger.info(f'Remaining in queue: {my_queue.qsize()}')
-        if not self.queued_msg_started:
-            self.queued_msg_started = True
-            my_thread = threading.Thread(target=self.execute_queue)
-            my_thread.start()
-
-    def execute_queue(self):
-        while not my_queue.empty():
-            item = my_queue.get()
-            # logger.info(item)
-            self._send_message_in_queue(item["chat_id"], item["message"])
-            logger.info(f"Remaining in queue: {my_queue.qsize()}")
-            time.sleep(2)
-        self.queued_msg_started = False
-        logger.info(f"End of queue: {my_queue.qsize()}")
-
-    def _send_message_in_queue(self, chat_id, message="blank"):
-        sleep = 1
-        retry = 0
-        while True:
-            try:
-                message = message.replace("<", "&#60;")
-                message = message.replace(">", "&#62;")
-                self.dispatcher.bot.send_message(
-                    chat_id=chat_id,
-                    text="<pre>" + message + "</pre>",
-                    parse_mode="HTML",
-                )
-            except Exception as ex:
-                print(
-                    f"TELEGRAM SEND FAILED: {retry}... sleeping for {sleep} second(s)\n"
-                    f"{ex}"
-                )
-                time.sleep(sleep)
-                retry += 1
-                sleep += 2
-                continue
-            break
+        if self.relay_to is not None:
+            self.relay_to(chat_id, message)
+            return
+        self.sender.submit(chat_id, message)
+
+    def relay(self, send: Callable[[ChatId, str], None]) -> None:
+        """Hand every message to send, for a process that has no bot of its own"""
+        self.relay_to = send
+
+    def stats_requested(self, chat_id: int) -> None:
+        if self.relay_to is not None:
+            return
+        stats = self.sender.stats()
+        msg = (
+            f"📊 TELEGRAM STATS\n"
+            f"==========================\n"
+            f"{'Queue depth':<15}: {stats['queue_depth']}\n"
+            f"{'Delivered':<15}: {stats['delivered']}\n"
+            f"{'Dropped':<15}: {stats['dropped']}\n"
+            f"{'Latency (s)':<15}: last {stats['last_latency']}, "
+            f"avg {stats['avg_latency']}, max {stats['max_latency']}\n"
+            f"==========================\n"
+        )
+        self.send_message(chat_id=chat_id, message=msg)
+
+    def _send_message(self, chat_id, message="blank"):
+        message = message.replace("<", "&#60;")
+        message = message.replace(">", "&#62;")
+        self.dispatcher.bot.send_message(
+            chat_id=chat_id,
+            text="<pre>" + message + "</pre>",
+            parse_mode="HTML",
+        )
 
     def run_bot(self):
         self.updater.start_polling()
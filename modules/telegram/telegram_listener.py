@@ -1,15 +1,19 @@
 from __future__ import annotations
 
-from sqlmodel import Session, select
+from concurrent.futures import Future
+
+from sqlmodel import Session
 from telegram.ext import CallbackContext
 from telegram.update import Update
 
 import modules.telegram.telegram_bot
+from constants import DEFAULT_PROFILE_SECONDS, MAX_PROFILE_SECONDS
 from core.loggings import telegram_logger as logger
-from models.main import Alert, User, engine
+from models.dal import subscription_writer
+from models.main import engine
+from modules.profiling.sampling_profiler import profiler
 from modules.telegram.command_validators import (
     gen_alert_key,
-    validate_alert_present,
     validate_args_len,
     validate_candle_len,
     validate_delta,
@@ -20,12 +24,25 @@ from modules.telegram.command_validators import (
     validate_user_absent,
     validate_user_present,
 )
+from modules.telegram.user_directory import user_directory
+from typings.alert import IAlert
 from typings.enums import UserRole
-from utils.event_emitter import EStoreUpdater, ETelegramEvent, ee
+from utils.event_emitter import ETelegramEvent, ee
+
+
+def reply_when_written(update: Update, future: Future) -> None:
+    assert update.message is not None
+
+    try:
+        update.message.reply_text(future.result())
+    except Exception as ex:
+        logger.error(f"Subscription write failed: {ex}")
+        update.message.reply_text("Failed to save the change, please try again")
 
 
 class TelegramListener:
     def __init__(self, telegram_bot: modules.telegram.telegram_bot.TelegramBot):
+        self.telegram_bot = telegram_bot
         telegram_bot.on_command("help", self.help_command)
         telegram_bot.on_command("register", self.register_command)
         telegram_bot.on_command("deregister", self.deregister_command)
@@ -33,6 +50,7 @@ class TelegramListener:
         telegram_bot.on_command("unsubscribe", self.unsubscribe_command)
         telegram_bot.on_command("list_subscribed", self.list_subscribed_command)
         telegram_bot.on_command("stats", self.stats_command)
+        telegram_bot.on_command("profile", self.profile_command)
 
     def help_command(self, update: Update, context: CallbackContext) -> None:
         assert update.message is not None
@@ -50,6 +68,11 @@ class TelegramListener:
             f"unsubscribe example: /unsubscribe binance_bnbbtc_1h_50_100\n"
             f"/list_subscribed to list subscribed alerts\n"
             f"/stats for bot stats\n"
+            f"stats format: [<exchange> [<page> | <symbol>]]\n"
+            f"stats example: /stats binance btcusdt\n"
+            f"/profile to profile the bot, mem also traces allocations (slower)\n"
+            f"profile format: <seconds> [mem]\n"
+            f"profile example: /profile 10 mem\n"
         )
         update.message.reply_text(msg)
 
@@ -57,38 +80,36 @@ class TelegramListener:
         assert update.message is not None
         assert context.args is not None
 
-        with Session(engine) as session:
-            admin_username = update.message.from_user.username
-            if not len(context.args):
-                return
-            username = context.args[0]
+        admin_username = update.message.from_user.username
+        if not len(context.args):
+            return
+        username = context.args[0]
 
-            admin = validate_is_admin(session, admin_username, update)
-            user_absent = validate_user_absent(session, username, update)
-            if not admin or not user_absent:
-                return
-            user = User(username=username, role=UserRole.User)
-            session.add(user)
-            session.commit()
-            update.message.reply_text(f"Successfully registered user {username}")
+        admin = validate_is_admin(admin_username, update)
+        user_absent = validate_user_absent(username, update)
+        if not admin or not user_absent:
+            return
+        with Session(engine) as session:
+            user_directory.register(session, username, UserRole.User)
+        update.message.reply_text(f"Successfully registered user {username}")
 
     def deregister_command(self, update: Update, context: CallbackContext) -> None:
         assert update.message is not None
         assert context.args is not None
 
-        with Session(engine) as session:
-            admin_username = update.message.from_user.username
-            if not len(context.args):
-                return
-            username = context.args[0]
+        admin_username = update.message.from_user.username
+        if not len(context.args):
+            return
+        username = context.args[0]
 
-            admin = validate_is_admin(session, admin_username, update)
-            user = validate_user_present(session, username, update)
-            if not admin or user is None:
-                return
-            session.delete(user)
-            session.commit()
-            update.message.reply_text(f"Successfully deregistered user {username}")
+        admin = validate_is_admin(admin_username, update)
+        user = validate_user_present(username, update)
+        if not admin or user is None:
+            return
+        with Session(engine) as session:
+            links = user_directory.deregister(session, username)
+        subscription_writer.links_removed(links)
+        update.message.reply_text(f"Successfully deregistered user {username}")
 
     def subscribe_command(self, update: Update, context: CallbackContext) -> None:
         assert update.message is not None
@@ -99,7 +120,7 @@ class TelegramListener:
         exchange = validate_exchange(update, context)
         if not exchange:
             return
-        symbol = validate_symbol(update, context)
+        symbol = validate_symbol(update, context, trading=True)
         if not symbol:
             return
         timeframe = validate_timeframe(update, context)
@@ -112,31 +133,23 @@ class TelegramListener:
         if not delta:
             return
 
-        with Session(engine) as session:
-            username = update.message.from_user.username
-            user = validate_user_present(session, username, update)
-            if user is None:
-                return
-
-            key = gen_alert_key(exchange, symbol, timeframe, candle_len, delta)
-            statement = select(Alert).where(Alert.key == key)
-            alert = session.exec(statement).first()
-            if alert is None:
-                alert = Alert(
-                    key=key,
-                    exchange=exchange,
-                    symbol=symbol,
-                    timeframe=timeframe,
-                    candle_len=candle_len,
-                    delta=delta,
-                )
+        username = update.message.from_user.username
+        user = validate_user_present(username, update)
+        if user is None:
+            return
 
-            alert.users.append(user)
-            session.add(alert)
-            session.commit()
-            ee.emit(EStoreUpdater.ON_ADD_STORE_ALERT, alert)
-            ee.emit(EStoreUpdater.ON_ADD_STORE_DATA, alert)
-            update.message.reply_text(f"Successfully subscribed to alert {key}")
+        key = gen_alert_key(exchange, symbol, timeframe, candle_len, delta)
+        alert: IAlert = {
+            "key": key,
+            "exchange": exchange,
+            "symbol": symbol,
+            "timeframe": timeframe,
+            "candle_len": candle_len,
+            "delta": delta,
+        }
+        # Replies once the batch holding the change is committed
+        future = subscription_writer.subscribe(user["id"], alert)
+        future.add_done_callback(lambda f: reply_when_written(update, f))
 
     def unsubscribe_command(self, update: Update, context: CallbackContext):
         assert update.message is not None
@@ -160,37 +173,26 @@ class TelegramListener:
         if not delta:
             return
 
-        with Session(engine) as session:
-            username = update.message.from_user.username
-            user = validate_user_present(session, username, update)
-            if user is None:
-                return
-
-            key = gen_alert_key(exchange, symbol, timeframe, candle_len, delta)
-            alert = validate_alert_present(session, key, update)
-            if alert is None:
-                return
-            alert.users.remove(user)
+        username = update.message.from_user.username
+        user = validate_user_present(username, update)
+        if user is None:
+            return
 
-            # No user is associated with the current alert
-            if len(alert.users) == 0:
-                session.delete(alert)
-                ee.emit(EStoreUpdater.ON_REMOVE_STORE_ALERT, alert)
-                ee.emit(EStoreUpdater.ON_REMOVE_STORE_DATA, alert)
-            else:
-                session.add(alert)
-            session.commit()
-            update.message.reply_text(f"Successfully unsubscribed to alert {key}")
+        key = gen_alert_key(exchange, symbol, timeframe, candle_len, delta)
+        future = subscription_writer.unsubscribe(user["id"], key)
+        future.add_done_callback(lambda f: reply_when_written(update, f))
 
     def list_subscribed_command(self, update: Update, context: CallbackContext):
         assert update.message is not None
 
+        username = update.message.from_user.username
+        if validate_user_present(username, update) is None:
+            return
+
         with Session(engine) as session:
-            username = update.message.from_user.username
-            user = validate_user_present(session, username, update)
+            user = user_directory.get_user(session, username)
             if user is None:
                 return
-
             msg = "Subscribed alerts:\n\n"
             for alert in user.alerts:
                 msg += f"key: {alert.key}\n"
@@ -204,14 +206,65 @@ class TelegramListener:
     def stats_command(self, update, context: CallbackContext):
         assert update.message is not None
 
-        with Session(engine) as session:
-            admin_username = update.message.from_user.username
-
-            admin = validate_is_admin(session, admin_username, update)
-            if not admin:
-                return
+        admin_username = update.message.from_user.username
+        admin = validate_is_admin(admin_username, update)
+        if not admin:
+            return
 
         text = str(update.message.text).lower()
         logger.info(f"User ({update.message.chat.id}) says: {text}")
+        args = [arg.lower() for arg in context.args or []]
         update.message.reply_text("CHECKING STATS...")
-        ee.emit(ETelegramEvent.STATS, update.message.chat.id)
+        if not len(args):
+            ee.emit(ETelegramEvent.STATS, update.message.chat.id)
+            return
+
+        # A page of the symbols of an exchange, or the series of one symbol
+        exchange = args[0]
+        symbol = None
+        page = 1
+        if len(args) > 1:
+            if args[1].isdigit():
+                page = int(args[1])
+            else:
+                symbol = args[1]
+        ee.emit(
+            ETelegramEvent.SERIES_STATS, update.message.chat.id, exchange, symbol, page
+        )
+
+    def profile_command(self, update: Update, context: CallbackContext) -> None:
+        assert update.message is not None
+        assert context.args is not None
+
+        admin_username = update.message.from_user.username
+        admin = validate_is_admin(admin_username, update)
+        if not admin:
+            return
+
+        args = [arg.lower() for arg in context.args]
+        memory = "mem" in args
+        if memory:
+            args.remove("mem")
+        seconds = DEFAULT_PROFILE_SECONDS
+        if len(args):
+            if not args[0].isdigit() or not 1 <= int(args[0]) <= MAX_PROFILE_SECONDS:
+                update.message.reply_text(
+                    f"Invalid profile duration, expected 1 to "
+                    f"{MAX_PROFILE_SECONDS} seconds"
+                )
+                return
+            seconds = int(args[0])
+
+        chat_id = update.message.chat.id
+        started = profiler.start(
+            seconds,
+            memory,
+            lambda report: self.telegram_bot.send_message(
+                chat_id=chat_id, message=report
+            ),
+        )
+        if not started:
+            update.message.reply_text("A profile is already running")
+            return
+        logger.info(f"User ({chat_id}) started a {seconds}s profile")
+        update.message.reply_text(f"PROFILING FOR {seconds} SECONDS...")
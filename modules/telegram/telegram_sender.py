@@ -0,0 +1,192 @@
+import asyncio
+import threading
+import time
+from typing import Callable, Optional, Union
+
+from telegram.error import BadRequest, RetryAfter, Unauthorized
+
+from core.loggings import telegram_logger as logger
+from modules.metrics.registry import metrics
+
+# Telegram allows about 30 messages per second overall, one per second in a
+# chat and 20 per minute in a group
+GLOBAL_RATE_PER_SECOND = 30
+CHAT_RATE_PER_SECOND = 1
+GROUP_RATE_PER_MINUTE = 20
+
+MAX_SEND_RETRIES = 5
+MIN_BACKOFF_IN_SECONDS = 1
+MAX_BACKOFF_IN_SECONDS = 30
+
+ChatId = Union[int, str]
+
+queue_depth = metrics.gauge(
+    "tidehunter_telegram_queue_depth", "Telegram messages waiting to be sent"
+).labels()
+send_latency = metrics.histogram(
+    "tidehunter_telegram_send_latency_seconds",
+    "Time from submitting a Telegram message to its delivery",
+    buckets=(0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 300.0),
+).labels()
+
+
+class TokenBucket:
+    """Allows `rate` sends per second with bursts of up to `capacity`"""
+
+    rate: float
+    capacity: float
+    tokens: float
+    updated_at: float
+
+    def __init__(self, rate: float, capacity: float) -> None:
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated_at = time.monotonic()
+
+    def wait_time(self) -> float:
+        """Seconds until a token is available, taking it if there is one"""
+        now = time.monotonic()
+        self.tokens = min(
+            self.capacity, self.tokens + (now - self.updated_at) * self.rate
+        )
+        self.updated_at = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0
+        return (1 - self.tokens) / self.rate
+
+    async def acquire(self) -> None:
+        while True:
+            wait_time = self.wait_time()
+            if not wait_time:
+                return
+            await asyncio.sleep(wait_time)
+
+
+def normalize_chat_id(chat_id: ChatId) -> ChatId:
+    """One id per chat: replies carry ints, TELEGRAM_GROUP_ID comes as a str"""
+    if isinstance(chat_id, str) and chat_id.lstrip("-").isdigit():
+        return int(chat_id)
+    return chat_id
+
+
+def is_group(chat_id: ChatId) -> bool:
+    return str(chat_id).startswith("-")
+
+
+class TelegramSender:
+    """Delivers messages on the event loop, rate limited per chat and overall"""
+
+    send: Callable[[ChatId, str], None]
+    loop: Optional[asyncio.AbstractEventLoop]
+    queues: dict[ChatId, asyncio.Queue]
+    chat_buckets: dict[ChatId, list[TokenBucket]]
+
+    def __init__(self, send: Callable[[ChatId, str], None]) -> None:
+        self.send = send
+        self.loop = None
+        # Messages submitted before the loop is known
+        self.backlog: list[tuple[ChatId, str, float]] = []
+        self.lock = threading.Lock()
+        self.queues = {}
+        self.chat_buckets = {}
+        self.global_bucket = TokenBucket(GLOBAL_RATE_PER_SECOND, GLOBAL_RATE_PER_SECOND)
+
+        self.delivered = 0
+        self.dropped = 0
+        self.last_latency = 0.0
+        self.max_latency = 0.0
+        self.total_latency = 0.0
+
+    async def start(self) -> None:
+        with self.lock:
+            self.loop = asyncio.get_running_loop()
+            for item in self.backlog:
+                self.enqueue(item)
+            self.backlog = []
+
+    def submit(self, chat_id: ChatId, message: str) -> None:
+        """Queue a message, safe to call from any thread"""
+        # Queues and buckets are per chat, whatever type its id comes as
+        item = (normalize_chat_id(chat_id), message, time.monotonic())
+        with self.lock:
+            if self.loop is None:
+                self.backlog.append(item)
+                return
+        self.loop.call_soon_threadsafe(self.enqueue, item)
+
+    def enqueue(self, item: tuple[ChatId, str, float]) -> None:
+        chat_id = item[0]
+        queue = self.queues.get(chat_id)
+        if queue is None:
+            # One worker per chat so a throttled chat never holds up another
+            queue = asyncio.Queue()
+            self.queues[chat_id] = queue
+            self.chat_buckets[chat_id] = [
+                TokenBucket(CHAT_RATE_PER_SECOND, CHAT_RATE_PER_SECOND)
+            ]
+            if is_group(chat_id):
+                self.chat_buckets[chat_id].append(
+                    TokenBucket(GROUP_RATE_PER_MINUTE / 60, GROUP_RATE_PER_MINUTE)
+                )
+            asyncio.create_task(self.run(chat_id, queue))
+        queue.put_nowait(item)
+        queue_depth.inc()
+
+    @property
+    def queue_depth(self) -> int:
+        return sum(queue.qsize() for queue in self.queues.values())
+
+    async def run(self, chat_id: ChatId, queue: asyncio.Queue) -> None:
+        while True:
+            _, message, queued_at = await queue.get()
+            queue_depth.dec()
+            for bucket in self.chat_buckets[chat_id]:
+                await bucket.acquire()
+            await self.global_bucket.acquire()
+
+            if await self.deliver(chat_id, message):
+                latency = time.monotonic() - queued_at
+                self.delivered += 1
+                self.last_latency = latency
+                self.max_latency = max(self.max_latency, latency)
+                self.total_latency += latency
+                send_latency.observe(latency)
+            else:
+                self.dropped += 1
+
+    async def deliver(self, chat_id: ChatId, message: str) -> bool:
+        backoff = MIN_BACKOFF_IN_SECONDS
+        for retry in range(MAX_SEND_RETRIES):
+            try:
+                await asyncio.to_thread(self.send, chat_id, message)
+                return True
+            except RetryAfter as ex:
+                # Flood control says exactly how long to wait
+                wait_time = ex.retry_after
+            except (BadRequest, Unauthorized) as ex:
+                logger.error(f"Telegram send to {chat_id} rejected: {ex}")
+                return False
+            except Exception as ex:
+                wait_time = backoff
+                backoff = min(backoff * 2, MAX_BACKOFF_IN_SECONDS)
+                logger.warning(f"Telegram send to {chat_id} failed: {ex}")
+            logger.info(
+                f"Telegram send retry {retry + 1}/{MAX_SEND_RETRIES} "
+                f"in {wait_time} second(s)"
+            )
+            await asyncio.sleep(wait_time)
+        logger.error(f"Telegram send to {chat_id} dropped after {MAX_SEND_RETRIES}")
+        return False
+
+    def stats(self) -> dict:
+        avg_latency = self.total_latency / self.delivered if self.delivered else 0
+        return {
+            "queue_depth": self.queue_depth,
+            "delivered": self.delivered,
+            "dropped": self.dropped,
+            "last_latency": round(self.last_latency, 3),
+            "avg_latency": round(avg_latency, 3),
+            "max_latency": round(self.max_latency, 3),
+        }
@@ -0,0 +1,75 @@
+import threading
+from typing import Optional
+
+from sqlmodel import Session, select
+
+from core.extensions import Singleton
+from core.loggings import telegram_logger as logger
+from models.main import User, engine
+from typings.enums import UserRole
+from typings.user import IUser
+
+
+class UserDirectory(metaclass=Singleton):
+    """Users and their roles held in memory, written through on every change"""
+
+    users: dict[str, IUser]
+
+    def __init__(self) -> None:
+        # Keyed by the Telegram username
+        self.users = {}
+        self.lock = threading.Lock()
+
+    def load(self) -> None:
+        with Session(engine) as session:
+            users = session.exec(select(User)).all()
+            with self.lock:
+                self.users = {}
+                for user in users:
+                    self.add(user)
+        logger.info(f"Loaded {len(self.users)} users")
+
+    def add(self, user: User) -> None:
+        self.users[user.username] = {
+            "id": user.id,
+            "username": user.username,
+            "role": user.role,
+        }
+
+    def register(self, session: Session, username: str, role: UserRole) -> User:
+        """Insert a user and add it to the directory once committed"""
+        with self.lock:
+            user = User(username=username, role=role)
+            session.add(user)
+            session.commit()
+            self.add(user)
+        return user
+
+    def deregister(self, session: Session, username: str) -> int:
+        """Delete a user, return how many alert links went with it"""
+        links = 0
+        with self.lock:
+            user = self.get_user(session, username)
+            if user is not None:
+                links = len(user.alerts)
+                session.delete(user)
+                session.commit()
+            self.users.pop(username, None)
+        return links
+
+    def get(self, username: str) -> Optional[IUser]:
+        return self.users.get(username)
+
+    def get_user(self, session: Session, username: str) -> Optional[User]:
+        """The database row of a user, for commands that write"""
+        user = self.get(username)
+        if user is None:
+            return None
+        return session.get(User, user["id"])
+
+    def is_admin(self, username: str) -> bool:
+        user = self.get(username)
+        return user is not None and user["role"] == UserRole.Admin
+
+
+user_directory = UserDirectory()
@@ -0,0 +1,184 @@
+import asyncio
+import heapq
+import itertools
+import time
+from typing import Awaitable, Callable, Optional
+
+from core.loggings import logger
+from modules.telegram.telegram_bot import telegram_bot
+from typings.enums import Timeframe
+from utils.candlestick import get_candlestick_start_time, interval_in_ms
+from utils.event_emitter import ETelegramEvent, ee
+
+
+class TimerJob:
+    """A coroutine run on absolute deadlines, see TimerService.schedule"""
+
+    name: str
+    callback: Callable[[], Awaitable[None]]
+    interval_in_seconds: Optional[float]
+    timeframe: Optional[Timeframe]
+    offset_in_seconds: float
+    running: bool
+    cancelled: bool
+
+    def __init__(
+        self,
+        name: str,
+        callback: Callable[[], Awaitable[None]],
+        interval_in_seconds: Optional[float],
+        timeframe: Optional[Timeframe],
+        offset_in_seconds: float,
+    ) -> None:
+        self.name = name
+        self.callback = callback
+        self.interval_in_seconds = interval_in_seconds
+        self.timeframe = timeframe
+        self.offset_in_seconds = offset_in_seconds
+        self.running = False
+        self.cancelled = False
+
+        self.runs = 0
+        self.skipped = 0
+        self.last_run_time = 0.0
+        self.max_run_time = 0.0
+        self.last_lateness = 0.0
+        self.max_lateness = 0.0
+
+    def next_deadline(self, after: float) -> float:
+        """First deadline strictly after the given epoch time in seconds"""
+        base = after - self.offset_in_seconds
+        if self.timeframe is not None:
+            base_in_ms = int(base * 1000)
+            start_time = get_candlestick_start_time(base_in_ms, self.timeframe)
+            deadline = (start_time + interval_in_ms(self.timeframe)) / 1000
+        else:
+            assert self.interval_in_seconds is not None
+            deadline = (base // self.interval_in_seconds + 1) * self.interval_in_seconds
+        return deadline + self.offset_in_seconds
+
+    def stats(self) -> dict:
+        return {
+            "runs": self.runs,
+            "skipped": self.skipped,
+            "last_run_time": round(self.last_run_time, 3),
+            "max_run_time": round(self.max_run_time, 3),
+            "last_lateness": round(self.last_lateness, 3),
+            "max_lateness": round(self.max_lateness, 3),
+        }
+
+
+class TimerService:
+    """Runs every periodic job of the bot from one heap of absolute deadlines
+
+    Deadlines are multiples of the interval since the epoch, or candle
+    boundaries, so they never drift with run times. A job still running at its
+    next deadline skips that run instead of queueing it
+    """
+
+    heap: list[tuple[float, int, TimerJob]]
+    jobs: dict[str, TimerJob]
+    task: Optional[asyncio.Task]
+
+    def __init__(self) -> None:
+        self.heap = []
+        self.jobs = {}
+        self.sequence = itertools.count()
+        self.task = None
+        self.wakeup: Optional[asyncio.Event] = None
+        ee.on(ETelegramEvent.STATS, self.stats_requested)
+
+    def schedule(
+        self,
+        name: str,
+        callback: Callable[[], Awaitable[None]],
+        interval_in_seconds: Optional[float] = None,
+        timeframe: Optional[Timeframe] = None,
+        offset_in_seconds: float = 0,
+    ) -> TimerJob:
+        """Run callback every interval_in_seconds, or at every candle open of
+        timeframe, shifted by offset_in_seconds. Must be called on the loop
+        """
+        assert (interval_in_seconds is None) != (timeframe is None)
+        job = TimerJob(
+            name, callback, interval_in_seconds, timeframe, offset_in_seconds
+        )
+        self.cancel(name)
+        self.jobs[name] = job
+        self.push(job, job.next_deadline(time.time()))
+
+        if self.task is None:
+            self.wakeup = asyncio.Event()
+            self.task = asyncio.create_task(self.run())
+        else:
+            assert self.wakeup is not None
+            # The new deadline may come before the one being waited for
+            self.wakeup.set()
+        return job
+
+    def cancel(self, name: str) -> None:
+        job = self.jobs.pop(name, None)
+        if job is not None:
+            # Dropped from the heap when its deadline comes up
+            job.cancelled = True
+
+    def push(self, job: TimerJob, deadline: float) -> None:
+        heapq.heappush(self.heap, (deadline, next(self.sequence), job))
+
+    async def run(self) -> None:
+        assert self.wakeup is not None
+        while True:
+            self.wakeup.clear()
+            if not len(self.heap):
+                await self.wakeup.wait()
+                continue
+            deadline, _, job = self.heap[0]
+            delay = deadline - time.time()
+            if delay > 0:
+                try:
+                    await asyncio.wait_for(self.wakeup.wait(), delay)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            heapq.heappop(self.heap)
+            if job.cancelled:
+                continue
+            if job.running:
+                job.skipped += 1
+            else:
+                job.running = True
+                asyncio.create_task(self.execute(job, deadline))
+            # Deadlines missed while the loop was busy are skipped, not made up
+            self.push(job, job.next_deadline(max(deadline, time.time())))
+
+    async def execute(self, job: TimerJob, deadline: float) -> None:
+        started_at = time.time()
+        job.last_lateness = started_at - deadline
+        job.max_lateness = max(job.max_lateness, job.last_lateness)
+        try:
+            await job.callback()
+        except Exception as ex:
+            logger.error(f"Timer job {job.name} failed: {ex}")
+        finally:
+            job.running = False
+            job.runs += 1
+            job.last_run_time = time.time() - started_at
+            job.max_run_time = max(job.max_run_time, job.last_run_time)
+
+    def stats_requested(self, chat_id: int) -> None:
+        msg = "⏱ TIMER STATS\n==========================\n"
+        for name, job in self.jobs.items():
+            stats = job.stats()
+            msg += (
+                f"{name:<15}: runs {stats['runs']}, skipped {stats['skipped']}\n"
+                f"{'  run time':<15}: last {stats['last_run_time']}, "
+                f"max {stats['max_run_time']}\n"
+                f"{'  lateness':<15}: last {stats['last_lateness']}, "
+                f"max {stats['max_lateness']}\n"
+            )
+        msg += "==========================\n"
+        telegram_bot.send_message(chat_id=chat_id, message=msg)
+
+
+timer_service = TimerService()
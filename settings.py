@@ -11,3 +11,17 @@ API_KEY = os.getenv("API_KEY")
 SECRET_KEY = os.getenv("SECRET_KEY")
 
 DATABASE_URI = f"sqlite:///{BASE_DIR}/data/data.sqlite3"
+KLINE_CACHE_PATH = f"{BASE_DIR}/data/klines.sqlite3"
+PROFILE_DIR = f"{BASE_DIR}/data/profiles"
+
+# The metrics endpoint only listens locally unless told otherwise
+METRICS_HOST = os.getenv("METRICS_HOST", "127.0.0.1")
+METRICS_PORT = int(os.getenv("METRICS_PORT", "9464"))
+
+# Worker processes splitting the (exchange, symbol) pairs between them, 1 runs
+# everything in a single process
+SHARD_COUNT = int(os.getenv("SHARD_COUNT", "1"))
+
+# Name of the shared memory the live volume series are exported under, unset
+# to not export them. Shards of a sharded run append their number to it
+SERIES_EXPORT_NAME = os.getenv("SERIES_EXPORT_NAME")
@@ -0,0 +1,6 @@
+"""Shared set-up of the unit tests, run from the repository root with
+python -m pytest
+"""
+# The exchange and the Telegram bot import each other, modules.exchange has to
+# come first as it does in main.py
+import modules.exchange  # noqa: F401
@@ -0,0 +1,104 @@
+import random
+
+from modules.store.alerter import Alerter
+from modules.store.main import Store
+from modules.store.volume_series import VolumeSeries
+from typings.alert import IAlert
+
+SERIES_KEY = ("binance", "BTCUSDT", "1m")
+
+
+def gen_alerts(rng: random.Random, count: int) -> dict[str, IAlert]:
+    alerts: dict[str, IAlert] = {}
+    for i in range(count):
+        key = f"alert_{i}"
+        alerts[key] = {
+            "key": key,
+            "exchange": SERIES_KEY[0],
+            "symbol": SERIES_KEY[1],
+            "timeframe": SERIES_KEY[2],
+            "candle_len": rng.randint(1, 1200),
+            "delta": rng.randint(0, 300),
+        }
+    return alerts
+
+
+def gen_series(rng: random.Random, length: int, high: int) -> VolumeSeries:
+    series = VolumeSeries(SERIES_KEY[2])
+    for i in range(length):
+        series.update(i * series.interval, rng.randint(0, high))
+    # Late updates of candles the windows were already summed over
+    for _ in range(10):
+        open_time, _ = series.candle(rng.randrange(len(series)))
+        series.update(open_time, rng.randint(0, high))
+    # Spikes on the two candles evaluated, so that some of the alerts fire
+    for offset in (0, 1):
+        open_time, _ = series.candle(offset)
+        series.update(open_time, rng.randint(0, high * 3))
+    return series
+
+
+def scalar_fired(
+    alerter: Alerter, alerts: dict[str, IAlert], series: VolumeSeries, offset: int
+) -> list[tuple[str, int, int, int]]:
+    """What Alerter.evaluate triggers, one alert at a time"""
+    fired: list[tuple[str, int, int, int]] = []
+
+    def trigger(a, volumes, window_sum, count, threshold, offset=0):
+        fired.append((a["key"], window_sum, count, threshold))
+
+    alerter.trigger = trigger  # type: ignore
+    for a in alerts.values():
+        alerter.evaluate(a, series, offset)
+    return fired
+
+
+def batch_fired(
+    alerter: Alerter, series: VolumeSeries, offset: int
+) -> list[tuple[str, int, int, int]]:
+    return [
+        (a["key"], window_sum, count, threshold)
+        for a, window_sum, count, threshold in alerter.batch_evaluator.evaluate(
+            SERIES_KEY, series, offset
+        )
+    ]
+
+
+def check_equivalence(seed: int, length: int, high: int) -> None:
+    rng = random.Random(seed)
+    store = Store()
+    alerts = gen_alerts(rng, 200)
+    store.series_alerts[SERIES_KEY] = alerts
+    alerter = Alerter(store)
+    series = gen_series(rng, length, high)
+
+    for offset in (0, 1):
+        expected = scalar_fired(alerter, alerts, series, offset)
+        assert batch_fired(alerter, series, offset) == expected
+
+
+def test_batch_matches_scalar_evaluation():
+    for seed in range(20):
+        check_equivalence(seed, length=1500, high=10**6)
+
+
+def test_batch_matches_scalar_on_a_short_history():
+    for seed in range(20):
+        check_equivalence(seed, length=random.Random(seed).randint(2, 30), high=100)
+
+
+def test_batch_matches_scalar_past_the_int64_range():
+    # Window sums times (100 + delta) overflow int64 here
+    for seed in range(5):
+        check_equivalence(seed, length=1500, high=10**15)
+
+
+def test_no_alerts_fire_without_a_window():
+    store = Store()
+    store.series_alerts[SERIES_KEY] = gen_alerts(random.Random(0), 10)
+    alerter = Alerter(store)
+    series = VolumeSeries(SERIES_KEY[2])
+    series.update(0, 100)
+
+    assert batch_fired(alerter, series, 0) == []
+    assert scalar_fired(alerter, store.series_alerts[SERIES_KEY], series, 0) == []
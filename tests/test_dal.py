@@ -0,0 +1,174 @@
+from functools import partial
+
+import pytest
+from sqlalchemy.engine import Engine
+from sqlalchemy.pool import StaticPool
+from sqlmodel import Session, SQLModel, create_engine, select
+
+from models.dal import (
+    PendingEvent,
+    SubscriptionWrite,
+    SubscriptionWriter,
+    subscribe_alert,
+    unsubscribe_alert,
+)
+from models.main import Alert, User, UserAlertLink
+from typings.alert import IAlert
+from typings.enums import UserRole
+from utils.event_emitter import EStoreUpdater
+
+ALERT: IAlert = {
+    "key": "binance_BTCUSDT_1m_20_50",
+    "exchange": "binance",
+    "symbol": "BTCUSDT",
+    "timeframe": "1m",
+    "candle_len": 20,
+    "delta": 50,
+}
+
+
+@pytest.fixture
+def engine() -> Engine:
+    # One in-memory database shared by every session of a test
+    engine = create_engine(
+        "sqlite://",
+        connect_args={"check_same_thread": False},
+        poolclass=StaticPool,
+    )
+    SQLModel.metadata.create_all(engine)
+    with Session(engine) as session:
+        session.add(User(id=1, username="alice", role=UserRole.User))
+        session.add(User(id=2, username="bob", role=UserRole.User))
+        session.commit()
+    return engine
+
+
+def write(engine: Engine, change: SubscriptionWrite) -> tuple[str, list[str]]:
+    """Apply a change the way SubscriptionWriter does, reply and event names"""
+    events: list[PendingEvent] = []
+    with Session(engine, expire_on_commit=False) as session:
+        with session.no_autoflush:
+            reply = change(session, events)
+        session.commit()
+    return reply, [event for event, _ in events]
+
+
+def subscriptions(engine: Engine) -> list[tuple[int, str]]:
+    with Session(engine) as session:
+        rows = session.exec(
+            select(UserAlertLink.user_id, Alert.key).where(
+                UserAlertLink.alert_id == Alert.id
+            )
+        ).all()
+    return sorted((user_id, key) for user_id, key in rows)
+
+
+def alert_keys(engine: Engine) -> list[str]:
+    with Session(engine) as session:
+        return [alert.key for alert in session.exec(select(Alert)).all()]
+
+
+def test_subscribe_creates_the_alert(engine: Engine):
+    reply, events = write(engine, partial(subscribe_alert, 1, ALERT))
+
+    assert reply == f"Successfully subscribed to alert {ALERT['key']}"
+    assert events == [
+        EStoreUpdater.ON_ADD_STORE_ALERT,
+        EStoreUpdater.ON_ADD_STORE_DATA,
+    ]
+    assert subscriptions(engine) == [(1, ALERT["key"])]
+
+
+def test_subscribe_to_an_existing_alert(engine: Engine):
+    write(engine, partial(subscribe_alert, 1, ALERT))
+
+    reply, events = write(engine, partial(subscribe_alert, 2, ALERT))
+
+    assert reply == f"Successfully subscribed to alert {ALERT['key']}"
+    assert events == []
+    assert alert_keys(engine) == [ALERT["key"]]
+    assert subscriptions(engine) == [(1, ALERT["key"]), (2, ALERT["key"])]
+
+
+def test_subscribe_twice(engine: Engine):
+    write(engine, partial(subscribe_alert, 1, ALERT))
+
+    reply, events = write(engine, partial(subscribe_alert, 1, ALERT))
+
+    assert reply == f"Already subscribed to alert {ALERT['key']}"
+    assert events == []
+    assert subscriptions(engine) == [(1, ALERT["key"])]
+
+
+def test_subscribe_of_an_unknown_user_creates_nothing(engine: Engine):
+    reply, events = write(engine, partial(subscribe_alert, 3, ALERT))
+
+    assert reply == "User 3 does not exist"
+    assert events == []
+    assert alert_keys(engine) == []
+
+
+def test_unsubscribe_keeps_an_alert_others_follow(engine: Engine):
+    write(engine, partial(subscribe_alert, 1, ALERT))
+    write(engine, partial(subscribe_alert, 2, ALERT))
+
+    reply, events = write(engine, partial(unsubscribe_alert, 1, ALERT["key"]))
+
+    assert reply == f"Successfully unsubscribed to alert {ALERT['key']}"
+    assert events == []
+    assert subscriptions(engine) == [(2, ALERT["key"])]
+
+
+def test_unsubscribe_of_the_last_user_removes_the_alert(engine: Engine):
+    write(engine, partial(subscribe_alert, 1, ALERT))
+
+    reply, events = write(engine, partial(unsubscribe_alert, 1, ALERT["key"]))
+
+    assert reply == f"Successfully unsubscribed to alert {ALERT['key']}"
+    assert events == [
+        EStoreUpdater.ON_REMOVE_STORE_ALERT,
+        EStoreUpdater.ON_REMOVE_STORE_DATA,
+    ]
+    assert alert_keys(engine) == []
+    assert subscriptions(engine) == []
+
+
+def test_unsubscribe_errors(engine: Engine):
+    write(engine, partial(subscribe_alert, 1, ALERT))
+
+    assert write(engine, partial(unsubscribe_alert, 1, "missing")) == (
+        "Alert missing does not exist",
+        [],
+    )
+    assert write(engine, partial(unsubscribe_alert, 3, ALERT["key"])) == (
+        "User 3 does not exist",
+        [],
+    )
+    assert write(engine, partial(unsubscribe_alert, 2, ALERT["key"])) == (
+        f"Not subscribed to alert {ALERT['key']}",
+        [],
+    )
+    assert subscriptions(engine) == [(1, ALERT["key"])]
+
+
+def test_writer_batches_and_counts_the_links(engine: Engine):
+    writer = SubscriptionWriter(engine)
+    writer.count_links()
+
+    # Batched together or not, the later writes find the alert the first created
+    futures = [
+        writer.subscribe(1, ALERT),
+        writer.subscribe(2, ALERT),
+        writer.subscribe(2, ALERT),
+        writer.unsubscribe(1, ALERT["key"]),
+    ]
+    replies = [future.result(timeout=5) for future in futures]
+
+    assert replies == [
+        f"Successfully subscribed to alert {ALERT['key']}",
+        f"Successfully subscribed to alert {ALERT['key']}",
+        f"Already subscribed to alert {ALERT['key']}",
+        f"Successfully unsubscribed to alert {ALERT['key']}",
+    ]
+    assert writer.links == 1
+    assert subscriptions(engine) == [(2, ALERT["key"])]
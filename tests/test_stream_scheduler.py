@@ -0,0 +1,85 @@
+import asyncio
+from typing import Callable
+
+from modules.exchange.stream_scheduler import StreamScheduler
+
+
+class StreamCalls:
+    """Records the batches handed to the connections"""
+
+    def __init__(self) -> None:
+        self.calls: list[tuple[str, list[str]]] = []
+
+    async def add_streams(self, streams: list[str]) -> None:
+        self.calls.append(("add", streams))
+
+    async def remove_streams(self, streams: list[str]) -> None:
+        self.calls.append(("remove", streams))
+
+
+async def run_batch(
+    queue_operations: Callable[[StreamScheduler], None]
+) -> tuple[StreamScheduler, StreamCalls]:
+    """Queue operations before the scheduler runs, so they form one batch"""
+    calls = StreamCalls()
+    scheduler = StreamScheduler(calls.add_streams, calls.remove_streams)
+    queue_operations(scheduler)
+    task = asyncio.create_task(scheduler.run())
+    await asyncio.sleep(0)
+    task.cancel()
+    return scheduler, calls
+
+
+def test_add_then_remove_cancels_out():
+    def queue(scheduler: StreamScheduler) -> None:
+        scheduler.add("BTCUSDT", "1m")
+        scheduler.remove("BTCUSDT", "1m")
+
+    scheduler, calls = asyncio.run(run_batch(queue))
+
+    assert calls.calls == []
+    assert scheduler.cancelled == 2
+    assert scheduler.applied == 0
+    assert scheduler.pending == 0
+
+
+def test_remove_then_add_cancels_out():
+    def queue(scheduler: StreamScheduler) -> None:
+        scheduler.remove("BTCUSDT", "1m")
+        scheduler.add("BTCUSDT", "1m")
+
+    scheduler, calls = asyncio.run(run_batch(queue))
+
+    assert calls.calls == []
+    assert scheduler.cancelled == 2
+
+
+def test_other_streams_are_applied_removals_first():
+    def queue(scheduler: StreamScheduler) -> None:
+        scheduler.add("BTCUSDT", "1m")
+        scheduler.add("ETHUSDT", "5m")
+        scheduler.remove("BTCUSDT", "1m")
+        scheduler.remove("BNBUSDT", "1h")
+        # Queued twice, applied once
+        scheduler.add("ETHUSDT", "5m")
+
+    scheduler, calls = asyncio.run(run_batch(queue))
+
+    assert calls.calls == [
+        ("remove", ["bnbusdt@kline_1h"]),
+        ("add", ["ethusdt@kline_5m"]),
+    ]
+    assert scheduler.cancelled == 2
+    assert scheduler.applied == 2
+
+
+def test_add_again_after_a_cancelled_pair():
+    def queue(scheduler: StreamScheduler) -> None:
+        scheduler.add("BTCUSDT", "1m")
+        scheduler.remove("BTCUSDT", "1m")
+        scheduler.add("BTCUSDT", "1m")
+
+    scheduler, calls = asyncio.run(run_batch(queue))
+
+    assert calls.calls == [("add", ["btcusdt@kline_1m"])]
+    assert scheduler.cancelled == 2
@@ -0,0 +1,105 @@
+from modules.store.volume_series import VolumeSeries
+from typings.enums import Timeframe
+from utils.candlestick import interval_in_ms
+
+MINUTE = interval_in_ms(Timeframe.Min1)
+
+
+def series_of(volumes: list[int], timeframe: str = "1m") -> VolumeSeries:
+    series = VolumeSeries(timeframe)
+    for i, volume in enumerate(volumes):
+        series.update(i * series.interval, volume)
+    return series
+
+
+def test_window_sum_of_the_open_candle():
+    series = series_of([1, 2, 3, 4, 5])
+
+    # The open candle, 5, is left out of its own window
+    assert series.window_sum(2) == (7, 2)
+    assert series.window_sum(4) == (10, 4)
+    # Windows longer than the history hold what there is
+    assert series.window_sum(100) == (10, 4)
+
+
+def test_window_sum_before_an_older_candle():
+    series = series_of([1, 2, 3, 4, 5])
+
+    assert series.window_sum(2, offset=1) == (5, 2)
+    assert series.window_sum(10, offset=3) == (1, 1)
+    assert series.window_sum(10, offset=4) == (0, 0)
+
+
+def test_sum_since_counts_the_open_candle():
+    series = series_of([1, 2, 3, 4, 5])
+
+    assert series.sum_since(3 * MINUTE) == 9
+    assert series.sum_since(0) == 15
+    # Candles older than the buffer are not there to sum
+    assert series.sum_since(-10 * MINUTE) == 15
+    assert series.sum_since(4 * MINUTE) == 5
+    assert series.sum_since(5 * MINUTE) == 0
+
+
+def test_update_of_the_open_candle_replaces_its_volume():
+    series = series_of([1, 2, 3])
+
+    series.update(2 * MINUTE, 30)
+
+    assert len(series) == 3
+    assert series.latest() == (2 * MINUTE, 30)
+    assert series.window_sum(2) == (3, 2)
+
+
+def test_late_update_corrects_the_later_windows():
+    series = series_of([1, 2, 3, 4, 5])
+
+    series.update(1 * MINUTE, 20)
+
+    assert list(series) == [
+        (0, 1),
+        (MINUTE, 20),
+        (2 * MINUTE, 3),
+        (3 * MINUTE, 4),
+        (4 * MINUTE, 5),
+    ]
+    assert series.window_sum(4) == (28, 4)
+    assert series.window_sum(2, offset=1) == (23, 2)
+    assert series.sum_since(MINUTE) == 32
+
+
+def test_late_update_older_than_the_buffer_is_ignored():
+    series = series_of([1] * 15, "1w")
+    held = list(series)
+
+    series.update(0, 100)
+
+    assert list(series) == held
+    assert series.window_sum(100) == (len(series) - 1, len(series) - 1)
+
+
+def test_missed_candles_hold_no_volume():
+    series = series_of([1, 2])
+
+    series.update(5 * MINUTE, 6)
+
+    assert list(series)[1:] == [
+        (MINUTE, 2),
+        (2 * MINUTE, 0),
+        (3 * MINUTE, 0),
+        (4 * MINUTE, 0),
+        (5 * MINUTE, 6),
+    ]
+    assert series.window_sum(5) == (3, 5)
+
+
+def test_window_sum_after_the_buffer_wraps():
+    series = VolumeSeries("1w")
+    volumes = list(range(1, 3 * series.capacity + 2))
+    for i, volume in enumerate(volumes):
+        series.update(i * series.interval, volume)
+
+    assert len(series) == series.capacity
+    assert series.window_sum(3) == (sum(volumes[-4:-1]), 3)
+    assert series.window_sum(100) == (sum(volumes[-series.capacity : -1]), 10)
+    assert series.sum_since(0) == sum(volumes[-series.capacity :])
@@ -1,12 +1,16 @@
-from typing import TypedDict
+from typing import TypedDict, Union
 
 from typings.enums import Exchange, Timeframe
 
 
 class IAlert(TypedDict):
     key: str
-    exchange: Exchange
+    exchange: Union[str, Exchange]
     symbol: str
-    timeframe: Timeframe
+    timeframe: Union[str, Timeframe]
     candle_len: int
     delta: int
+
+
+# (exchange, symbol, timeframe)
+SeriesKey = tuple[Union[str, Exchange], str, Union[str, Timeframe]]
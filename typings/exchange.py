@@ -1,8 +1,5 @@
-from decimal import Decimal
 from typing import TypedDict
 
-from typings.enums import Exchange, Timeframe
-
 
 class ICandlestickEventData(TypedDict):
     t: int  # Kline start time
@@ -31,9 +28,10 @@ class ICandlestickEvent(TypedDict):
     k: ICandlestickEventData
 
 
-class ISocketEmit(TypedDict):
-    exchange: Exchange
-    symbol: str
-    timeframe: Timeframe
-    open_time: int
-    volume: Decimal
+class ISymbolInfo(TypedDict):
+    symbol: str  # Uppercase symbol
+    status: str  # TRADING, BREAK, HALT...
+    base_asset: str
+    quote_asset: str
+    base_asset_precision: int
+    quote_asset_precision: int
@@ -0,0 +1,9 @@
+from typing import TypedDict
+
+from typings.enums import UserRole
+
+
+class IUser(TypedDict):
+    id: int
+    username: str
+    role: UserRole
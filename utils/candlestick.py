@@ -20,13 +20,21 @@ CANDLESTICK_INTERVAL_MAP = {
     Timeframe.Week1: 604800,
 }
 
+# Binance weeks open on Monday while the epoch fell on a Thursday
+CANDLESTICK_OFFSET_MAP = {
+    Timeframe.Week1: 345600,
+}
+
 
 def interval_in_ms(timeframe: Timeframe) -> int:
     return CANDLESTICK_INTERVAL_MAP[timeframe] * (10**3)
 
 
 def get_candlestick_start_time(timestamp_in_ms: int, interval: Timeframe) -> int:
-    return timestamp_in_ms - (timestamp_in_ms % interval_in_ms(interval))
+    offset_in_ms = CANDLESTICK_OFFSET_MAP.get(interval, 0) * (10**3)
+    return timestamp_in_ms - (
+        (timestamp_in_ms - offset_in_ms) % interval_in_ms(interval)
+    )
 
 
 def get_latest_incomplete_candlestick_start_time(interval: Timeframe) -> int:
@@ -1,10 +1,12 @@
-from pyee import AsyncIOEventEmitter
+import asyncio
+from typing import Callable, Optional
 
-ee = AsyncIOEventEmitter()
+from pyee import AsyncIOEventEmitter
 
+from constants import CANDLESTICK_QUEUE_SIZE
+from core.loggings import logger
 
-class EExchange:
-    CANDLESTICK_EVENT = "CANDLESTICK_EVENT"
+ee = AsyncIOEventEmitter()
 
 
 class EStoreUpdater:
@@ -12,7 +14,137 @@ class EStoreUpdater:
     ON_REMOVE_STORE_ALERT = "ON_REMOVE_STORE_ALERT"
     ON_ADD_STORE_DATA = "ON_ADD_STORE"
     ON_REMOVE_STORE_DATA = "ON_REMOVE_STORE"
+    ON_SERIES_READY = "ON_SERIES_READY"
 
 
 class ETelegramEvent:
     STATS = "STATS"
+    # (chat_id, exchange, symbol or None for a page of symbols, page)
+    SERIES_STATS = "SERIES_STATS"
+
+
+class CandlestickRecord:
+    """A kline update, one of the slots of CandlestickTopic
+
+    Slots are reused once the consumers of a batch return, consumers copy the
+    fields they keep
+    """
+
+    __slots__ = (
+        "exchange",
+        "symbol",
+        "timeframe",
+        "open_time",
+        "volume",
+        "event_time",
+    )
+
+    exchange: str
+    symbol: str
+    timeframe: str
+    open_time: int
+    # Fixed-point quote asset volume
+    volume: int
+    # Exchange time of the update in ms
+    event_time: int
+
+
+CandlestickConsumer = Callable[[list[CandlestickRecord]], None]
+
+
+class CandlestickTopic:
+    """Bounded queue of kline updates, drained in batches on the event loop
+
+    Publishing fills a preallocated record and the first update after a drain
+    schedules the next one, so consumers run once per loop iteration with all
+    updates since. A full queue drops updates and counts them. Only used from
+    the event loop thread
+    """
+
+    records: list[CandlestickRecord]
+    consumers: list[CandlestickConsumer]
+    loop: Optional[asyncio.AbstractEventLoop]
+
+    def __init__(self, capacity: int = CANDLESTICK_QUEUE_SIZE) -> None:
+        self.records = [CandlestickRecord() for _ in range(capacity)]
+        self.capacity = capacity
+        self.head = 0
+        self.size = 0
+        self.consumers = []
+        self.loop = None
+        self.scheduled = False
+
+        self.published = 0
+        self.dropped = 0
+        self.drains = 0
+        self.max_size = 0
+
+    def subscribe(self, consumer: CandlestickConsumer) -> None:
+        """Consumers get every batch in the order they subscribed"""
+        self.consumers.append(consumer)
+
+    def publish(
+        self,
+        exchange: str,
+        symbol: str,
+        timeframe: str,
+        open_time: int,
+        volume: int,
+        event_time: int,
+    ) -> bool:
+        if self.size == self.capacity:
+            self.dropped += 1
+            return False
+        record = self.records[(self.head + self.size) % self.capacity]
+        record.exchange = exchange
+        record.symbol = symbol
+        record.timeframe = timeframe
+        record.open_time = open_time
+        record.volume = volume
+        record.event_time = event_time
+        self.size += 1
+        self.published += 1
+        self.max_size = max(self.max_size, self.size)
+
+        if not self.scheduled:
+            if self.loop is None:
+                self.loop = asyncio.get_running_loop()
+            self.scheduled = True
+            self.loop.call_soon(self.drain)
+        return True
+
+    def drain(self) -> None:
+        # Updates published by the consumers go into the next batch
+        self.scheduled = False
+        count = self.size
+        batch = [self.records[(self.head + i) % self.capacity] for i in range(count)]
+        for consumer in self.consumers:
+            try:
+                consumer(batch)
+            except Exception as ex:
+                logger.error(f"Candlestick consumer {consumer} failed: {ex}")
+        self.head = (self.head + count) % self.capacity
+        self.size -= count
+        self.drains += 1
+
+    def stats(self) -> dict:
+        return {
+            "queued": self.size,
+            "max_queued": self.max_size,
+            "capacity": self.capacity,
+            "published": self.published,
+            "dropped": self.dropped,
+            "avg_batch": round(self.published / self.drains, 1) if self.drains else 0,
+        }
+
+
+class MarketDataBus:
+    """Market data kept apart from the control events on ee"""
+
+    candlesticks: CandlestickTopic
+
+    def __init__(self) -> None:
+        self.candlesticks = CandlestickTopic()
+
+
+market_data = MarketDataBus()
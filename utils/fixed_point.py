@@ -0,0 +1,20 @@
+from decimal import Decimal
+
+
+def to_fixed(value: str, digits: int) -> int:
+    """Parse a decimal string into an integer of `digits` decimal places"""
+    integer, _, fraction = value.partition(".")
+    return int(integer + fraction[:digits].ljust(digits, "0"))
+
+
+def from_fixed(value: int, digits: int) -> Decimal:
+    return Decimal(value).scaleb(-digits)
+
+
+def ceil_div(dividend: int, divisor: int) -> int:
+    return -(-dividend // divisor)
+
+
+def alert_volume(window_sum: int, count: int, delta: int) -> int:
+    """Smallest volume above the window average by at least delta percent"""
+    return ceil_div(window_sum * (100 + delta), 100 * count)